@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -7,7 +8,8 @@ def scheme():
 
 # this is an abstract class for a client. it can be used to ensure all functions are instantiated for a specific client, by using it as the base class
 class abstract_client():
-    def __init__(self,readvaluecallback = None, loggerRef = None, cmd_cb = None, event_cb = None):
+    # settings is a dict of {section: {option: value}} of the config sections that are not IOA mappings
+    def __init__(self,readvaluecallback = None, loggerRef = None, cmd_cb = None, event_cb = None, settings = None):
         raise Exception("abstract function should be overwritten")
 
     @staticmethod
@@ -32,6 +34,35 @@ class abstract_client():
     def cancel(id, value):
         raise Exception("abstract function should be overwritten")
 
-    def poll():
+    # poll the registered values, or only those in refs when given
+    def poll(self, refs = None):
         raise Exception("abstract function should be overwritten")
-    
\ No newline at end of file
+    
+
+    # async counterparts, used by the asyncio runtime. By default the blocking function is
+    # executed in self.executor, or in the default executor of the event loop if it has none,
+    # clients can overwrite them with a native async implementation
+    def run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(getattr(self, "executor", None), func, *args)
+
+    async def registerWriteValueAsync(self, id, value):
+        return await self.run_blocking(self.registerWriteValue, id, value)
+
+    async def registerReadValueAsync(self, id):
+        return await self.run_blocking(self.registerReadValue, id)
+
+    async def ReadValueAsync(self, id):
+        return await self.run_blocking(self.ReadValue, id)
+
+    async def operateAsync(self, id, value):
+        return await self.run_blocking(self.operate, id, value)
+
+    async def selectAsync(self, id, value):
+        return await self.run_blocking(self.select, id, value)
+
+    async def cancelAsync(self, id):
+        return await self.run_blocking(self.cancel, id)
+
+    async def pollAsync(self, refs = None):
+        return await self.run_blocking(self.poll, refs)
@@ -7,37 +7,92 @@ import time
 import sys
 import os
 import logging
+import threading
+import asyncio
+import concurrent.futures
 
 import libiec61850client
 import libmodbusmaster
 import libiec60870server
 import lib60870
 import configparser
-from urllib.parse import urlparse
+from dataref import parse_ref
+from poll_scheduler import PollScheduler
+from update_queue import UpdateQueue, UpdateDispatcher
+from deadband import parse_deadband
+from worker_process import WorkerClient
+from mapping_cache import load_mapping
+import metrics
 
 from gpio_control import load_gpio_controller
 
 hosts_info = {}
 async_msg = []
-async_rpt = {}
+
+# reported and polled values are handed off to the dispatcher thread, so callbacks return quickly
+# and the values are passed to the 104 server (and its deadband filter) in batches
+# the queue holds at least a key per mapped reference, or update_queue_size of the [gateway] section
+UPDATE_QUEUE_SIZE = 10000
+# interval to log the update queue statistics
+UPDATE_STATS_INTERVAL = 60.0
+update_queue = UpdateQueue(UPDATE_QUEUE_SIZE)
+# set while a read requested by the 104 master is executed, its value is passed on directly
+direct_update = threading.local()
+
+DISPATCH_SECONDS = metrics.histogram("gateway_dispatch_seconds", "Duration of passing a batch of updates to the 104 server")
+DISPATCH_UPDATES = metrics.counter("gateway_dispatch_updates_total", "Updates passed to the 104 server")
+metrics.gauge("gateway_update_queue_depth", "Updates waiting in the update queue", func=lambda: update_queue.depth())
+metrics.gauge("gateway_update_queue_dropped", "Updates dropped because the update queue was full", func=lambda: update_queue.dropped)
+metrics.gauge("gateway_update_queue_coalesced", "Updates replaced by a newer value while queued", func=lambda: update_queue.coalesced)
 
 # to keep teack of different client type instances
 supported_schemes = {}
 clients = {}
-
-# poll insterval
+# config sections that are not IOA mappings, passed to the clients as {section: {option: value}}
+client_settings = {}
+# run each client in its own worker process, set by multiprocess in the [gateway] section
+multiprocess = False
+# event loop of the asyncio runtime, set by runtime = asyncio in the [gateway] section
+event_loop = None
+# longest time a command from the 104 master waits for the downstream client in the asyncio runtime
+COMMAND_TIMEOUT = 10.0
+
+# default poll insterval, can be set per section or IOA in the [pollinterval] section of the config
 INTERVAL = 0.1
+# longest time the main loop sleeps, so pending registrations are still retried when nothing is polled
+MAX_SLEEP = 1.0
+
+# config sections that map IOA's to downstream references, and the 104 type they are served as
+IOA_SECTIONS = {
+  'measuredvaluescaled': lib60870.MeasuredValueScaled,
+  'singlepointinformation': lib60870.SinglePointInformation,
+  'doublepointinformation': lib60870.DoublePointInformation,
+  'singlepointcommand': lib60870.SingleCommand,
+  'doublepointcommand': lib60870.DoubleCommand,
+}
+
+# 104 types of commands, the other types are information sent to the 104 master
+COMMAND_TYPES = (lib60870.SingleCommand, lib60870.DoubleCommand)
+
+# compiled mappings of config files are cached here, relative to the config file
+MAPPING_CACHE_DIR = ".mapping_cache"
+
+# reverse index compiled from the config by build_ioa_index():
+#   ioa_index: normalized downstream reference -> (ioa, 104 type, value conversion)
+#   ioa_refs:  ioa -> downstream reference
+ioa_index = {}
+ioa_refs = {}
 
 def read_value(id):
-  _client = get_client(str(id))
+  _client = get_client(id)
   logger.debug("read value:" + str(id)  )
   return _client.ReadValue(id)
 
 
 def write_value(id, value):
-  _client = get_client(str(id))
+  _client = get_client(id)
   logger.debug("write value:" + str(value) + ", element:" + str(id) )
-  retValue = _client.registerWriteValue(str(id),str(value))
+  retValue = _client.registerWriteValue(id,str(value))
   if retValue > 0:
     return retValue, _client.ErrorCodes(retValue)
   if retValue == 0:
@@ -46,38 +101,57 @@ def write_value(id, value):
 
 
 def operate(id, value):
-  _client = get_client(str(id))
+  _client = get_client(id)
   if value == 1:
-    return _client.operate(str(id),"true")
+    return _client.operate(id,"true")
   else:
-    return _client.operate(str(id),"false")
+    return _client.operate(id,"false")
 
 
 def select(id, value):
-  _client = get_client(str(id))
+  _client = get_client(id)
   logger.debug("select:" + str(id)  )
   if value == 1:
-    return _client.select(str(id),"true")
+    return _client.select(id,"true")
   else:
-    return _client.select(str(id),"false")
+    return _client.select(id,"false")
 
 
 def cancel(id):
-  _client = get_client(str(id))
+  _client = get_client(id)
   logger.debug("cancel:" + str(id)  )
-  return _client.cancel(str(id))
+  return _client.cancel(id)
+
+
+async def operate_async(id, value):
+  _client = get_client(id)
+  if value == 1:
+    return await _client.operateAsync(id,"true")
+  else:
+    return await _client.operateAsync(id,"false")
+
+
+async def select_async(id, value):
+  _client = get_client(id)
+  logger.debug("select:" + str(id)  )
+  if value == 1:
+    return await _client.selectAsync(id,"true")
+  else:
+    return await _client.selectAsync(id,"false")
 
 
 # datapoints that could not be registered (usually because the downstream client
 # failed to connect during init). We'll retry registration periodically.
 PENDING_REGISTRATION_RETRY_SEC = 10.0
 pending_registrations = {}  # id -> last attempt timestamp (time.time())
+metrics.gauge("gateway_pending_registrations", "Datapoints that could not be registered yet", func=lambda: len(pending_registrations))
 
 
 def register_datapoint(id):
   global pending_registrations
 
-  _client = get_client(str(id))
+  id = parse_ref(id)
+  _client = get_client(id)
   logger.debug("register datapoint: %s" % str(id))
 
   if _client is None:
@@ -85,7 +159,7 @@ def register_datapoint(id):
     pending_registrations[id] = time.time()
     return -1
 
-  ret = _client.registerReadValue(str(id))
+  ret = _client.registerReadValue(id)
   if ret != 0:
     logger.debug("could not register datapoint %s (ret=%s), will retry" % (id, ret))
     pending_registrations[id] = time.time()
@@ -126,68 +200,279 @@ def register_datapoint_finished():
 
 
 
+# value conversions applied before a downstream value is passed to the 104 server
+def convert_none(data):
+  return data['value']
+
+
+def convert_dbpos(data): # invert mapping of DbPos
+  if data.get('reftype') == 'DA' and data.get('type') == 'bit-string':
+    if data['value'] == '2':
+      return '1'
+    elif data['value'] == '1':
+      return '2'
+  return data['value']
+
+
+# compile the IOA mapping of the config into the reverse index used by readvaluecallback
+# this should be called again whenever the config is changed
+def build_ioa_index(_mapping):
+  global ioa_index
+  global ioa_refs
+
+  index = {}
+  refs = {}
+  for item_type in IOA_SECTIONS:
+    for ioa, ref in _mapping['ioas'].get(item_type, []):
+      refs[ioa] = ref
+      key = ref.normalized
+      if key in index:
+        logger.error("reference %s is mapped to IOA %i and %i, only the first is updated" % (ref, index[key][0], ioa))
+        continue
+
+      convert = convert_none
+      if ref.scheme == libiec61850client.scheme():
+        convert = convert_dbpos
+
+      index[key] = (ioa, IOA_SECTIONS[item_type], convert)
+
+  ioa_index = index
+  ioa_refs = refs
+  logger.info("IOA index compiled with %i references" % len(ioa_index))
+
+
+# load the compiled mapping of the config file (compiling it when the file changed), and build
+# the IOA index from it. returns the settings sections as config, and the mapping
+def load_config(filename):
+  cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), MAPPING_CACHE_DIR)
+  _mapping = load_mapping(filename, IOA_SECTIONS, cache_dir)
+
+  _config = configparser.ConfigParser()
+  _config.optionxform = str # to retain case sentistivy
+  _config.read_dict(_mapping['settings'])
+  build_ioa_index(_mapping)
+  return _config, _mapping
+
+
+# look up the IOA entry for a key reported by a client
+def find_ioa(key):
+  entry = ioa_index.get(key)
+  if entry == None:
+    entry = ioa_index.get(parse_ref(key).normalized)
+    if entry != None:
+      ioa_index[key] = entry # remember the key as reported, so the next lookup is direct
+  return entry
+
+
 # callbacks from libiec61850client
-# called by client.poll
+# called by client.poll, client.ReadValue and client.registerWriteValue
 def readvaluecallback(key,data):
-  global iec104_server
-  global config
   logger.debug("callback: %s - %s" % (key,data))
-  for item_type in config:
-    for ioa in config[item_type]:
-      if config[item_type][ioa] == key:
-          
-        uri_ref = urlparse(key)
-        if uri_ref.scheme == libiec61850client.scheme(): # invert mapping of DbPos
-          if data['reftype'] == 'DA' and data['type'] == 'bit-string':
-            if data['value'] == '2':
-              data['value'] = '1'
-            elif data['value'] == '1':
-              data['value'] = '2'
-
-        if iec104_server.update_ioa(int(ioa), data['value']) != 0:
-          logger.debug("could not update IOA:" + str(ioa) + " with value:" + str(data['value']) + " for key:" + str(key)  )
-        return
-  logger.debug("could not find IOA for key:" + str(key)  )
+  if getattr(direct_update, 'active', False):
+    dispatch_updates([(key, data)])
+    return
+
+  # status points are never dropped, a lost change is not corrected by a later measured value
+  entry = find_ioa(key)
+  keep = entry != None and entry[1] != lib60870.MeasuredValueScaled
+  # copy the value, as the client keeps updating its model after returning
+  update_queue.put(key, dict(data), keep)
+
+
+# deadband of an IOA, as configured in the [deadband] section, as (mode, threshold) or None:
+#   measuredvaluescaled = abs:5    applies to all IOA's of a section
+#   100 = pct:2                    applies to a single IOA, modes are abs, pct, int and none
+def get_deadband(_config, item_type, ioa):
+  if not 'deadband' in _config:
+    return None
+  section = _config['deadband']
+  if ioa in section:
+    return parse_deadband(section[ioa])
+  if item_type in section:
+    return parse_deadband(section[item_type])
+  return None
+
+
+# deadbands only apply to the analog values of the 104 server, measuredvaluescaled is the only analog
+# type it serves. Single and double points are sent on every change
+def check_deadbands(_config, _mapping):
+  if not 'deadband' in _config:
+    return
+  analog = set(str(ioa) for ioa, ref in _mapping['ioas'].get('measuredvaluescaled', []))
+  for option in _config['deadband']:
+    if option != 'measuredvaluescaled' and option not in analog:
+      logger.warning("deadband %s is ignored, deadbands only apply to measuredvaluescaled IOA's" % option)
+
+
+# poll interval of a datapoint, as configured in the [pollinterval] section:
+#   default = 0.1              applies to all datapoints
+#   measuredvaluescaled = 5    applies to all datapoints of a section
+#   100 = 1                    applies to a single IOA
+def get_poll_interval(_config, item_type, ioa):
+  if not 'pollinterval' in _config:
+    return INTERVAL
+  section = _config['pollinterval']
+  if ioa in section:
+    return section.getfloat(ioa)
+  if item_type in section:
+    return section.getfloat(item_type)
+  return section.getfloat('default', INTERVAL)
+
+
+# add a datapoint to the poll group of its interval, an invalid interval is logged and the default is used
+def schedule_datapoint(scheduler, _config, ref, item_type, ioa):
+  try:
+    scheduler.add(ref, get_poll_interval(_config, item_type, ioa))
+  except ValueError as e:
+    logger.error("invalid poll interval for IOA %s: %s, polled every %.3f seconds" % (ioa, str(e), INTERVAL))
+    scheduler.add(ref, INTERVAL)
+
+
+# poll the datapoints that are due, grouped per client
+def poll_datapoints(refs):
+  polled = {}
+  for ref in refs:
+    _client = clients.get(ref.scheme)
+    if _client == None:
+      continue # not initialised yet, registration is still pending
+    if not _client in polled:
+      polled[_client] = []
+    polled[_client].append(ref)
+
+  for _client in polled:
+    _client.poll(polled[_client])
+
+
+# same as poll_datapoints, the clients are polled concurrently on the event loop
+async def poll_datapoints_async(refs):
+  polled = {}
+  for ref in refs:
+    _client = clients.get(ref.scheme)
+    if _client == None:
+      continue # not initialised yet, registration is still pending
+    if not _client in polled:
+      polled[_client] = []
+    polled[_client].append(ref)
+
+  results = await asyncio.gather(*[_client.pollAsync(polled[_client]) for _client in polled], return_exceptions=True)
+  for result in results:
+    if isinstance(result, Exception):
+      logger.error("exception during poll: %s" % result)
 
 
 # callback commandtermination
 def cmdTerm_cb(msg):
   async_msg.append(msg)
 
-# callback report
+# called by the reader thread of a worker process, with (normalized reference, converted value) pairs
+def dispatch_values(batch):
+  global iec104_server
+  start = time.monotonic()
+  updates = []
+  for key, value in batch:
+    entry = ioa_index.get(key)
+    if entry != None:
+      updates.append((entry[0], value))
+
+  iec104_server.update_ioas(updates)
+  DISPATCH_UPDATES.inc(amount=len(updates))
+  DISPATCH_SECONDS.observe(value=time.monotonic() - start)
+
+
+# the (normalized reference, value conversion) of each datapoint of a scheme, for a worker process
+def worker_entries(scheme):
+  entries = []
+  ioas = {}
+  for key in list(ioa_index):
+    ioa, ioa_type, convert = ioa_index[key]
+    if parse_ref(key).scheme != scheme or ioa in ioas or key != parse_ref(key).normalized:
+      continue # other scheme, or an alias of a reference as reported by a client
+    ioas[ioa] = True
+    entries.append((key, convert))
+  return entries
+
+
+# callback report, called from the receive thread of the client
 def Rpt_cb(key, value):
-  async_rpt[key] = value
-  readvaluecallback(key,value)
+  readvaluecallback(key, value)
+
+
+# called by the update dispatcher with the latest value of each key
+def dispatch_updates(batch):
+  global iec104_server
+  start = time.monotonic()
+  updates = []
+  for key, data in batch:
+    entry = find_ioa(key)
+    if entry == None:
+      logger.debug("could not find IOA for key:" + str(key)  )
+      continue
+    ioa, ioa_type, convert = entry
+    updates.append((ioa, convert(data)))
+
+  iec104_server.update_ioas(updates)
+  DISPATCH_UPDATES.inc(amount=len(updates))
+  DISPATCH_SECONDS.observe(value=time.monotonic() - start)
 
 
 def read_60870_callback(ioa, ioa_data, iec104server):
-  global config
   logger.debug("read callback called from lib60870")
-  for item_type in config:
-    if ioa in config[item_type]:
-      return read_value(config[item_type][ioa])
+  if ioa in ioa_refs:
+    direct_update.active = True
+    try:
+      return read_value(ioa_refs[ioa])
+    finally:
+      direct_update.active = False
 
   return -1
 
 
 def command_60870_callback(ioa, ioa_data, iec104server, select_value):
   logger.debug("operate callback called from lib60870")
-  for item_type in config:
-    if ioa in config[item_type]:
-      if select_value == True:
-        return select(config[item_type][ioa],  ioa_data['data'])
-      else:
-        return operate(config[item_type][ioa],  ioa_data['data'])
+  if ioa in ioa_refs and event_loop != None:
+    # execute the command as task on the event loop, and wait for the result in the thread of lib60870
+    if select_value == True:
+      command = select_async(ioa_refs[ioa],  ioa_data['data'])
+    else:
+      command = operate_async(ioa_refs[ioa],  ioa_data['data'])
+    future = asyncio.run_coroutine_threadsafe(command, event_loop)
+    try:
+      return future.result(COMMAND_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+      if future.cancel():
+        logger.error("command for IOA %i not finished within %.1f seconds, cancelled" % (ioa, COMMAND_TIMEOUT))
+        return -1
+      # the command finished or could not be cancelled anymore
+      if future.done() and not future.cancelled() and future.exception() == None:
+        return future.result()
+      logger.error("command for IOA %i not finished within %.1f seconds, the outcome is unknown" % (ioa, COMMAND_TIMEOUT))
+      return -1
+
+  if ioa in ioa_refs:
+    if select_value == True:
+      return select(ioa_refs[ioa],  ioa_data['data'])
+    else:
+      return operate(ioa_refs[ioa],  ioa_data['data'])
 
   return -1
 
 
+# stop the clients, a worker process removes its shared value table when it stops
+def stop_clients():
+  for scheme, _client in list(clients.items()):
+    if hasattr(_client, "stop_worker"):
+      try:
+        _client.stop_worker()
+      except Exception:
+        logger.exception("could not stop client for scheme %s" % scheme)
+
+
 # returns a client for a certain type of communication such as iec61850 or modbus, based on the scheme definition in the uri
 def get_client(ref):
   global supported_schemes
   global clients
   global logger
-  uri_ref = urlparse(ref)
+  uri_ref = parse_ref(ref)
   # check if scheme exists
   if not uri_ref.scheme in supported_schemes:
     logger.error("incorrect scheme, %s is not supported as client" % uri_ref.scheme)
@@ -204,7 +489,10 @@ def get_client(ref):
     return None
 
   # initialise the client
-  _client = init_func(readvaluecallback, logger, cmdTerm_cb, Rpt_cb)
+  if multiprocess:
+    _client = WorkerClient(init_func, worker_entries(uri_ref.scheme), dispatch_values, cmdTerm_cb, uri_ref.scheme, client_settings)
+  else:
+    _client = init_func(readvaluecallback, logger, cmdTerm_cb, Rpt_cb, settings=client_settings)
   if _client == None:
     logger.error("init function not succesfull for scheme %s" % uri_ref.scheme)
     return None
@@ -229,18 +517,79 @@ def register_scheme(scheme,_init):
 
 
 
+# tasks of the asyncio runtime
+async def poll_task(scheduler, gpio):
+  polls = set() # references to the running polls, so they are not garbage collected
+  while True:
+    delay = MAX_SLEEP
+    deadline = scheduler.next_deadline()
+    if deadline != None:
+      delay = min(max(deadline - time.monotonic(), 0.0), MAX_SLEEP)
+
+    gpio.set_low(0)
+    await asyncio.sleep(delay)
+    gpio.set_high(0)
+
+    # polls are not awaited, so a slow client does not delay the next deadlines
+    for interval, refs in scheduler.due():
+      task = asyncio.create_task(poll_datapoints_async(refs))
+      polls.add(task)
+      task.add_done_callback(polls.discard)
+      logger.debug("poll started for interval %.3f" % interval)
+
+
+async def retry_task():
+  loop = asyncio.get_running_loop()
+  while True:
+    await loop.run_in_executor(None, retry_pending_registrations)
+    await asyncio.sleep(MAX_SLEEP)
+
+
+async def dispatch_task():
+  loop = asyncio.get_running_loop()
+  while True:
+    batch = await loop.run_in_executor(None, update_queue.get_batch, 0.5)
+    if len(batch) == 0:
+      continue
+    try:
+      dispatch_updates(batch)
+    except Exception:
+      logger.exception("exception while dispatching %i updates" % len(batch))
+
+
+async def stats_task():
+  while True:
+    await asyncio.sleep(UPDATE_STATS_INTERVAL)
+    logger.info("update queue: %s" % update_queue.stats())
+
+
+async def run_async(scheduler, gpio):
+  global event_loop
+  event_loop = asyncio.get_running_loop()
+  await asyncio.gather(poll_task(scheduler, gpio), retry_task(), dispatch_task(), stats_task())
+
+
 if __name__ == '__main__':
   logger = logging.getLogger('gateway')
   logging.basicConfig(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
     level=logging.INFO)
 
-  config = configparser.ConfigParser()
-  config.optionxform = str # to retain case sentistivy
-
   if len(sys.argv) > 1:
-    config.read(sys.argv[1])
+    config, mapping = load_config(sys.argv[1])
   else:
-    config.read('config.local.ini')
+    config, mapping = load_config('config.local.ini')
+
+  multiprocess = config.getboolean('gateway', 'multiprocess', fallback=False)
+  if multiprocess:
+    logger.info("running clients in worker processes")
+  runtime = config.get('gateway', 'runtime', fallback='thread')
+  # a key per reference, as it is mapped and as it is reported (e.g. with the default port)
+  update_queue.maxsize = config.getint('gateway', 'update_queue_size', fallback=max(UPDATE_QUEUE_SIZE, 2 * len(ioa_refs)))
+  logger.info("update queue holds up to %i keys" % update_queue.maxsize)
+  client_settings = mapping['settings']
+
+  if 'metrics' in config:
+    metrics.start_server(config.get('metrics', 'address', fallback='127.0.0.1'), config.getint('metrics', 'port', fallback=9108))
 
 
   logger.info("started")
@@ -252,70 +601,72 @@ if __name__ == '__main__':
   iec104_server = libiec60870server.IEC60870_5_104_server()
   iec104_server.start()
 
-  #REGISTER ALL IOA's and associated IEC61850 datapoints
-  if 'measuredvaluescaled' in config:
-    for item in config['measuredvaluescaled']:
-      #create 104 data for GI
-      if iec104_server.add_ioa(int(item), lib60870.MeasuredValueScaled,0,read_60870_callback,True) == 0:
-        register_datapoint(config['measuredvaluescaled'][item])
-      else:
-        logger.error("duplicate IOA:" + item + ", IOA not added to list")
-        continue
+  scheduler = PollScheduler()
 
-  if 'singlepointinformation' in config:
-    for item in config['singlepointinformation']:
-      #create 104 data for GI
-      if iec104_server.add_ioa(int(item), lib60870.SinglePointInformation,0,read_60870_callback,True) == 0:
-        register_datapoint(config['singlepointinformation'][item])
-      else:
-        logger.error("duplicate IOA:" + item + ", IOA not added to list")
-        continue
+  if runtime != 'asyncio':
+    dispatcher = UpdateDispatcher(update_queue, dispatch_updates)
+    dispatcher.start()
 
-  if 'doublepointinformation' in config:
-    for item in config['doublepointinformation']:
-      #create 104 data for GI
-      if iec104_server.add_ioa(int(item), lib60870.DoublePointInformation,0,read_60870_callback,True) == 0:
-        register_datapoint(config['doublepointinformation'][item])
-      else:
-        logger.error("duplicate IOA:" + item + ", IOA not added to list")
-        continue
-    register_datapoint_finished()
-
-  if 'singlepointcommand' in config:
-    for item in config['singlepointcommand']:
-      #create 104 data for GI
-      if iec104_server.add_ioa(int(item), lib60870.SingleCommand,0,command_60870_callback,False) == 0:
-        logger.info("SingleCommand registered")
-      else:
-        logger.error("duplicate IOA:" + item + ", IOA not added to list")
-        continue
+  check_deadbands(config, mapping)
 
-  if 'doublepointcommand' in config:
-    for item in config['doublepointcommand']:
-      #create 104 data for GI
-      if iec104_server.add_ioa(int(item), lib60870.DoubleCommand,0,command_60870_callback,False) == 0:
-        logger.info("DoubleCommand registered")
-      else:
-        logger.error("duplicate IOA:" + item + ", IOA not added to list")
-        continue
+  #REGISTER ALL IOA's and associated IEC61850 datapoints
+  # the IOA's of the compiled type table are added to the 104 server at once
+  ioas = list(mapping['types'])
+  types = [mapping['types'][ioa] for ioa in ioas]
+  callbacks = [command_60870_callback if code in COMMAND_TYPES else read_60870_callback for code in types]
+  events = [code not in COMMAND_TYPES for code in types]
+  for item in iec104_server.add_ioas(ioas, types, callbacks, events):
+    logger.error("duplicate IOA:" + str(item) + ", IOA not added to list")
+  logger.info("%i IOA's added" % len(ioas))
+
+  for item_type in ('measuredvaluescaled', 'singlepointinformation', 'doublepointinformation'):
+    for item, ref in mapping['ioas'].get(item_type, []):
+      schedule_datapoint(scheduler, config, ref, item_type, str(item))
+      if item_type == 'measuredvaluescaled':
+        deadband = get_deadband(config, item_type, str(item))
+        if deadband != None:
+          iec104_server.set_deadband(item, *deadband)
+
+  # the datapoints are registered per IED, with the references grouped in the compiled mapping
+  for ied, items in mapping['ieds'].items():
+    for item, ref in items:
+      if mapping['types'][item] not in COMMAND_TYPES:
+        register_datapoint(ref)
+  register_datapoint_finished()
 
 
   gpio = load_gpio_controller()
-  while True:
-    gpio.set_low(0)
-    time.sleep(INTERVAL)
-    gpio.set_high(0)
-
-    retry_pending_registrations()
-
-    for _client in clients.values():
-      _client.poll()
-
-    logger.debug("values polled")
-    
-    for key in list(async_rpt):
-      val = async_rpt.pop(key)
-      logger.debug("%s updated via report" % key)
-
-  gpio.cleanup()
+  if runtime == 'asyncio':
+    logger.info("running the gateway on asyncio")
+    try:
+      asyncio.run(run_async(scheduler, gpio))
+    finally:
+      stop_clients()
+      gpio.cleanup()
+    sys.exit(0)
+
+  last_stats = time.monotonic()
+  try:
+    while True:
+      delay = MAX_SLEEP
+      deadline = scheduler.next_deadline()
+      if deadline != None:
+        delay = min(max(deadline - time.monotonic(), 0.0), MAX_SLEEP)
+
+      gpio.set_low(0)
+      time.sleep(delay)
+      gpio.set_high(0)
+
+      retry_pending_registrations()
+
+      for interval, refs in scheduler.due():
+        poll_datapoints(refs)
+        logger.debug("values polled for interval %.3f" % interval)
+
+      if time.monotonic() - last_stats > UPDATE_STATS_INTERVAL:
+        last_stats = time.monotonic()
+        logger.info("update queue: %s" % update_queue.stats())
+  finally:
+    stop_clients()
+    gpio.cleanup()
 
@@ -0,0 +1,142 @@
+import sys
+
+# names in the model (LD, LN, DO, DA, FC and type names) are interned, so each name is stored once
+intern = sys.intern
+
+
+def format_value(value, type):
+    """Format a typed value as the string that iec61850client.printValue returns for it."""
+    if isinstance(value, str):
+        return value
+    if type == "boolean":
+        return "%r" % value
+    if type == "float":
+        return "%f" % value
+    if type in ("unsigned", "utc-time", "generalized-time"):
+        return "%u" % value
+    return "%i" % value
+
+
+class Node:
+    """Base of the leaves of the model, that can be used as the dicts they replace.
+
+    node['value'] returns the value formatted as string, node.raw the typed value.
+    Keys that have no value (e.g. 'type' of a DA that was never read) are not 'in' the node.
+    """
+
+    __slots__ = ()
+    reftype = None
+    KEYS = ()
+
+    def __getitem__(self, key):
+        if key == 'reftype':
+            return self.reftype
+        if key == 'value':
+            return format_value(self.raw, self.type)
+        if key in self.KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'value':
+            self.raw = value
+        elif key in self.KEYS and key != 'reftype':
+            setattr(self, key, intern(value) if isinstance(value, str) else value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return [key for key in self.KEYS if key == 'reftype' or key == 'value' or getattr(self, key) is not None]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class DataAttribute(Node):
+    """A leaf DA: functional constraint, MMS type name and the typed value."""
+
+    __slots__ = ('FC', 'type', 'raw')
+    reftype = 'DA'
+    KEYS = ('reftype', 'FC', 'value', 'type')
+
+    def __init__(self, FC, value="UNKNOWN", type=None):
+        self.FC = intern(FC)
+        self.type = intern(type) if type is not None else None
+        self.raw = value
+
+    def set(self, value, type):
+        """Set the typed value and its MMS type name, as returned by iec61850client.typedValue."""
+        self.raw = value
+        self.type = intern(type)
+
+
+class DataSetMember(Node):
+    """A member of a dataset: the reference of the DA or DO, and its functional constraint."""
+
+    __slots__ = ('FC', 'raw')
+    reftype = 'DX'
+    type = 'reference'
+    KEYS = ('reftype', 'type', 'value', 'FC')
+
+    def __init__(self, FC, value):
+        self.FC = intern(FC)
+        self.raw = intern(value)
+
+    def keys(self):
+        return list(self.KEYS)
+
+
+def compact(model):
+    """Convert a model of nested dicts (e.g. loaded from a file) into the compact form, in place.
+
+    Names are interned and the dict leaves are replaced by DataAttribute and DataSetMember nodes.
+    """
+    result = {}
+    for name in model:
+        node = model[name]
+        if isinstance(node, Node) or not isinstance(node, dict):
+            result[intern(name)] = node
+        elif node.get('reftype') == 'DA':
+            result[intern(name)] = DataAttribute(node['FC'], node.get('value', "UNKNOWN"), node.get('type'))
+        elif node.get('reftype') == 'DX':
+            result[intern(name)] = DataSetMember(node['FC'], node['value'])
+        else:
+            result[intern(name)] = compact(node)
+    # replace the contents, so the order of the names is kept
+    model.clear()
+    model.update(result)
+    return model
+
+
+def plain(model):
+    """Return a copy of a compact model as nested dicts, e.g. to serialize it."""
+    result = {}
+    for name in model:
+        node = model[name]
+        if isinstance(node, Node):
+            result[name] = dict(node.items())
+        elif isinstance(node, dict):
+            result[name] = plain(node)
+        else:
+            result[name] = node
+    return result
@@ -0,0 +1,92 @@
+from urllib.parse import urlparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# default port per scheme, used when a reference does not specify one
+DEFAULT_PORTS = {
+    "iec61850": 102,
+    "modbus": 502,
+}
+
+# parsed references by uri string, so each uri is only parsed once
+_refs = {}
+
+
+class DataRef(str):
+    """A downstream datapoint reference, parsed once at registration.
+
+    e.g. iec61850://127.0.0.1:102/IED1_XCBRGenericIO/XCBR1.Pos.stVal
+      scheme     -> "iec61850"
+      host, port -> "127.0.0.1", 102 (default port of the scheme if omitted)
+      key        -> "127.0.0.1:102", the connection key used by the clients
+      path       -> "IED1_XCBRGenericIO/XCBR1.Pos.stVal", the object path without leading '/'
+      parts      -> ("IED1_XCBRGenericIO", "XCBR1.Pos.stVal")
+      normalized -> "iec61850://127.0.0.1:102/IED1_XCBRGenericIO/XCBR1.Pos.stVal"
+
+    It is a str holding the uri as configured, so it can be used as dict key and
+    passed to anything that expects the uri string.
+    """
+
+    def __new__(cls, uri):
+        uri = uri.strip()
+        self = str.__new__(cls, uri)
+        uri_ref = urlparse(uri)
+        self.scheme = uri_ref.scheme
+        self.host = uri_ref.hostname
+        try:
+            self.port = uri_ref.port
+        except ValueError:
+            logger.error("invalid port in reference: %s" % uri)
+            self.port = None
+        if self.port is None:
+            self.port = DEFAULT_PORTS.get(self.scheme)
+
+        self.key = None
+        self.normalized = uri
+        if self.host is not None and self.port is not None:
+            self.key = "%s:%i" % (self.host, self.port)
+            self.normalized = "%s://%s%s" % (self.scheme, self.key, uri_ref.path)
+
+        self.path = uri_ref.path[1:]
+        self.parts = tuple(self.path.split("/")) if self.path else ()
+        return self
+
+    def __reduce__(self):
+        # restore the parsed fields when unpickled, instead of parsing the uri again
+        return (restore_ref, (str(self), self.__dict__))
+
+
+# the parsed fields of a DataRef, and their types
+REF_FIELDS = {
+    "scheme": (str,),
+    "host": (str, type(None)),
+    "port": (int, type(None)),
+    "key": (str, type(None)),
+    "normalized": (str,),
+    "path": (str,),
+    "parts": (tuple,),
+}
+
+
+def restore_ref(uri, fields):
+    """Return a DataRef from its uri and parsed fields (as in its __dict__), without parsing the uri."""
+    data_ref = str.__new__(DataRef, uri)
+    data_ref.__dict__.update(fields)
+    return data_ref
+
+
+def register_ref(data_ref):
+    """Add an already parsed DataRef (e.g. restored) to the cache used by parse_ref."""
+    return _refs.setdefault(str(data_ref), data_ref)
+
+
+def parse_ref(ref):
+    """Return the DataRef for a uri, parsing it only the first time it is seen."""
+    if isinstance(ref, DataRef):
+        return ref
+    data_ref = _refs.get(ref)
+    if data_ref is None:
+        data_ref = DataRef(ref)
+        _refs[ref] = data_ref
+    return data_ref
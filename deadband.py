@@ -0,0 +1,96 @@
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# deadband modes
+DEADBAND_NONE = 0        # every change is transmitted
+DEADBAND_ABSOLUTE = 1    # transmit when |value - last transmitted| > threshold
+DEADBAND_PERCENT = 2     # transmit when |value - last transmitted| > threshold % of |last transmitted|
+DEADBAND_INTEGRATED = 3  # transmit when the integral of |received - last transmitted| over time (s) > threshold
+
+DEADBAND_MODES = {
+    "none": DEADBAND_NONE,
+    "abs": DEADBAND_ABSOLUTE,
+    "pct": DEADBAND_PERCENT,
+    "int": DEADBAND_INTEGRATED,
+}
+
+
+def parse_deadband(text):
+    """Parse a deadband setting like 'abs:0.5', 'pct:2' or 'int:10' into (mode, threshold)."""
+    mode, _, threshold = text.strip().partition(":")
+    if mode not in DEADBAND_MODES:
+        raise ValueError("unknown deadband mode '%s', expected one of %s" % (mode, ", ".join(DEADBAND_MODES)))
+    if DEADBAND_MODES[mode] == DEADBAND_NONE:
+        return DEADBAND_NONE, 0.0
+    return DEADBAND_MODES[mode], float(threshold)
+
+
+class DeadbandTable:
+    """Deadband state of IOA's, in arrays so a batch of updates is filtered in one vectorized pass."""
+
+    def __init__(self, size=256):
+        self.slots = {}  # ioa -> index in the arrays
+        self.last_sent = np.full(size, np.nan)
+        self.last_received = np.full(size, np.nan)
+        self.mode = np.zeros(size, dtype=np.int8)
+        self.threshold = np.zeros(size)
+        self.integral = np.zeros(size)
+        self.last_time = np.zeros(size)
+
+    def _grow(self):
+        size = len(self.mode) * 2
+        for name in ('last_sent', 'last_received'):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.full(size - len(arr), np.nan))))
+        for name in ('mode', 'threshold', 'integral', 'last_time'):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros(size - len(arr), dtype=arr.dtype))))
+
+    def add(self, ioa, mode=DEADBAND_NONE, threshold=0.0):
+        """Add an IOA, or change its deadband if it is already known."""
+        slot = self.slots.get(ioa)
+        if slot is None:
+            slot = len(self.slots)
+            if slot >= len(self.mode):
+                self._grow()
+            self.slots[ioa] = slot
+        self.mode[slot] = mode
+        self.threshold[slot] = threshold
+        self.integral[slot] = 0.0
+
+    def filter(self, ioas, values, now=None):
+        """Return a boolean array that is True for each value that exceeds the deadband of its IOA.
+
+        ioas should be unique and known (added), values are numbers. The values that pass
+        are stored as last transmitted value.
+        """
+        if now is None:
+            now = time.monotonic()
+        idx = np.fromiter((self.slots[ioa] for ioa in ioas), dtype=np.intp, count=len(ioas))
+        value = np.asarray(values, dtype=np.float64)
+
+        last = self.last_sent[idx]
+        mode = self.mode[idx]
+        threshold = self.threshold[idx]
+        diff = np.abs(value - last)
+
+        # the value received previously deviated from the last transmitted value until now, integrate
+        # that deviation over the time since the previous update. The new value counts from now on
+        previous = np.abs(self.last_received[idx] - last)
+        integral = self.integral[idx] + previous * (now - self.last_time[idx])
+        integral = np.where(np.isnan(integral), 0.0, integral)
+
+        send = np.isnan(last)  # first value is always transmitted
+        send |= (mode == DEADBAND_NONE) & (diff > 0)
+        send |= (mode == DEADBAND_ABSOLUTE) & (diff > threshold)
+        send |= (mode == DEADBAND_PERCENT) & (diff > threshold / 100.0 * np.abs(last))
+        send |= (mode == DEADBAND_INTEGRATED) & (integral > threshold)
+
+        self.integral[idx] = np.where(send, 0.0, integral)
+        self.last_time[idx] = now
+        self.last_received[idx] = value
+        self.last_sent[idx[send]] = value[send]
+        return send
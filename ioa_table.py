@@ -0,0 +1,130 @@
+import threading
+import time
+import numpy as np
+
+# flags per IOA
+FLAG_EVENT = 1  # send a spontaneous event when the value changes
+
+
+class IOATable:
+    """Columnar store of the IOA's served by the 104 server.
+
+    Each IOA has a slot in the arrays ioa, type, value, quality, timestamp and flags,
+    callbacks are kept in a list with the same slots. Slots are assigned in order of
+    adding and never move, so a slot stays valid while IOA's are added by another thread.
+    The order of the slots by IOA is computed under the lock when it is needed after
+    IOA's were added, so adding many IOA's at startup does not sort for each one.
+    """
+
+    def __init__(self, size=256):
+        self.count = 0
+        self.ioa = np.zeros(size, dtype=np.int64)
+        self.type = np.zeros(size, dtype=np.int32)
+        self.value = np.zeros(size, dtype=np.int64)
+        self.quality = np.zeros(size, dtype=np.uint8)
+        self.timestamp = np.zeros(size, dtype=np.float64)  # ms since epoch of the last update
+        self.flags = np.zeros(size, dtype=np.uint8)
+        self.callbacks = []
+        self.index = {}  # ioa -> slot
+        self.order = np.zeros(0, dtype=np.int64)  # slots in order of IOA
+        self.sorted = True
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, ioa):
+        return ioa in self.index
+
+    def _grow(self):
+        size = len(self.ioa) * 2
+        for name in ('ioa', 'type', 'value', 'quality', 'timestamp', 'flags'):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros(size - len(arr), dtype=arr.dtype))))
+
+    def _sort(self):
+        # called with the lock held
+        self.order = np.argsort(self.ioa[:self.count], kind='stable')
+        self.sorted = True
+
+    def add(self, ioa, type, value=0, callback=None, event=False):
+        """Add an IOA, returns -1 if it already exists."""
+        with self.lock:
+            if ioa in self.index:
+                return -1
+            if self.count >= len(self.ioa):
+                self._grow()
+            slot = self.count
+            self.ioa[slot] = ioa
+            self.type[slot] = type
+            self.value[slot] = int(value)
+            self.quality[slot] = 0
+            self.timestamp[slot] = 0
+            self.flags[slot] = FLAG_EVENT if event else 0
+            self.callbacks.append(callback)
+            self.count += 1
+            self.index[ioa] = slot  # last, the IOA is looked up without the lock
+            self.sorted = False
+            return 0
+
+    def add_many(self, ioas, types, callbacks, events):
+        """Add IOA's with their type, callback and event flag in one pass, with value 0.
+
+        Returns the IOA's that were not added, as they already existed.
+        """
+        with self.lock:
+            existing = []
+            new = []
+            seen = set()
+            for i in range(len(ioas)):
+                if ioas[i] in self.index or ioas[i] in seen:
+                    existing.append(ioas[i])
+                    continue
+                seen.add(ioas[i])
+                new.append(i)
+            while self.count + len(new) > len(self.ioa):
+                self._grow()
+            slots = slice(self.count, self.count + len(new))
+            self.ioa[slots] = [ioas[i] for i in new]
+            self.type[slots] = [types[i] for i in new]
+            self.value[slots] = 0
+            self.quality[slots] = 0
+            self.timestamp[slots] = 0
+            self.flags[slots] = [FLAG_EVENT if events[i] else 0 for i in new]
+            self.callbacks.extend(callbacks[i] for i in new)
+            for slot in range(len(new)):
+                self.index[ioas[new[slot]]] = self.count + slot
+            self.count += len(new)
+            self.sorted = False
+            return existing
+
+    def slot(self, ioa):
+        """Return the slot of an IOA, or None if it does not exist."""
+        return self.index.get(ioa)
+
+    def set_value(self, slot, value, quality=0):
+        # under the lock, as the arrays are replaced when the table grows
+        with self.lock:
+            self.value[slot] = value
+            self.quality[slot] = quality
+            self.timestamp[slot] = time.time() * 1000.0
+
+    def has_event(self, slot):
+        return (self.flags[slot] & FLAG_EVENT) != 0
+
+    def record(self, slot):
+        """Return the IOA in a slot as dict, as passed to the IOA callbacks."""
+        return {
+            'type': int(self.type[slot]),
+            'data': int(self.value[slot]),
+            'callback': self.callbacks[slot],
+            'event': bool(self.flags[slot] & FLAG_EVENT),
+        }
+
+    def slots_of_type(self, type):
+        """Return the slots of all IOA's of a type, in order of IOA."""
+        with self.lock:
+            if not self.sorted:
+                self._sort()
+            order = self.order
+            return order[self.type[order] == type]
@@ -2,10 +2,17 @@
 from lib60870 import *
 import time
 import logging
+import threading
 from gpio_control import load_gpio_controller
+from deadband import DeadbandTable, DEADBAND_NONE
+from ioa_table import IOATable
+import metrics
 
 logger = logging.getLogger(__name__)
 
+SPONTANEOUS_ASDUS = metrics.counter("gateway_iec104_spontaneous_asdus_total", "Spontaneous ASDU's enqueued for the 104 masters")
+GI_SECONDS = metrics.histogram("gateway_iec104_gi_seconds", "Duration of answering a station interrogation")
+
 class IEC60870_5_104_server:
 
     def printCP56Time2a(self, time):
@@ -25,64 +32,55 @@ class IEC60870_5_104_server:
         #/* update system time here */
         return True
 
+    # create an information object of a monitored type, the memory of io is reused if given
+    @staticmethod
+    def create_io(io, type, ioa, value, quality = IEC60870_QUALITY_GOOD):
+        if type == MeasuredValueScaled:
+            return cast(MeasuredValueScaled_create(cast(io, MeasuredValueScaled) if io != None else None, ioa, value, quality), InformationObject)
+        elif type == SinglePointInformation:
+            return cast(SinglePointInformation_create(cast(io, SinglePointInformation) if io != None else None, ioa, value, quality), InformationObject)
+        elif type == DoublePointInformation:
+            return cast(DoublePointInformation_create(cast(io, DoublePointInformation) if io != None else None, ioa, value, quality), InformationObject)
+        return None
+
+    # send the values of all IOA's of a type, in as many ASDU's as needed
+    def send_interrogated(self, connection, alParams, type):
+        slots = self.IOA_table.slots_of_type(type)
+        if len(slots) == 0:
+            return
+        ioas = self.IOA_table.ioa[slots].tolist()
+        values = self.IOA_table.value[slots].tolist()
+        qualities = self.IOA_table.quality[slots].tolist()
+
+        newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+        io = None
+        for i in range(len(ioas)):
+            io = self.create_io(io, type, ioas[i], values[i], qualities[i])
+            if not CS101_ASDU_addInformationObject(newAsdu, io):
+                # asdu is full, send it and continue with a new one
+                IMasterConnection_sendASDU(connection, newAsdu)
+                CS101_ASDU_destroy(newAsdu)
+                newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
+                CS101_ASDU_addInformationObject(newAsdu, io)
+        InformationObject_destroy(io)
+        IMasterConnection_sendASDU(connection, newAsdu)
+        CS101_ASDU_destroy(newAsdu)
+
     def GI_h(self, param, connection, asdu, qoi):
         #logger.info(f"Received interrogation for group {qoi}")
 
         if (qoi == 20): #{ /* only handle station interrogation */
+            start = time.monotonic()
             alParams = IMasterConnection_getApplicationLayerParameters(connection)
             IMasterConnection_sendACT_CON(connection, asdu, False)
 
             #* The CS101 specification only allows information objects without timestamp in GI responses */
-            # measuredvalue
-            type = MeasuredValueScaled
-            newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
-            io = None
-            for ioa in self.IOA_list:
-                if self.IOA_list[ioa]['type'] == type:
-                    if io == None:
-                        io = cast( MeasuredValueScaled_create(None,ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject) #
-                        CS101_ASDU_addInformationObject(newAsdu, io)
-                    else:
-                        CS101_ASDU_addInformationObject(newAsdu, cast( MeasuredValueScaled_create(cast(io,MeasuredValueScaled),ioa,self.IOA_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
-            if io != None:
-                InformationObject_destroy(io)
-                IMasterConnection_sendASDU(connection, newAsdu)
-            CS101_ASDU_destroy(newAsdu)
-
-            #singlepoint
-            type = SinglePointInformation
-            newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
-            io = None
-            for ioa in self.IOA_list:
-                if self.IOA_list[ioa]['type'] == type:
-                    if io == None:
-                        io = cast( SinglePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
-                        CS101_ASDU_addInformationObject(newAsdu, io)
-                    else:
-                        CS101_ASDU_addInformationObject(newAsdu, cast( SinglePointInformation_create(cast(io,SinglePointInformation), ioa,self.IOA_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
-            if io != None:
-                InformationObject_destroy(io)
-                IMasterConnection_sendASDU(connection, newAsdu)
-            CS101_ASDU_destroy(newAsdu)
-
-            #doublepoint
-            type = DoublePointInformation
-            newAsdu = CS101_ASDU_create(alParams, False, CS101_COT_INTERROGATED_BY_STATION, 0, 1, False, False)
-            io = None
-            for ioa in self.IOA_list:
-                if self.IOA_list[ioa]['type'] == type:
-                    if io == None:
-                        io = cast( DoublePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD), InformationObject)
-                        CS101_ASDU_addInformationObject(newAsdu, io)
-                    else:
-                        CS101_ASDU_addInformationObject(newAsdu, cast( DoublePointInformation_create(cast(io,DoublePointInformation), ioa,self.IOA_list[ioa]['data'],IEC60870_QUALITY_GOOD), InformationObject) )
-            if io != None:
-                InformationObject_destroy(io)
-                IMasterConnection_sendASDU(connection, newAsdu)
-            CS101_ASDU_destroy(newAsdu)
-
+            self.send_interrogated(connection, alParams, MeasuredValueScaled)
+            self.send_interrogated(connection, alParams, SinglePointInformation)
+            self.send_interrogated(connection, alParams, DoublePointInformation)
 
             IMasterConnection_sendACT_TERM(connection, asdu)
+            GI_SECONDS.observe(value=time.monotonic() - start)
         else:
             IMasterConnection_sendACT_CON(connection, asdu, True)
 
@@ -94,11 +92,12 @@ class IEC60870_5_104_server:
         if cot == CS101_COT_ACTIVATION:
             io = CS101_ASDU_getElement(asdu, 0)
             ioa = InformationObject_getObjectAddress(io)
-            if not ioa in self.IOA_list:
+            slot = self.IOA_table.slot(ioa)
+            if slot == None:
                 logger.error("could not find IOA")
                 CS101_ASDU_setCOT(asdu, CS101_COT_UNKNOWN_IOA)
             else:
-                ioa_object = self.IOA_list[ioa]
+                ioa_object = self.IOA_table.record(slot)
                 if (CS101_ASDU_getTypeID(asdu) == C_SC_NA_1):
                     logger.info("received single command")
                     if ioa_object['type'] == SingleCommand:
@@ -106,8 +105,9 @@ class IEC60870_5_104_server:
                         
                         logger.info(f"IOA: {InformationObject_getObjectAddress(io)} switch to {SingleCommand_getState(sc)}, select:{SingleCommand_isSelect(sc)}")
                         ioa_object['data'] = SingleCommand_getState(sc)
-                        if self.IOA_list[ioa]['callback'] != None:
-                            self.IOA_list[ioa]['callback'](ioa,ioa_object, self, SingleCommand_isSelect(sc))
+                        self.IOA_table.set_value(slot, ioa_object['data'])
+                        if ioa_object['callback'] != None:
+                            ioa_object['callback'](ioa,ioa_object, self, SingleCommand_isSelect(sc))
 
                         CS101_ASDU_setCOT(asdu, CS101_COT_ACTIVATION_CON)
                     else:
@@ -120,8 +120,9 @@ class IEC60870_5_104_server:
                         sc = cast( io, DoubleCommand)
                         logger.info(f"IOA: {InformationObject_getObjectAddress(io)} switch to {DoubleCommand_getState(sc)}, select:{DoubleCommand_isSelect(sc)}")
                         ioa_object['data'] = DoubleCommand_getState(sc)
-                        if self.IOA_list[ioa]['callback'] != None:
-                            self.IOA_list[ioa]['callback'](ioa,ioa_object, self, DoubleCommand_isSelect(sc))
+                        self.IOA_table.set_value(slot, ioa_object['data'])
+                        if ioa_object['callback'] != None:
+                            ioa_object['callback'](ioa,ioa_object, self, DoubleCommand_isSelect(sc))
 
                         CS101_ASDU_setCOT(asdu, CS101_COT_ACTIVATION_CON)
                     else:
@@ -163,31 +164,31 @@ class IEC60870_5_104_server:
             logger.info(f"Connection deactivated {con}")
 
     def read(self, param, connection, asdu, ioa):
-        if ioa in self.IOA_list:
+        slot = self.IOA_table.slot(ioa)
+        if slot != None:
             # update data
-            if self.IOA_list[ioa]['callback'] != None:
-                self.IOA_list[ioa]['callback'](ioa,self.IOA_list[ioa], self)
+            callback = self.IOA_table.callbacks[slot]
+            if callback != None:
+                callback(ioa,self.IOA_table.record(slot), self)
 
-            newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
-            if self.IOA_list[ioa]['type'] == MeasuredValueScaled:
-                io = cast(MeasuredValueScaled_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            elif self.IOA_list[ioa]['type'] == SinglePointInformation:
-                io = cast(SinglePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            elif self.IOA_list[ioa]['type'] == DoublePointInformation:
-                io = cast(DoublePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-            else:
+            io = self.create_io(None, int(self.IOA_table.type[slot]), ioa, int(self.IOA_table.value[slot]), int(self.IOA_table.quality[slot]))
+            if io == None:
                 return False
+            newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
             CS101_ASDU_addInformationObject(newAsdu, io)
             InformationObject_destroy(io)
             #/* Add ASDU to slave event queue - don't release the ASDU afterwards!
             CS104_Slave_enqueueASDU(self.slave, newAsdu)
             CS101_ASDU_destroy(newAsdu)  
+            SPONTANEOUS_ASDUS.inc()
             return True
         return False
 
 
     def __init__(self, ip = "0.0.0.0"):
-        self.IOA_list = {}
+        self.IOA_table = IOATable()
+        self.deadband = DeadbandTable()
+        self.update_lock = threading.Lock()
         self.connection_refcounter = 0
         self.gpio = load_gpio_controller()
 
@@ -224,44 +225,97 @@ class IEC60870_5_104_server:
 
         CS104_Slave_setReadHandler(self.slave, self.readEventHandler, None)
 
+        metrics.gauge("gateway_iec104_queue_entries", "ASDU's in the event queue of the 104 server",
+            func=lambda: CS104_Slave_getNumberOfQueueEntries(self.slave, None))
+        metrics.gauge("gateway_iec104_connections", "Open connections of 104 masters",
+            func=lambda: CS104_Slave_getOpenConnections(self.slave))
+
 
 
     def add_ioa(self, number, type = MeasuredValueScaled, data = 0, callback = None, event = False):
-        if not number in self.IOA_list:
-            self.IOA_list[int(number)] = { 'type': type, 'data': data, 'callback': callback, 'event': event }
+        if self.IOA_table.add(int(number), type, data, callback, event) == 0:
+            self.deadband.add(int(number))
             return 0
         else:
             return -1
 
 
+    # add the IOA's of a compiled mapping at once, returns the IOA's that already existed
+    def add_ioas(self, ioas, types, callbacks, events):
+        existing = self.IOA_table.add_many(ioas, types, callbacks, events)
+        skip = set(existing)
+        for ioa in ioas:
+            if ioa not in skip:
+                self.deadband.add(int(ioa))
+        return existing
+
+
+    def set_deadband(self, ioa, mode, threshold):
+        if ioa not in self.IOA_table:
+            return -1
+        self.deadband.add(ioa, mode, threshold)
+        return 0
+
+
     def update_data(self):
-        for ioa in self.IOA_list:
-            if self.IOA_list[ioa]['callback'] != None:
-                self.IOA_list[ioa]['callback'](ioa,self.IOA_list[ioa], self)
+        for slot in range(len(self.IOA_table)):
+            callback = self.IOA_table.callbacks[slot]
+            if callback != None:
+                callback(int(self.IOA_table.ioa[slot]),self.IOA_table.record(slot), self)
+
+
+    # update a batch of (ioa, data), an event is only sent for values outside the deadband of their IOA
+    # values inside the deadband are stored, so a GI returns the latest value
+    def update_ioas(self, updates):
+        # an IOA can be updated more than once in a batch (e.g. by references with and without the
+        # default port), only its last value is filtered, as the deadband filter needs unique IOA's
+        latest = {}
+        for ioa, data in updates:
+            if ioa not in self.IOA_table:
+                continue
+            try:
+                latest[ioa] = float(data)
+            except (TypeError, ValueError):
+                logger.debug("could not convert value %s for IOA %i" % (str(data), ioa))
+                continue
+        ioas = list(latest)
+        values = list(latest.values())
+
+        if len(ioas) == 0:
+            return 0
+
+        with self.update_lock:
+            send = self.deadband.filter(ioas, values)
+            for i in range(len(ioas)):
+                ioa = ioas[i]
+                if send[i]:
+                    # with a deadband, a value that passed it is sent even if its integer value did not change
+                    force = self.deadband.mode[self.deadband.slots[ioa]] != DEADBAND_NONE
+                    self.update_ioa(ioa, values[i], force)
+                else:
+                    self.IOA_table.set_value(self.IOA_table.slot(ioa), int(values[i]))
+        return 0
 
 
-    def update_ioa(self, ioa, data):
+    def update_ioa(self, ioa, data, force = False):
         value = int(float(data))
-        if ioa not in self.IOA_list:
+        slot = self.IOA_table.slot(ioa)
+        if slot == None:
             return -1
-        if value != self.IOA_list[ioa]['data']: #check if value is different, else ignore
-            self.IOA_list[ioa]['data'] = value
-            if self.IOA_list[ioa]['event'] == True:
-                newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
-                if self.IOA_list[ioa]['type'] == MeasuredValueScaled:
-                    io = cast(MeasuredValueScaled_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-                elif self.IOA_list[ioa]['type'] == SinglePointInformation:
-                    io = cast(SinglePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-                elif self.IOA_list[ioa]['type'] == DoublePointInformation:
-                    io = cast(DoublePointInformation_create(None, ioa, self.IOA_list[ioa]['data'], IEC60870_QUALITY_GOOD),InformationObject)
-                else:
+        if force or value != self.IOA_table.value[slot]: #check if value is different, else ignore
+            self.IOA_table.set_value(slot, value)
+            if self.IOA_table.has_event(slot):
+                io = self.create_io(None, int(self.IOA_table.type[slot]), ioa, value)
+                if io == None:
                     return -1
 
+                newAsdu = CS101_ASDU_create(self.alParams, False, CS101_COT_SPONTANEOUS, 0, 1, False, False)
                 CS101_ASDU_addInformationObject(newAsdu, io)
                 InformationObject_destroy(io)
                 #/* Add ASDU to slave event queue - don't release the ASDU afterwards!
                 CS104_Slave_enqueueASDU(self.slave, newAsdu)
                 CS101_ASDU_destroy(newAsdu)
+                SPONTANEOUS_ASDUS.inc()
 
         return 0
 
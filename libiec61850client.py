@@ -4,11 +4,20 @@ import os,sys
 import ctypes
 import time
 import threading
+import itertools
+import asyncio
+import configparser
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 import lib61850
 import logging
 from abstract_client import abstract_client
+import metrics
 
-from urllib.parse import urlparse
+from dataref import parse_ref
+from model_cache import load_model, save_model
+from scl_loader import load_scl, SclError
+from compact_model import DataAttribute, DataSetMember, Node, compact, plain, intern
 from enum import Enum
 
 class AddCause(Enum):
@@ -104,17 +113,60 @@ class IedClientError(Enum):
 
 LOGGER = logging.getLogger(__name__)
 
+# number of registered datapoints read from the IED to validate a model loaded from an SCL file
+SCL_VALIDATE_POINTS = 5
+
+# how the values of DA's are read during discovery, set by discovery_read in the [iec61850] section
+READ_SINGLE = "single"	# one read per DA
+READ_BULK = "bulk"		# one read per DO and functional constraint, distributed over its DA's
+READ_NONE = "none"		# values are not read, until they are polled or reported
+
+POLL_SINGLE = "single"			# one read per polled datapoint
+POLL_MULTIREAD = "multiread"	# the polled datapoints of an IED with one read of multiple variables per LD
+POLL_PIPELINED = "pipelined"	# the polled datapoints of an IED with asynchronous reads, max_outstanding at a time
+POLL_DATASET = "dataset"		# the polled datapoints of an IED in datasets created by the gateway, one read per dataset
+
+LN_GROUP_RATIO = 0.5			# part of the DO's of a LN with a functional constraint that is polled, to read the LN at once
+POLL_DATASET_PREFIX = "@GwPoll"	# association specific datasets, removed by the IED when the connection closes
+REPORT_DATASET_PREFIX = "@GwRpt"	# association specific datasets of the rcb's configured by the gateway
+REPORT_FCS = ("ST", "MX")			# functional constraints of the datapoints that can be reported
+
+# trigger options of the rcb's configured by the gateway, by their name in auto_report_trgops
+TRIGGER_OPTIONS = {
+	"dchg": lib61850.TRG_OPT_DATA_CHANGED,
+	"qchg": lib61850.TRG_OPT_QUALITY_CHANGED,
+	"dupd": lib61850.TRG_OPT_DATA_UPDATE,
+	"integrity": lib61850.TRG_OPT_INTEGRITY,
+}
+
+PIPELINE_TIMEOUT = 30.0 # seconds to wait for the reads of a pipelined poll
+
+POLL_SECONDS = metrics.histogram("gateway_iec61850_poll_seconds", "Duration of reading a polled datapoint from an IED", ["ied"])
+POLL_REQUEST_SECONDS = metrics.histogram("gateway_iec61850_poll_request_seconds", "Duration of a read request for one or more polled datapoints, per poll mode", ["ied", "mode"])
+POLL_ERRORS = metrics.counter("gateway_iec61850_poll_errors_total", "Polls of a datapoint that failed", ["ied"])
+REPORTS = metrics.counter("gateway_iec61850_reports_total", "Reports received per report control block", ["ied", "rcb"])
+
 def scheme():
 	return "iec61850"
 
 
+# True when ref is the part of the model, or below it. A part is a LD, LN or object reference
+def underRef(ref, part):
+	return ref == part or ref.startswith(part + ".") or ("/" not in part and ref.startswith(part + "/"))
+
+
 class iec61850client(abstract_client):
 
-	def __init__(self, readvaluecallback = None, loggerRef = None, cmdTerm_cb = None, Rpt_cb = None):
+	def __init__(self, readvaluecallback = None, loggerRef = None, cmdTerm_cb = None, Rpt_cb = None, settings = None):
 		global LOGGER
 		if loggerRef != None:
 			LOGGER = loggerRef
 
+		# settings of the [iec61850] section, that can be overridden per IED in a [iec61850://host:port] section
+		self.config = configparser.ConfigParser()
+		self.config.optionxform = str
+		self.config.read_dict(settings or {})
+
 		self.polling = {}
 		self.connections = {}
 		self.connection_locks = {}
@@ -126,6 +178,20 @@ class iec61850client(abstract_client):
 		self.cb_refs = [] # used to ensure the garbage collector does not clean up used callbacks
 		self.reporting = {} # used on reconnect to reenable the rcb's
 
+		# used by the async functions: blocking calls to an IED are executed by a single thread per IED,
+		# so a slow IED only delays its own calls
+		self.executors = {}
+		self.polls_in_progress = set()
+		self.read_ids = itertools.count(1) # parameters of the asynchronous reads
+
+		metrics.gauge("gateway_iec61850_connected", "Connection state of an IED, 1 when connected with a model",
+			["ied"], lambda: {(tupl,): int(bool(conn["con"] and conn["model"])) for tupl, conn in list(self.connections.items())})
+
+		# connect, discovery and registration of the IED's run in parallel, at most connection_workers at a time
+		self.connection_tasks = {}
+		self.connection_pool = ThreadPoolExecutor(max_workers=self.config.getint(scheme(), "connection_workers", fallback=8),
+			thread_name_prefix="iec61850_connect")
+
 		self.stop_event = threading.Event()
 		self.connection_worker =  threading.Thread(target=self.connection_worker_thread)
 		self.connection_worker.start()
@@ -134,12 +200,30 @@ class iec61850client(abstract_client):
 	@staticmethod
 	def ErrorCodes(value):
 		return IedClientError(value).name
+
+
+	# value of a setting for an IED, from its own section or else from the [iec61850] section
+	def option(self, tupl, name, fallback = None):
+		section = scheme() + "://" + tupl
+		if self.config.has_option(section, name):
+			return self.config.get(section, name)
+		return self.config.get(scheme(), name, fallback=fallback)
+
+
+	def optionBool(self, tupl, name, fallback = False):
+		value = self.option(tupl, name)
+		if value == None:
+			return fallback
+		return value.strip().lower() in ("1", "yes", "true", "on")
 	
 
 	def stop_worker(self):
 		self.stop_event.set()
 		if self.connection_worker is not None:
 			self.connection_worker.join(timeout=3)
+		self.connection_pool.shutdown(wait=False)
+		for executor in list(self.executors.values()):
+			executor.shutdown(wait=False)
 
 
 	@staticmethod
@@ -193,8 +277,27 @@ class iec61850client(abstract_client):
 		return ("CANNOT FIND TYPE"), _type
 
 
+	# same as printValue, but numbers are returned as python number instead of formatted string
+	@staticmethod
+	def typedValue(value):
+		_type = str(lib61850.MmsValue_getTypeString(value))
+		if _type == "boolean":
+			return bool(lib61850.MmsValue_getBoolean(value)), _type
+		if _type == "float":
+			return lib61850.MmsValue_toFloat(value), _type
+		if _type == "integer":
+			return lib61850.MmsValue_toInt64(value), _type
+		if _type == "unsigned":
+			return lib61850.MmsValue_toUint32(value), _type
+		if _type == "bit-string":
+			return lib61850.MmsValue_getBitStringAsInteger(value), _type
+		if _type == "utc-time":
+			return lib61850.MmsValue_getUtcTimeInMs(value), _type
+		return iec61850client.printValue(value)
+
+
 	@staticmethod
-	def printDataDirectory(con, doRef):
+	def printDataDirectory(con, doRef, readValues=READ_SINGLE):
 		global LOGGER
 		tmodel = {}
 		if doRef.find("/") == -1:
@@ -212,34 +315,124 @@ class iec61850client(abstract_client):
 
 			while dataAttribute:
 				daName = ctypes.cast(lib61850.LinkedList_getData(dataAttribute),ctypes.c_char_p).value.decode("utf-8")
-				daRef = doRef+"."+daName[:-4]
+				name = intern(daName[:-4])
+				daRef = doRef+"."+name
 				fcName = daName[-3:-1]
 
-				submodel = iec61850client.printDataDirectory(con,daRef)
+				submodel = iec61850client.printDataDirectory(con,daRef, READ_SINGLE if readValues == READ_SINGLE else READ_NONE)
 				if submodel:
-					tmodel[daName[:-4]] = submodel
+					tmodel[name] = submodel
 					
 				else:
-					tmodel[daName[:-4]] = {}
-					tmodel[daName[:-4]]['reftype'] = "DA"
-					tmodel[daName[:-4]]['FC'] = fcName
-					tmodel[daName[:-4]]['value'] = "UNKNOWN"
-					#read DA
-					fc = lib61850.FunctionalConstraint_fromString(fcName) 
-					value = lib61850.IedConnection_readObject(con, ctypes.byref(error), daRef, fc)
+					tmodel[name] = DataAttribute(fcName)
+					if readValues == READ_SINGLE:
+						#read DA
+						fc = lib61850.FunctionalConstraint_fromString(fcName) 
+						value = lib61850.IedConnection_readObject(con, ctypes.byref(error), daRef, fc)
 
-					if error.value == lib61850.IED_ERROR_OK:
-						tmodel[daName[:-4]]['value'], tmodel[daName[:-4]]['type'] = iec61850client.printValue(value)
-						lib61850.MmsValue_delete(value)
+						if error.value == lib61850.IED_ERROR_OK:
+							tmodel[name].set(*iec61850client.typedValue(value))
+							lib61850.MmsValue_delete(value)
 
 				dataAttribute = lib61850.LinkedList_getNext(dataAttribute)
 
 			lib61850.LinkedList_destroy(dataAttributes)
+
+		if readValues == READ_BULK and tmodel:
+			err = iec61850client.readValuesBulk(con, doRef, tmodel)
+			if err != lib61850.IED_ERROR_OK:
+				LOGGER.error("could not read values of %s, error:%i" % (doRef, err))
+				return {} # connection lost, the caller stops the discovery
 		return tmodel
 
 
+	# True when the connection was lost, e.g. during a discovery
+	@staticmethod
+	def connectionLost(con):
+		return lib61850.IedConnection_getState(con) != lib61850.IED_STATE_CONNECTED
+
+
+	# functional constraints of the DA's in a (sub)model
+	@staticmethod
+	def functionalConstraints(submodel, fcs=None):
+		if fcs == None:
+			fcs = []
+		for name in submodel:
+			node = submodel[name]
+			if not isinstance(node, (dict, Node)):
+				continue
+			if node.get('reftype') == 'DA':
+				if not node['FC'] in fcs:
+					fcs.append(node['FC'])
+			else:
+				iec61850client.functionalConstraints(node, fcs)
+		return fcs
+
+
+	# read all DA's of a DO (or RCB) with one read per functional constraint, and distribute the
+	# returned structures over the model. When a structure does not match the model, the DA's of
+	# that functional constraint are read one by one
+	@staticmethod
+	def readValuesBulk(con, doRef, tmodel):
+		global LOGGER
+		for fcName in iec61850client.functionalConstraints(tmodel):
+			fc = lib61850.FunctionalConstraint_fromString(fcName)
+			error = lib61850.IedClientError()
+			value = lib61850.IedConnection_readObject(con, ctypes.byref(error), doRef, fc)
+			distributed = False
+			if error.value == lib61850.IED_ERROR_OK:
+				distributed = iec61850client.distributeValue(tmodel, fcName, value)
+				lib61850.MmsValue_delete(value)
+			elif error.value == lib61850.IED_ERROR_CONNECTION_LOST:
+				return error.value
+
+			if not distributed:
+				LOGGER.debug("could not read %s[%s] at once, reading its attributes one by one" % (doRef, fcName))
+				iec61850client.readValuesSingle(con, doRef, tmodel, fcName)
+		return lib61850.IED_ERROR_OK
+
+
+	# put the elements of a structure, as read with a functional constraint, in the DA's of the submodel
+	# with that functional constraint. Returns False when the structure does not match the submodel
+	@staticmethod
+	def distributeValue(submodel, fcName, value):
+		if str(lib61850.MmsValue_getTypeString(value)) != "structure":
+			return False
+		names = [name for name in submodel if isinstance(submodel[name], (dict, Node)) and fcName in iec61850client.functionalConstraints({name: submodel[name]})]
+		if lib61850.MmsValue_getArraySize(value) != len(names):
+			return False
+
+		for i in range(len(names)):
+			node = submodel[names[i]]
+			element = lib61850.MmsValue_getElement(value, i)
+			if node.get('reftype') == 'DA':
+				node.set(*iec61850client.typedValue(element))
+			elif not iec61850client.distributeValue(node, fcName, element):
+				return False
+		return True
+
+
+	# read the DA's with a functional constraint of a submodel one by one
+	@staticmethod
+	def readValuesSingle(con, ref, submodel, fcName):
+		for name in submodel:
+			node = submodel[name]
+			if not isinstance(node, (dict, Node)):
+				continue
+			if node.get('reftype') == 'DA':
+				if node['FC'] != fcName:
+					continue
+				error = lib61850.IedClientError()
+				value = lib61850.IedConnection_readObject(con, ctypes.byref(error), ref + "." + name, lib61850.FunctionalConstraint_fromString(fcName))
+				if error.value == lib61850.IED_ERROR_OK:
+					node.set(*iec61850client.typedValue(value))
+					lib61850.MmsValue_delete(value)
+			else:
+				iec61850client.readValuesSingle(con, ref + "." + name, node, fcName)
+
+
 	@staticmethod
-	def discovery(con):
+	def discovery(con, readValues=READ_SINGLE):
 		global LOGGER
 		tmodel = {}
 
@@ -270,7 +463,7 @@ class iec61850client(abstract_client):
 					if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
 						lib61850.LinkedList_destroy(logicalNodes)
 						lib61850.LinkedList_destroy(deviceList)
-						return model
+						return tmodel
 
 					LNobject = lib61850.LinkedList_getNext(LNobjects)
 					while LNobject:
@@ -279,103 +472,242 @@ class iec61850client(abstract_client):
 
 						doRef = LD_name+"/"+LN_name+"."+Do
 
-						tmodel[LD_name][LN_name][Do] = iec61850client.printDataDirectory(con, doRef)
+						tmodel[LD_name][LN_name][Do] = iec61850client.printDataDirectory(con, doRef, readValues)
+						if not tmodel[LD_name][LN_name][Do] and iec61850client.connectionLost(con):
+							lib61850.LinkedList_destroy(LNobjects)
+							lib61850.LinkedList_destroy(logicalNodes)
+							lib61850.LinkedList_destroy(deviceList)
+							return tmodel
 
 						LNobject = lib61850.LinkedList_getNext(LNobject)
 					lib61850.LinkedList_destroy(LNobjects)
 
-					LNdss = lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name, lib61850.ACSI_CLASS_DATA_SET)
-					if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
+					if iec61850client.discoverDataSets(con, tmodel, LD_name, LN_name) != lib61850.IED_ERROR_OK:
 						lib61850.LinkedList_destroy(logicalNodes)
 						lib61850.LinkedList_destroy(deviceList)
 						return tmodel
 
-					LNds = lib61850.LinkedList_getNext(LNdss)
-					while LNds:
-
-						DSname = ctypes.cast(lib61850.LinkedList_getData(LNds),ctypes.c_char_p).value.decode("utf-8")
-						tmodel[LD_name][LN_name][DSname] = {}
-
-						#
-						isDel = ctypes.c_bool(False)
-						dataSetMembers = lib61850.IedConnection_getDataSetDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name+"."+DSname, ctypes.byref(isDel))  
-						if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
-							lib61850.LinkedList_destroy(LNdss)
-							lib61850.LinkedList_destroy(logicalNodes)
-							lib61850.LinkedList_destroy(deviceList)
-							return tmodel
-
-						#all DS are assumed not deletable 
-						if isDel == True:
-							LOGGER.info("  DS: %s, is Deletable" % DSname)
-						else:
-							LOGGER.info("  DS: %s, not Deletable" % DSname)
-						dataSetMemberRef = lib61850.LinkedList_getNext(dataSetMembers)
-
-						i = 0
-						while dataSetMemberRef:
-							dsRef = ctypes.cast(lib61850.LinkedList_getData(dataSetMemberRef),ctypes.c_char_p).value.decode("utf-8")
-							DX = dsRef[:-4]
-							FC = dsRef[-3:-1]
-							tmodel[LD_name][LN_name][DSname][str(i)] = {}
-							tmodel[LD_name][LN_name][DSname][str(i)]['reftype'] = "DX"
-							tmodel[LD_name][LN_name][DSname][str(i)]['type'] = "reference"
-							tmodel[LD_name][LN_name][DSname][str(i)]['value'] = DX
-							tmodel[LD_name][LN_name][DSname][str(i)]['FC'] = FC
-							dataSetMemberRef = lib61850.LinkedList_getNext(dataSetMemberRef)
-							i += 1
-						lib61850.LinkedList_destroy(dataSetMembers)
-						LNds = lib61850.LinkedList_getNext(LNds)
-
-					lib61850.LinkedList_destroy(LNdss)
-
-
-					LNrpp = lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name, lib61850.ACSI_CLASS_URCB)
-					if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
+					if iec61850client.discoverRCBs(con, tmodel, LD_name, LN_name, readValues) != lib61850.IED_ERROR_OK:
 						lib61850.LinkedList_destroy(logicalNodes)
 						lib61850.LinkedList_destroy(deviceList)
 						return tmodel
 
-					LNrp = lib61850.LinkedList_getNext(LNrpp)
-					while LNrp:
-						Rp = ctypes.cast(lib61850.LinkedList_getData(LNrp),ctypes.c_char_p).value.decode("utf-8")
-						tmodel[LD_name][LN_name][Rp] = {}
+					logicalNode = lib61850.LinkedList_getNext(logicalNode)
 
-						doRef = LD_name+"/"+LN_name+"."+Rp
+				lib61850.LinkedList_destroy(logicalNodes)
+				device = lib61850.LinkedList_getNext(device)
 
-						tmodel[LD_name][LN_name][Rp] = iec61850client.printDataDirectory(con, doRef)
+			lib61850.LinkedList_destroy(deviceList)
+		return tmodel
 
-						LNrp = lib61850.LinkedList_getNext(LNrp)
-					lib61850.LinkedList_destroy(LNrpp)
 
+	# add the datasets of a LN, with their members, to the model. returns the error of the failed request
+	@staticmethod
+	def discoverDataSets(con, tmodel, LD_name, LN_name):
+		global LOGGER
+		error = lib61850.IedClientError()
+		LNdss = lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name, lib61850.ACSI_CLASS_DATA_SET)
+		if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
+			return error.value
+
+		LNds = lib61850.LinkedList_getNext(LNdss)
+		while LNds:
+
+			DSname = ctypes.cast(lib61850.LinkedList_getData(LNds),ctypes.c_char_p).value.decode("utf-8")
+			tmodel[LD_name][LN_name][DSname] = {}
+
+			#
+			isDel = ctypes.c_bool(False)
+			dataSetMembers = lib61850.IedConnection_getDataSetDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name+"."+DSname, ctypes.byref(isDel))  
+			if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
+				lib61850.LinkedList_destroy(LNdss)
+				return error.value
+
+			#all DS are assumed not deletable 
+			if isDel == True:
+				LOGGER.info("  DS: %s, is Deletable" % DSname)
+			else:
+				LOGGER.info("  DS: %s, not Deletable" % DSname)
+			dataSetMemberRef = lib61850.LinkedList_getNext(dataSetMembers)
+
+			i = 0
+			while dataSetMemberRef:
+				dsRef = ctypes.cast(lib61850.LinkedList_getData(dataSetMemberRef),ctypes.c_char_p).value.decode("utf-8")
+				DX = dsRef[:-4]
+				FC = dsRef[-3:-1]
+				tmodel[LD_name][LN_name][DSname][str(i)] = DataSetMember(FC, DX)
+				dataSetMemberRef = lib61850.LinkedList_getNext(dataSetMemberRef)
+				i += 1
+			lib61850.LinkedList_destroy(dataSetMembers)
+			LNds = lib61850.LinkedList_getNext(LNds)
+
+		lib61850.LinkedList_destroy(LNdss)
+		return lib61850.IED_ERROR_OK
+
+
+	# add the unbuffered and buffered RCB's of a LN to the model. returns the error of the failed request.
+	# The values of the RCB's are always read, as DatSet is needed to find the RCB of a dataset
+	@staticmethod
+	def discoverRCBs(con, tmodel, LD_name, LN_name, readValues=READ_SINGLE):
+		if readValues == READ_NONE:
+			readValues = READ_BULK
+		error = lib61850.IedClientError()
+		for acsiClass in (lib61850.ACSI_CLASS_URCB, lib61850.ACSI_CLASS_BRCB):
+			LNrpp = lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name, acsiClass)
+			if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
+				return error.value
 
-					LNbrr = lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), LD_name+"/"+LN_name, lib61850.ACSI_CLASS_BRCB)
-					if error.value != lib61850.IED_ERROR_OK:#ret becomes int if connection is lost
-						lib61850.LinkedList_destroy(logicalNodes)
-						lib61850.LinkedList_destroy(deviceList)
-						return tmodel
+			LNrp = lib61850.LinkedList_getNext(LNrpp)
+			while LNrp:
+				Rp = ctypes.cast(lib61850.LinkedList_getData(LNrp),ctypes.c_char_p).value.decode("utf-8")
+				tmodel[LD_name][LN_name][Rp] = {}
 
-					LNbr = lib61850.LinkedList_getNext(LNbrr)
-					while LNbr:
-						Br = ctypes.cast(lib61850.LinkedList_getData(LNbr),ctypes.c_char_p).value.decode("utf-8")
-						tmodel[LD_name][LN_name][Br] = {}
+				doRef = LD_name+"/"+LN_name+"."+Rp
 
-						doRef = LD_name+"/"+LN_name+"."+Br
+				tmodel[LD_name][LN_name][Rp] = iec61850client.printDataDirectory(con, doRef, readValues)
+				if not tmodel[LD_name][LN_name][Rp] and iec61850client.connectionLost(con):
+					lib61850.LinkedList_destroy(LNrpp)
+					return lib61850.IED_ERROR_CONNECTION_LOST
 
-						tmodel[LD_name][LN_name][Br] = iec61850client.printDataDirectory(con, doRef)
+				LNrp = lib61850.LinkedList_getNext(LNrp)
+			lib61850.LinkedList_destroy(LNrpp)
+		return lib61850.IED_ERROR_OK
 
-						LNbr = lib61850.LinkedList_getNext(LNbr)
-					lib61850.LinkedList_destroy(LNbrr)
 
-					logicalNode = lib61850.LinkedList_getNext(logicalNode)
+	# the part of the model needed for a list of references, as {LD: {LN: set of DO's}}
+	@staticmethod
+	def discoveryScope(refs):
+		scope = {}
+		for ref in refs:
+			path = ref.path if hasattr(ref, "path") else ref
+			LD, _, rest = path.partition("/")
+			if rest == "":
+				continue
+			names = rest.split(".")
+			DOs = scope.setdefault(LD, {}).setdefault(names[0], set())
+			if len(names) > 1:
+				DOs.add(names[1])
+		return scope
 
-				lib61850.LinkedList_destroy(logicalNodes)
-				device = lib61850.LinkedList_getNext(device)
 
+	# discover only the LD's, LN's and DO's in scope ({LD: {LN: set of DO's}}), and the datasets and RCB's
+	# of LLN0 and of the LN's in scope, that are needed for reporting. Parts that are already in tmodel
+	# are not requested again, so the model can be expanded when new references are registered
+	@staticmethod
+	def scopedDiscovery(con, scope, tmodel=None, readValues=READ_SINGLE):
+		global LOGGER
+		error = lib61850.IedClientError()
+		if tmodel == None:
+			tmodel = {}
+			# the LD's are always listed, so the model is not empty when nothing is in scope
+			deviceList = lib61850.IedConnection_getLogicalDeviceList(con, ctypes.byref(error))
+			if error.value != lib61850.IED_ERROR_OK:
+				LOGGER.error("could not get logical device list, error:%i" % error.value)
+				return {}
+			device = lib61850.LinkedList_getNext(deviceList)
+			while device:
+				LD_name=ctypes.cast(lib61850.LinkedList_getData(device),ctypes.c_char_p).value.decode("utf-8")
+				tmodel[LD_name] = {}
+				device = lib61850.LinkedList_getNext(device)
 			lib61850.LinkedList_destroy(deviceList)
+
+		for LD_name in scope:
+			if not LD_name in tmodel:
+				LOGGER.error("cannot find LD %s on IED" % LD_name)
+				continue
+
+			LNs = dict(scope[LD_name])
+			LNs.setdefault("LLN0", set())
+			for LN_name in LNs:
+				if not LN_name in tmodel[LD_name]:
+					tmodel[LD_name][LN_name] = {}
+					err = iec61850client.discoverDataSets(con, tmodel, LD_name, LN_name)
+					if err == lib61850.IED_ERROR_OK:
+						err = iec61850client.discoverRCBs(con, tmodel, LD_name, LN_name, readValues)
+					if err != lib61850.IED_ERROR_OK:
+						LOGGER.error("could not discover %s/%s, error:%i" % (LD_name, LN_name, err))
+						del tmodel[LD_name][LN_name]
+						if err == lib61850.IED_ERROR_CONNECTION_LOST or err == lib61850.IED_ERROR_NOT_CONNECTED:
+							return tmodel
+						continue
+
+				for Do in LNs[LN_name]:
+					if Do in tmodel[LD_name][LN_name]:
+						continue
+					submodel = iec61850client.printDataDirectory(con, LD_name+"/"+LN_name+"."+Do, readValues)
+					if submodel:
+						tmodel[LD_name][LN_name][Do] = submodel
 		return tmodel
 
 
+	# compare a LN in the model with its directory on the IED, and discover the DO's, datasets and RCB's
+	# that changed. DO's that are not in the model are only added with full discovery. The references
+	# of changed parts are added to changed. returns the error of the failed request
+	@staticmethod
+	def refreshLN(con, tmodel, LD_name, LN_name, readValues, full, changed):
+		error = lib61850.IedClientError()
+		lnRef = LD_name + "/" + LN_name
+		lnModel = tmodel[LD_name][LN_name]
+
+		names = {}
+		for acsiClass in (lib61850.ACSI_CLASS_DATA_OBJECT, lib61850.ACSI_CLASS_DATA_SET, lib61850.ACSI_CLASS_URCB, lib61850.ACSI_CLASS_BRCB):
+			names[acsiClass] = iec61850client.directoryNames(lib61850.IedConnection_getLogicalNodeDirectory(con, ctypes.byref(error), lnRef, acsiClass), error)
+			if names[acsiClass] == None:
+				return error.value
+		RCBs = names[lib61850.ACSI_CLASS_URCB] + names[lib61850.ACSI_CLASS_BRCB]
+
+		for name in list(lnModel):
+			if isinstance(lnModel[name], (dict, Node)) and name not in names[lib61850.ACSI_CLASS_DATA_OBJECT] + names[lib61850.ACSI_CLASS_DATA_SET] + RCBs:
+				del lnModel[name]
+				changed.append(lnRef + "." + name)
+
+		# a DO changed when the names of its attributes changed
+		for Do in names[lib61850.ACSI_CLASS_DATA_OBJECT]:
+			doRef = lnRef + "." + Do
+			if Do in lnModel:
+				attributes = iec61850client.directoryNames(lib61850.IedConnection_getDataDirectory(con, ctypes.byref(error), doRef), error)
+				if attributes == None:
+					return error.value
+				if sorted(attributes) == sorted(name for name in lnModel[Do] if isinstance(lnModel[Do][name], (dict, Node))):
+					continue
+			elif not full:
+				continue
+			submodel = iec61850client.printDataDirectory(con, doRef, readValues)
+			if submodel:
+				lnModel[intern(Do)] = submodel
+				changed.append(doRef)
+
+		# a dataset changed when its members changed
+		members = {}
+		for DS in names[lib61850.ACSI_CLASS_DATA_SET]:
+			if DS in lnModel:
+				members[DS] = [lnModel[DS][index]['value'] for index in lnModel[DS]]
+		err = iec61850client.discoverDataSets(con, tmodel, LD_name, LN_name)
+		if err != lib61850.IED_ERROR_OK:
+			return err
+		for DS in names[lib61850.ACSI_CLASS_DATA_SET]:
+			if DS in lnModel and members.get(DS) != [lnModel[DS][index]['value'] for index in lnModel[DS]]:
+				changed.append(lnRef + "." + DS)
+
+		# an rcb changed when it is new, or uses another dataset
+		for Rp in RCBs:
+			rcbRef = lnRef + "." + Rp
+			if Rp in lnModel and "DatSet" in lnModel[Rp]:
+				node = lnModel[Rp]["DatSet"]
+				value = lib61850.IedConnection_readObject(con, ctypes.byref(error), rcbRef + ".DatSet", lib61850.FunctionalConstraint_fromString(node['FC']))
+				if error.value != lib61850.IED_ERROR_OK:
+					return error.value
+				datSet = iec61850client.typedValue(value)
+				lib61850.MmsValue_delete(value)
+				if datSet[0] == node.raw:
+					continue
+			submodel = iec61850client.printDataDirectory(con, rcbRef, READ_BULK if readValues == READ_NONE else readValues)
+			if submodel:
+				lnModel[intern(Rp)] = submodel
+				changed.append(rcbRef)
+		return lib61850.IED_ERROR_OK
+
+
 	@staticmethod
 	def getMMsValue(typeVal, value, size=8, typeval = -1):
 		global LOGGER
@@ -443,6 +775,12 @@ class iec61850client(abstract_client):
 			LOGGER.error("ref is not DA")
 			return {},-1
 
+		if not 'type' in submodel: # value was not read during discovery
+			model, err = iec61850client.updateValueInModel(con, model, ref)
+			if err != 0:
+				return model, err
+			submodel, path = iec61850client.parseRef(model,ref)
+
 		fc = lib61850.FunctionalConstraint_fromString(submodel['FC']) 
 		mmsvalue = iec61850client.getMMsValue(submodel['type'],value)
 		if not mmsvalue:
@@ -457,8 +795,9 @@ class iec61850client(abstract_client):
 		return model, error.value
 
 
+	# index is the reference index of the model, entries below a subtree that is replaced are removed
 	@staticmethod
-	def updateValueInModel(con, model, ref):
+	def updateValueInModel(con, model, ref, index=None):
 		global LOGGER
 		err = -1
 		val, path = iec61850client.parseRef(model,ref)
@@ -477,7 +816,7 @@ class iec61850client(abstract_client):
 					error = lib61850.IedClientError()
 					value = lib61850.IedConnection_readObject(con, ctypes.byref(error), ref, fc)
 					if error.value == lib61850.IED_ERROR_OK:
-						submodel[ path[0] ]['value'],  submodel[ path[0] ]['type'] = iec61850client.printValue(value)
+						submodel[ path[0] ].set(*iec61850client.typedValue(value))
 						lib61850.MmsValue_delete(value)
 						recurse_err = 0
 					else:
@@ -485,7 +824,15 @@ class iec61850client(abstract_client):
 						recurse_err = error.value
 
 				else:
+					if index != None:
+						# only the references below the replaced subtree are removed and added again
+						for key in iec61850client.refIndex(submodel.get(path[0], {}), ref):
+							index.pop(key, None)
+						index.pop(ref, None)
 					submodel[ path[0] ] = iec61850client.printDataDirectory(con, ref)
+					if index != None and submodel[ path[0] ]:
+						index[ref] = submodel[ path[0] ]
+						iec61850client.refIndex(submodel[ path[0] ], ref, index)
 					if submodel[ path[0] ]:# check if value or empty returned
 						recurse_err = 0
 					else:
@@ -576,152 +923,754 @@ class iec61850client(abstract_client):
 				iec61850client.printrefs(model[element],_ref, depth + 1)
 
 
+	# names of the logical devices of an IED, or None when they could not be read
+	@staticmethod
+	def logicalDevices(con):
+		error = lib61850.IedClientError()
+		deviceList = lib61850.IedConnection_getLogicalDeviceList(con, ctypes.byref(error))
+		if error.value != lib61850.IED_ERROR_OK:
+			return None
+		lds = []
+		device = lib61850.LinkedList_getNext(deviceList)
+		while device:
+			lds.append(ctypes.cast(lib61850.LinkedList_getData(device),ctypes.c_char_p).value.decode("utf-8"))
+			device = lib61850.LinkedList_getNext(device)
+		lib61850.LinkedList_destroy(deviceList)
+		return lds
+
+
+	# the names in a directory listing, or None when it could not be read
+	@staticmethod
+	def directoryNames(linkedList, error):
+		if error.value != lib61850.IED_ERROR_OK:
+			return None
+		names = []
+		item = lib61850.LinkedList_getNext(linkedList)
+		while item:
+			names.append(ctypes.cast(lib61850.LinkedList_getData(item),ctypes.c_char_p).value.decode("utf-8"))
+			item = lib61850.LinkedList_getNext(item)
+		lib61850.LinkedList_destroy(linkedList)
+		return names
+
+
+	# LLN0.NamPlt.configRev of each logical device, "" when it could not be read
+	@staticmethod
+	def configRevisions(con, lds):
+		revisions = {}
+		for LD in lds:
+			error = lib61850.IedClientError()
+			value = lib61850.IedConnection_readObject(con, ctypes.byref(error), LD + "/LLN0.NamPlt.configRev", lib61850.IEC61850_FC_DC)
+			revisions[LD] = ""
+			if error.value == lib61850.IED_ERROR_OK:
+				revisions[LD], _ = iec61850client.printValue(value)
+				lib61850.MmsValue_delete(value)
+		return revisions
+
+
+	# return the cached model of an IED if its logical devices and their configRev did not change,
+	# else None. The revisions that were read are stored, to save them with a newly discovered model
+	def cachedModel(self, tupl, cacheDir, discoveryMode):
+		con = self.connections[tupl]["con"]
+		lds = iec61850client.logicalDevices(con)
+		if lds == None:
+			return None
+		revisions = iec61850client.configRevisions(con, lds)
+		self.connections[tupl]["revisions"] = revisions
+
+		entry = load_model(cacheDir, tupl)
+		if entry == None or entry['discovery'] != discoveryMode:
+			return None
+		if sorted(entry['lds']) != sorted(lds) or "" in revisions.values() or entry['revisions'] != revisions:
+			LOGGER.info("configuration of %s changed, model cache is not used" % tupl)
+			return None
+		LOGGER.info("model of %s loaded from cache" % tupl)
+		return compact(entry['model'])
+
+
+	# load the model of an IED from its SCL file. With scl_validate, the logical devices and a few
+	# registered datapoints are read from the IED, and None is returned when they do not match the model
+	def sclModel(self, tupl, sclFile):
+		try:
+			model = compact(load_scl(sclFile, self.option(tupl, "scl_ied")))
+		except (OSError, ET.ParseError, SclError) as e:
+			LOGGER.error("could not load SCL file %s, the model is discovered online: %s" % (sclFile, e))
+			return None
+		if not model or not self.optionBool(tupl, "scl_validate"):
+			return model
+
+		con = self.connections[tupl]["con"]
+		lds = iec61850client.logicalDevices(con)
+		if lds == None or sorted(lds) != sorted(model):
+			LOGGER.error("logical devices of %s do not match SCL file %s" % (tupl, sclFile))
+			return None
+		for datapoint in self.connections[tupl]["datapoints"][:SCL_VALIDATE_POINTS]:
+			submodel, path = iec61850client.parseRef(model, datapoint.path)
+			if not submodel:
+				continue # not in the SCL file, reported when it is registered
+			model, err = iec61850client.updateValueInModel(con, model, datapoint.path)
+			if err != 0:
+				LOGGER.error("%s could not be read from %s, SCL file %s does not match" % (datapoint.path, tupl, sclFile))
+				return None
+		LOGGER.info("model of %s loaded from SCL file %s" % (tupl, sclFile))
+		return model
+
+
+	def saveModel(self, tupl):
+		cacheDir = self.option(tupl, "model_cache")
+		revisions = self.connections[tupl].get("revisions")
+		if not cacheDir or not revisions or "" in revisions.values():
+			return
+		model = self.connections[tupl]["model"]
+		save_model(cacheDir, tupl, list(model), revisions, self.option(tupl, "discovery", "full"), plain(model))
+
+
+	# the reference index of the nodes below a node of the model: "LD", "LD/LN" and "LD/LN.DO.DA" -> node.
+	# ref is the reference of the node, "" for the model. Made in one pass, without recursion
+	@staticmethod
+	def refIndex(node, ref="", index=None):
+		if index == None:
+			index = {}
+		stack = [(ref, node)]
+		while stack:
+			ref, node = stack.pop()
+			if isinstance(node, Node):
+				continue # a leaf
+			for name in node:
+				child = node[name]
+				if not isinstance(child, (dict, Node)):
+					continue
+				if ref == "":
+					childRef = name
+				elif "/" in ref:
+					childRef = ref + "." + name
+				else:
+					childRef = ref + "/" + name
+				index[childRef] = child
+				stack.append((childRef, child))
+		return index
+
+
+	# build the reference index of the model of an IED, after it was discovered or changed
+	def indexModel(self, tupl):
+		conn = self.connections[tupl]
+		conn['index'] = iec61850client.refIndex(conn['model'])
+		conn['index_model'] = conn['model']
+
+
+	# the node of a reference in the model of an IED, or {} when it does not exist, with one lookup
+	# in the reference index. The index is built again when the model was replaced
+	def lookup(self, tupl, ref):
+		conn = self.connections[tupl]
+		if conn.get('index_model') is not conn['model']:
+			self.indexModel(tupl)
+		return conn['index'].get(ref, {})
+
+
+	# reverse index of the datasets and rcbs in a model, made in one pass:
+	#   members: reference of a dataset member -> [(position, LD, LN, DS, index)], position is the order in the model
+	#   rcbs:    dataset reference "LD/LN$DS" -> [(LD, LN, RCB)] of the rcbs that use the dataset
+	@staticmethod
+	def datasetIndex(model):
+		members = {}
+		rcbs = {}
+		position = 0
+		for LD in model:
+			for LN in model[LD]:
+				for name, node in model[LD][LN].items():
+					if not isinstance(node, (dict, Node)):
+						continue
+					if "0" in node and isinstance(node["0"], (dict, Node)) and node["0"].get('reftype') == "DX":
+						for index in node:
+							members.setdefault(node[index]['value'], []).append((position, LD, LN, name, index))
+							position += 1
+					elif "DatSet" in node and isinstance(node["DatSet"], (dict, Node)) and 'value' in node["DatSet"]:
+						rcbs.setdefault(node["DatSet"]['value'], []).append((LD, LN, name))
+		return {'members': members, 'rcbs': rcbs}
+
+
+	# the dataset index of the model of a connection, rebuilt when the model is replaced
+	def datasets(self, tupl):
+		conn = self.connections[tupl]
+		model = conn['model']
+		if conn.get('datasets_model') is not model:
+			conn['datasets'] = iec61850client.datasetIndex(model)
+			conn['datasets_model'] = model
+		return conn['datasets']
+
+
+	# find the first dataset member (in model order) that contains ref, by looking up ref and
+	# each of its parents, e.g. LD/LN.DO.DA, LD/LN.DO and LD/LN. returns (position, LD, LN, DS, index) or None
+	def findDataset(self, tupl, ref):
+		members = self.datasets(tupl)['members']
+		found = None
+		while True:
+			for entry in members.get(ref, ()):
+				if found == None or entry[0] < found[0]:
+					found = entry
+			cut = ref.rfind(".")
+			if cut < 0:
+				return found
+			ref = ref[:cut]
+
+
+	# read the value of a reference into the model, and return its node. A DA is read directly
+	# with the FC of its node, other references are read with updateValueInModel
+	def readRef(self, tupl, ref):
+		con = self.connections[tupl]['con']
+		node = self.lookup(tupl, ref)
+		if isinstance(node, DataAttribute):
+			error = lib61850.IedClientError()
+			value = lib61850.IedConnection_readObject(con, ctypes.byref(error), ref, lib61850.FunctionalConstraint_fromString(node.FC))
+			if error.value != lib61850.IED_ERROR_OK:
+				LOGGER.error("could not read DA: %s from device" % ref)
+				return node, error.value
+			node.set(*iec61850client.typedValue(value))
+			lib61850.MmsValue_delete(value)
+			return node, 0
+
+		model, err = iec61850client.updateValueInModel(con, self.connections[tupl]['model'], ref, self.connections[tupl].get('index'))
+		return self.lookup(tupl, ref), err
+
+
 	def getDataModel(self, tupl):
 		con = self.connections[tupl]["con"]
-		model = iec61850client.discovery(con)
+		readValues = self.option(tupl, "discovery_read", READ_BULK)
+		discoveryMode = self.option(tupl, "discovery", "full")
+		cacheDir = self.option(tupl, "model_cache")
+
+		model = None
+		sclFile = self.option(tupl, "scl")
+		if sclFile:
+			model = self.sclModel(tupl, sclFile)
+		elif cacheDir:
+			model = self.cachedModel(tupl, cacheDir, discoveryMode)
+		if not model:
+			if discoveryMode == "scoped":
+				scope = iec61850client.discoveryScope(self.connections[tupl]["datapoints"])
+				model = iec61850client.scopedDiscovery(con, scope, None, readValues)
+			else:
+				model = iec61850client.discovery(con, readValues)
+			if model:
+				self.connections[tupl]["model"] = model
+				self.saveModel(tupl)
 		if model: #if model is not empty
-			# store the model
+			# store the model, and index it
 			self.connections[tupl]["model"] = model
+			self.indexModel(tupl)
+
+			if self.option(tupl, "refresh", "full") == "incremental" and not self.connections[tupl].get("revisions"):
+				# needed to skip the unchanged LD's on a refresh
+				lds = iec61850client.logicalDevices(con)
+				if lds != None:
+					self.connections[tupl]["revisions"] = iec61850client.configRevisions(con, lds)
 
 			#reenable the rcb's if applicable
-			if tupl in self.reporting and len(self.reporting[tupl]) > 0:
-				for refdata in self.reporting[tupl]:
-					#rcb = refdata["rcb"]
-					error = lib61850.IedClientError()
-					rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), refdata["RPT"], rcb)
-					if error.value != lib61850.IED_ERROR_OK:
-						LOGGER.error("could not retrieve RCBValues")
-						continue
-					RptId = lib61850.ClientReportControlBlock_getRptId(rcb)
-					lib61850.IedConnection_installReportHandler(con, refdata["RPT"], RptId, refdata["cbh"], id(refdata["refdata"]))
-
-					lib61850.ClientReportControlBlock_setRptEna(rcb, True)
-					lib61850.ClientReportControlBlock_setGI(rcb, True)
-					lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_GI, False)
-					if error.value != lib61850.IED_ERROR_OK:
-						LOGGER.error("could not write RCBValues")
-						continue
-					refdata["rcb"] = rcb
+			self.enableReports(tupl)
 			return 0
 		
-		self.connections[tupl]["con"] = None
-		lib61850.IedConnection_destroy(con)
+		self.closeConnection(tupl)
 		return -1
 
+	# after a reconnect, compare the directory of the IED with the model, and discover only the parts
+	# that changed. LD's with the same configRev as before are not compared. Report subscriptions,
+	# control objects and datapoints are kept, unless they refer to a changed part.
+	# returns the number of changed parts, or None when the IED could not be read
+	def refreshModel(self, tupl):
+		conn = self.connections[tupl]
+		con = conn["con"]
+		model = conn["model"]
+		readValues = self.option(tupl, "discovery_read", READ_BULK)
+		full = self.option(tupl, "discovery", "full") != "scoped"
+
+		lds = iec61850client.logicalDevices(con)
+		if lds == None:
+			return None
+		revisions = iec61850client.configRevisions(con, lds)
+		previous = conn.get("revisions") or {}
+
+		changed = []
+		for LD in list(model):
+			if LD not in lds:
+				del model[LD]
+				changed.append(LD)
+		for LD in lds:
+			if LD in model and revisions[LD] != "" and previous.get(LD) == revisions[LD]:
+				continue
+			if LD not in model:
+				model[LD] = {}
+				changed.append(LD)
+			error = lib61850.IedClientError()
+			LNs = iec61850client.directoryNames(lib61850.IedConnection_getLogicalDeviceDirectory(con, ctypes.byref(error), LD), error)
+			if LNs == None:
+				return None
+			for LN in list(model[LD]):
+				if LN not in LNs:
+					del model[LD][LN]
+					changed.append(LD + "/" + LN)
+			for LN in LNs:
+				if LN not in model[LD]:
+					if not full:
+						continue # discovered when a datapoint needs it
+					model[LD][LN] = {}
+					changed.append(LD + "/" + LN)
+				if iec61850client.refreshLN(con, model, LD, LN, readValues, full, changed) != lib61850.IED_ERROR_OK:
+					return None
+		conn["revisions"] = revisions
+
+		if len(changed) == 0:
+			LOGGER.info("model of %s did not change" % tupl)
+		else:
+			LOGGER.info("model of %s refreshed, changed: %s" % (tupl, ", ".join(changed)))
+			self.dropChanged(tupl, changed)
+			self.saveModel(tupl)
+		self.enableReports(tupl)
+		return len(changed)
+
+
+	# remove the report subscriptions and control objects that refer to a changed part of the model,
+	# and register the datapoints in these parts again
+	def dropChanged(self, tupl, changed):
+		conn = self.connections[tupl]
+		# nodes may have been replaced
+		conn.pop('index_model', None)
+		conn.pop('datasets_model', None)
+
+		for refdata in list(self.reporting.get(tupl, [])):
+			RCB_LN, FC, RP = refdata["RPT"].split(".")
+			if "provision" in refdata:
+				refs = [RCB_LN + "." + RP] + [ref for ref, fcName in refdata["refdata"][5]]
+			else:
+				key, _, LD, LN, DS = refdata["refdata"]
+				refs = [RCB_LN + "." + RP, LD + "/" + LN + "." + DS]
+			if any(underRef(ref, part) for ref in refs for part in changed):
+				LOGGER.info("RPT %s dropped, the rcb or its dataset changed" % refdata["RPT"])
+				if "provision" in refdata:
+					self.unprovision(tupl, refdata, True)
+					continue
+				lib61850.IedConnection_uninstallReportHandler(conn["con"], refdata["RPT"])
+				self.reporting[tupl].remove(refdata)
+				if refdata["RPT"] in self.cb_refs:
+					self.cb_refs.remove(refdata["RPT"])
+
+		controls = conn.get('control', {})
+		for ref in list(controls):
+			if any(underRef(ref, part) for part in changed):
+				if controls[ref] != None:
+					lib61850.ControlObjectClient_destroy(controls[ref])
+				del controls[ref]
+
+		for datapoint in conn['datapoints'][:conn['datapoints_registered']]:
+			if any(underRef(datapoint.path, part) for part in changed):
+				self.polling.pop(datapoint, None)
+			elif datapoint in self.polling or self.subscribed(tupl, datapoint.path):
+				continue
+			self.registerDatapoint(tupl, datapoint)
+
+
+	# True when ref is in a dataset of a registered rcb
+	def subscribed(self, tupl, ref):
+		if self.provisioned(tupl, ref):
+			return True
+		entry = self.findDataset(tupl, ref)
+		if entry == None:
+			return False
+		position, LD, LN, DS, Idx = entry
+		for RCB_LD, RCB_LN, RP in self.datasets(tupl)['rcbs'].get(LD + "/" + LN + "$" + DS, []):
+			if RCB_LD + "/" + RCB_LN + "." + self.connections[tupl]['model'][RCB_LD][RCB_LN][RP]["DatSet"]["FC"] + "." + RP in self.cb_refs:
+				return True
+		return False
+
+
+	# the members of a dataset to report a datapoint: "LD/LN.DO.DA[FC]" for each of its functional
+	# constraints. Empty when the datapoint cannot be reported, also when only some of its functional
+	# constraints can, so the datapoint stays polled
+	def reportMembers(self, tupl, ref):
+		node = self.lookup(tupl, ref)
+		if not node or len(ref.partition("/")[2].split(".")) < 2:
+			return []
+		fcs = [node.FC] if isinstance(node, DataAttribute) else iec61850client.functionalConstraints(node)
+		if len(fcs) == 0 or any(fcName not in REPORT_FCS for fcName in fcs):
+			return []
+		return [ref + "[" + fcName + "]" for fcName in fcs]
+
+
+	# the URCB's in the model that are not used by the gateway, those in the LD's in lds first
+	def freeRcbs(self, tupl, lds):
+		model = self.connections[tupl]['model']
+		first = []
+		other = []
+		for LD in model:
+			for LN in model[LD]:
+				for name, node in model[LD][LN].items():
+					if not isinstance(node, (dict, Node)) or not "Resv" in node or not isinstance(node["Resv"], (dict, Node)):
+						continue
+					RPT = LD + "/" + LN + ".RP." + name
+					if node["Resv"].get('FC') == "RP" and RPT not in self.cb_refs:
+						(first if LD in lds else other).append(RPT)
+		return first + other
+
+
+	# report datapoints that are not in a dataset with an rcb: the gateway creates datasets with them, and
+	# configures free URCB's to report these datasets. Returns the datapoints that are reported
+	def provisionReports(self, tupl, datapoints):
+		size = int(self.option(tupl, "auto_report_size", "50"))
+
+		# the members of a datapoint are kept in the same dataset
+		chunks = []
+		for datapoint in datapoints:
+			members = [(member, datapoint) for member in self.reportMembers(tupl, datapoint.path)]
+			if len(members) == 0:
+				continue
+			if len(chunks) == 0 or len(chunks[-1]) + len(members) > size:
+				chunks.append([])
+			chunks[-1].extend(members)
+		if len(chunks) == 0:
+			return []
+
+		rcbs = self.freeRcbs(tupl, set(datapoint.path.partition("/")[0] for datapoint in datapoints))
+		reported = []
+		for chunk in chunks:
+			while len(rcbs) > 0:
+				if self.provisionRcb(tupl, rcbs.pop(0), chunk):
+					reported.extend(dict.fromkeys(datapoint for member, datapoint in chunk))
+					break
+			else:
+				LOGGER.warning("no free rcb found on %s, %i datapoints are polled" % (tupl, len(dict.fromkeys(datapoint for member, datapoint in chunk))))
+		return reported
+
+
+	# reserve an URCB, create a dataset with the members of chunk [(member, datapoint)], and enable the
+	# rcb to report it. Returns True when the rcb is enabled
+	def provisionRcb(self, tupl, RPT, chunk):
+		conn = self.connections[tupl]
+		con = conn['con']
+		error = lib61850.IedClientError()
+		rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), RPT, None)
+		if error.value != lib61850.IED_ERROR_OK:
+			return False
+		if lib61850.ClientReportControlBlock_getResv(rcb) or lib61850.ClientReportControlBlock_getRptEna(rcb):
+			lib61850.ClientReportControlBlock_destroy(rcb)
+			return False # in use by another client
+
+		lib61850.ClientReportControlBlock_setResv(rcb, True)
+		lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RESV, True)
+		if error.value != lib61850.IED_ERROR_OK:
+			lib61850.ClientReportControlBlock_destroy(rcb)
+			return False
+
+		conn['report_datasets'] = conn.get('report_datasets', 0) + 1
+		name = REPORT_DATASET_PREFIX + str(conn['report_datasets'])
+		refdata = [chunk[0][1], tupl, None, None, name, [(datapoint.path, member[-3:-1]) for member, datapoint in chunk]]
+		RcbData = {"rcb": rcb, "RPT": RPT, "refdata": refdata, "p_ref": id(refdata), "provision": chunk}
+
+		err = iec61850client.createDataSet(con, name, [member for member, datapoint in chunk])
+		if err != lib61850.IED_ERROR_OK:
+			LOGGER.error("could not create dataset %s on %s with error: %i" % (name, tupl, err))
+			self.releaseRcb(con, RcbData, False)
+			return False
+
+		# integrity reports every auto_report_intgpd ms, so values are refreshed when a change is missed
+		intgPd = int(self.option(tupl, "auto_report_intgpd", "60000"))
+		trgOps = lib61850.TRG_OPT_GI
+		for option in self.option(tupl, "auto_report_trgops", "dchg,qchg,integrity").split(","):
+			if option.strip() in TRIGGER_OPTIONS and (option.strip() != "integrity" or intgPd > 0):
+				trgOps |= TRIGGER_OPTIONS[option.strip()]
+		lib61850.ClientReportControlBlock_setDataSetReference(rcb, name)
+		lib61850.ClientReportControlBlock_setTrgOps(rcb, trgOps)
+		lib61850.ClientReportControlBlock_setIntgPd(rcb, intgPd)
+		lib61850.ClientReportControlBlock_setOptFlds(rcb, lib61850.RPT_OPT_SEQ_NUM | lib61850.RPT_OPT_REASON_FOR_INCLUSION | lib61850.RPT_OPT_DATA_SET)
+		lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_DATSET | lib61850.RCB_ELEMENT_TRG_OPS | lib61850.RCB_ELEMENT_INTG_PD | lib61850.RCB_ELEMENT_OPT_FLDS, True)
+		if error.value != lib61850.IED_ERROR_OK:
+			LOGGER.error("could not configure %s for dataset %s with error: %i" % (RPT, name, error.value))
+			self.releaseRcb(con, RcbData, True)
+			return False
+
+		RptId = lib61850.ClientReportControlBlock_getRptId(rcb)
+		RcbData["cbh"] = lib61850.ReportCallbackFunction(self.ReportHandler_cb) # hard reference, see registerForReporting
+		lib61850.IedConnection_installReportHandler(con, RPT, RptId, RcbData["cbh"], RcbData["p_ref"])
+
+		lib61850.ClientReportControlBlock_setRptEna(rcb, True)
+		lib61850.ClientReportControlBlock_setGI(rcb, True)
+		lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_GI, True)
+		if error.value != lib61850.IED_ERROR_OK:
+			LOGGER.error("could not enable %s with error: %i" % (RPT, error.value))
+			lib61850.IedConnection_uninstallReportHandler(con, RPT)
+			self.releaseRcb(con, RcbData, True)
+			return False
+
+		self.cb_refs.append(RPT)
+		self.reporting.setdefault(tupl, []).append(RcbData)
+		LOGGER.info("RPT %s configured with dataset %s for %i datapoints" % (RPT, name, len(dict.fromkeys(datapoint for member, datapoint in chunk))))
+		return True
+
+
+	# disable and release an rcb configured by the gateway, and delete its dataset when it was created
+	def releaseRcb(self, con, RcbData, deleteDataSet):
+		error = lib61850.IedClientError()
+		rcb = RcbData["rcb"]
+		lib61850.ClientReportControlBlock_setRptEna(rcb, False)
+		lib61850.ClientReportControlBlock_setResv(rcb, False)
+		lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_RESV, True)
+		if deleteDataSet:
+			lib61850.IedConnection_deleteDataSet(con, ctypes.byref(error), RcbData["refdata"][4])
+		lib61850.ClientReportControlBlock_destroy(rcb)
+
+
+	# remove an rcb configured by the gateway from the registrations, and release it on the IED when connected
+	def unprovision(self, tupl, RcbData, connected):
+		con = self.connections[tupl]["con"]
+		lib61850.IedConnection_uninstallReportHandler(con, RcbData["RPT"])
+		if connected:
+			self.releaseRcb(con, RcbData, True)
+		else:
+			lib61850.ClientReportControlBlock_destroy(RcbData["rcb"])
+		self.reporting[tupl].remove(RcbData)
+		if RcbData["RPT"] in self.cb_refs:
+			self.cb_refs.remove(RcbData["RPT"])
+
+
+	# True when ref is reported by an rcb configured by the gateway
+	def provisioned(self, tupl, ref):
+		for refdata in self.reporting.get(tupl, []):
+			if "provision" in refdata and ref in [path for path, fcName in refdata["refdata"][5]]:
+				return True
+		return False
+
+
+	# enable the registered rcb's of an IED again, after a reconnect
+	def enableReports(self, tupl):
+		con = self.connections[tupl]["con"]
+		if tupl in self.reporting and len(self.reporting[tupl]) > 0:
+			for refdata in list(self.reporting[tupl]):
+				if "provision" in refdata:
+					# the dataset and reservation were removed with the previous connection
+					self.unprovision(tupl, refdata, False)
+					datapoints = list(dict.fromkeys(datapoint for member, datapoint in refdata["provision"]))
+					reported = self.provisionReports(tupl, datapoints)
+					for datapoint in datapoints:
+						if datapoint not in reported:
+							self.polling[datapoint] = 1
+					continue
+				error = lib61850.IedClientError()
+				# the rcb of the registration is updated with the values read from the IED
+				rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), refdata["RPT"], refdata["rcb"])
+				if error.value != lib61850.IED_ERROR_OK:
+					LOGGER.error("could not retrieve RCBValues")
+					continue
+				RptId = lib61850.ClientReportControlBlock_getRptId(rcb)
+				lib61850.IedConnection_installReportHandler(con, refdata["RPT"], RptId, refdata["cbh"], id(refdata["refdata"]))
+
+				lib61850.ClientReportControlBlock_setRptEna(rcb, True)
+				lib61850.ClientReportControlBlock_setGI(rcb, True)
+				lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_GI, False)
+				if error.value != lib61850.IED_ERROR_OK:
+					LOGGER.error("could not write RCBValues")
+					continue
+				refdata["rcb"] = rcb
+
+
 	def connection_worker_thread(self):
 		while not self.stop_event.is_set():
-			# iterate over self.connections
-			for tupl in self.connections.keys():
+			# start a connection step for each IED that has none in progress, so a slow connect or
+			# discovery of one IED does not delay the others
+			for tupl in list(self.connections.keys()):
 				if tupl not in self.connection_locks:
 					continue
+				task = self.connection_tasks.get(tupl)
+				if task != None and not task.done():
+					continue
+				self.connection_tasks[tupl] = self.connection_pool.submit(self.connection_step, tupl)
+			time.sleep(1.0)
 
-				with self.connection_locks[tupl]:
-					if self.connections[tupl]["con"] != None:
-						if self.connections[tupl]["model"]:
-							#we have a connection and a model
-
-							if len(self.connections[tupl]['datapoints']) > self.connections[tupl]['datapoints_registered']:
-								con = self.connections[tupl]['con']
-								model = self.connections[tupl]['model']
-
-								start = self.connections[tupl]['datapoints_registered']  # number already done
-								for datapoint in self.connections[tupl]['datapoints'][start:]:
-									uri_ref = urlparse(datapoint)
-
-									#check if the ref exists in the model
-									submodel, path = iec61850client.parseRef(model, uri_ref.path[1:])
-									if submodel:
-										rpt = self.registerForReporting(datapoint, tupl, uri_ref.path[1:])
-										if rpt == False:
-											# fallback to periodic poll when no report+dataset configured
-											#if we allready have it in the list
-											self.polling[datapoint] = 1
-									else:
-										LOGGER.error("could not find %s in model" % uri_ref.path[1:])
-									self.connections[tupl]['datapoints_registered'] += 1
-							continue
-						else:
-							con = self.connections[tupl]["con"]
-							LOGGER.info("discovery: %s" % tupl)
-							self.getDataModel(tupl)
-							continue
-					# else, con == None
-					con = lib61850.IedConnection_create()
-					self.connections[tupl]['datapoints_registered'] = 0 # reset the registered datapoints
-					self.connections[tupl]["model"] = {}
-
-					#		/* To change MMS parameters you need to get access to the underlying MmsConnection */
-					#mmsConnection = lib61850.IedConnection_getMmsConnection(con)
-					#    /* Get the container for the parameters */
-					#parameters = lib61850.MmsConnection_getIsoConnectionParameters(mmsConnection)
-					#    /* set remote AP-Title according to SCL file example from IEC 61850-8-1 */
-					#lib61850.IsoConnectionParameters_setRemoteApTitle(parameters, "1.3.9999.13", 12)
-					#    /* just some arbitrary numbers */
-					#lib61850.IsoConnectionParameters_setLocalApTitle(parameters, "1.2.1200.15.3", 1);
-					#    /* use this to skip AP-Title completely - this may be required by some "obscure" servers */
-					#lib61850.IsoConnectionParameters_setRemoteApTitle(parameters, None, 0);
-					#lib61850.IsoConnectionParameters_setLocalApTitle(parameters, None, 0);
-
-					#    TSelector localTSelector = { 3, { 0x00, 0x01, 0x02 } };
-					localTSelector = lib61850.TSelector(
-							size=3,
-							value=(ctypes.c_uint8 * 4)(0x00, 0x01, 0x02, 0x00)  # last element padded
-						)
-					#    TSelector remoteTSelector = { 2, { 0x00, 0x01 } };
-					remoteTSelector = lib61850.TSelector(
-							size=2,
-							value=(ctypes.c_uint8 * 4)(0x00, 0x01, 0x00, 0x00)  # last 2 elements padded
-						)
-					#    SSelector remoteSSelector = { 2, { 0, 1 } };
-					remoteSSelector = lib61850.SSelector(
-							size=2,
-							value=(ctypes.c_uint8 * 16)(0x00, 0x01, *([0x00] * 14))  # last 14 elements padded
-						)
-					#    SSelector localSSelector = { 5, { 0, 1, 2, 3, 4 } };
-					localSSelector = lib61850.SSelector(
-							size=5,
-							value=(ctypes.c_uint8 * 16)(0x00, 0x01, 0x02, 0x03, 0x04, *([0x00] * 11))  # last 11 elements padded
-						)
-					#    PSelector localPSelector = {4, { 0x12, 0x34, 0x56, 0x78 } };
-					localPSelector = lib61850.PSelector(
-							size=4,
-							value=(ctypes.c_uint8 * 16)(0x12, 0x34, 0x56, 0x78, *([0x00] * 12))  # 
-						)
-					#    PSelector remotePSelector = {4, { 0x87, 0x65, 0x43, 0x21 } };
-					remotePSelector = lib61850.PSelector(
-							size=4,
-							value=(ctypes.c_uint8 * 16)(0x87, 0x65, 0x43, 0x21, *([0x00] * 12))  # 
-						)
-					#    /* change parameters for presentation, session and transport layers */
-					#lib61850.IsoConnectionParameters_setRemoteAddresses(parameters, remotePSelector, remoteSSelector, localTSelector)
-					#lib61850.IsoConnectionParameters_setLocalAddresses(parameters, localPSelector, localSSelector, remoteTSelector)
-				
-					#
-					#    /* use authentication */
-					#auth = lib61850.AcseAuthenticationParameter_create();
-					#lib61850.AcseAuthenticationParameter_setAuthMechanism(auth, lib61850.ACSE_AUTH_PASSWORD);
-					#password = "user1@testpw";
-					#lib61850.AcseAuthenticationParameter_setPassword(auth, password);
-					#lib61850.IsoConnectionParameters_setAcseAuthenticationParameter(parameters, auth);
-					#lib61850.IedConnection_setConnectTimeout(con, 10000);
 
+	# connect, discover and register the datapoints of one IED, one step per call
+	def connection_step(self, tupl):
+		try:
+			with self.connection_locks[tupl]:
+				self.connection_state(tupl)
+		except Exception as e:
+			LOGGER.exception("connection step of %s failed: %s" % (tupl, e))
+
+
+	# subscribe a datapoint to a report, or poll it when it is not in a dataset with an rcb
+	def registerDatapoint(self, tupl, datapoint):
+		#check if the ref exists in the model
+		submodel = self.lookup(tupl, datapoint.path)
+		if submodel:
+			rpt = self.registerForReporting(datapoint, tupl, datapoint.path)
+			if rpt == False and not self.provisioned(tupl, datapoint.path):
+				# fallback to periodic poll when no report+dataset configured
+				#if we allready have it in the list
+				self.polling[datapoint] = 1
+		else:
+			LOGGER.error("could not find %s in model" % datapoint.path)
+
+
+	# the next step for an IED: connect, discover or refresh the model, or register new datapoints
+	def connection_state(self, tupl):
+		if self.connections[tupl]["con"] != None:
+			if self.connections[tupl]["model"] and self.connections[tupl].get("refresh"):
+				# reconnected with the model of the previous connection
+				if self.refreshModel(tupl) == None:
+					LOGGER.error("could not refresh model of %s" % tupl)
+					self.closeConnection(tupl)
+					return
+				self.connections[tupl]["refresh"] = False
+				return
+			if self.connections[tupl]["model"]:
+				#we have a connection and a model
+
+				if len(self.connections[tupl]['datapoints']) > self.connections[tupl]['datapoints_registered']:
+					con = self.connections[tupl]['con']
+					model = self.connections[tupl]['model']
+
+					start = self.connections[tupl]['datapoints_registered']  # number already done
+					if self.option(tupl, "discovery", "full") == "scoped":
+						# expand the model with the parts needed by newly registered references
+						scope = iec61850client.discoveryScope(self.connections[tupl]['datapoints'][start:])
+						model = iec61850client.scopedDiscovery(con, scope, model, self.option(tupl, "discovery_read", READ_BULK))
+						self.connections[tupl].pop('datasets_model', None)  # datasets and rcbs may have been added
+						self.indexModel(tupl)
+						self.saveModel(tupl)
+					for datapoint in self.connections[tupl]['datapoints'][start:]:
+						self.registerDatapoint(tupl, datapoint)
+						self.connections[tupl]['datapoints_registered'] += 1
+					if self.optionBool(tupl, "auto_report"):
+						# report the datapoints that would be polled with rcb's configured by the gateway
+						polled = [datapoint for datapoint in self.connections[tupl]['datapoints'][start:] if datapoint in self.polling]
+						for datapoint in self.provisionReports(tupl, polled):
+							self.polling.pop(datapoint, None)
+				return
+			else:
+				con = self.connections[tupl]["con"]
+				LOGGER.info("discovery: %s" % tupl)
+				self.getDataModel(tupl)
+				return
+		# else, con == None: connect asynchronously, the state changed handler updates the state
+		handle = self.connectionHandle(tupl)
+		state = self.connections[tupl]["state"]
+		if state == lib61850.IED_STATE_CONNECTED:
+			# store the active connection
+			self.connections[tupl]["con"] = handle
+			# the datasets of the previous connection do not exist anymore
+			self.removePollDataSets(tupl, False)
+			# read the model on next iteration
+			LOGGER.info("connected: %s" % str(tupl))
+			return
+		if state != lib61850.IED_STATE_CLOSED:
+			return # connecting or closing, nothing to do until the state changes
 
-					error = lib61850.IedClientError()
-					host,port  = tupl.split(":")
-					#LOGGER.info("connecting: %s" % str(tupl))
-					lib61850.IedConnection_connect(con,ctypes.byref(error), host, int(port))
-					if error.value == lib61850.IED_ERROR_OK:
-						# store the active connection
-						self.connections[tupl]["con"] = con
-						# read the model on next iteration
-						LOGGER.info("connected: %s" % str(tupl))
-					else:
-						LOGGER.debug("error: could not connect to %s" % str(tupl))
-						self.connections[tupl]["con"] = None
-						lib61850.IedConnection_destroy(con)
-					# connection_lock
-				# for loop end
-			time.sleep(1.0)
+		if self.option(tupl, "refresh", "full") == "incremental" and self.connections[tupl]["model"]:
+			# keep the model and registered datapoints, only the changes are discovered after connecting
+			self.connections[tupl]["refresh"] = True
+		else:
+			self.connections[tupl]['datapoints_registered'] = 0 # reset the registered datapoints
+			self.connections[tupl]["model"] = {}
+
+		error = lib61850.IedClientError()
+		host,port  = tupl.split(":")
+		#LOGGER.info("connecting: %s" % str(tupl))
+		self.connections[tupl]["state"] = lib61850.IED_STATE_CONNECTING
+		lib61850.IedConnection_connectAsync(handle, ctypes.byref(error), host, int(port))
+		if error.value != lib61850.IED_ERROR_OK:
+			LOGGER.debug("error: could not connect to %s" % str(tupl))
+			self.connections[tupl]["state"] = lib61850.IED_STATE_CLOSED
+
+
+	# the IedConnection of an IED, created once and reused for each connect
+	def connectionHandle(self, tupl):
+		conn = self.connections[tupl]
+		if conn.get("handle") != None:
+			return conn["handle"]
+		con = lib61850.IedConnection_create()
+
+		#		/* To change MMS parameters you need to get access to the underlying MmsConnection */
+		#mmsConnection = lib61850.IedConnection_getMmsConnection(con)
+		#    /* Get the container for the parameters */
+		#parameters = lib61850.MmsConnection_getIsoConnectionParameters(mmsConnection)
+		#    /* set remote AP-Title according to SCL file example from IEC 61850-8-1 */
+		#lib61850.IsoConnectionParameters_setRemoteApTitle(parameters, "1.3.9999.13", 12)
+		#    /* just some arbitrary numbers */
+		#lib61850.IsoConnectionParameters_setLocalApTitle(parameters, "1.2.1200.15.3", 1);
+		#    /* use this to skip AP-Title completely - this may be required by some "obscure" servers */
+		#lib61850.IsoConnectionParameters_setRemoteApTitle(parameters, None, 0);
+		#lib61850.IsoConnectionParameters_setLocalApTitle(parameters, None, 0);
+
+		#    TSelector localTSelector = { 3, { 0x00, 0x01, 0x02 } };
+		localTSelector = lib61850.TSelector(
+				size=3,
+				value=(ctypes.c_uint8 * 4)(0x00, 0x01, 0x02, 0x00)  # last element padded
+			)
+		#    TSelector remoteTSelector = { 2, { 0x00, 0x01 } };
+		remoteTSelector = lib61850.TSelector(
+				size=2,
+				value=(ctypes.c_uint8 * 4)(0x00, 0x01, 0x00, 0x00)  # last 2 elements padded
+			)
+		#    SSelector remoteSSelector = { 2, { 0, 1 } };
+		remoteSSelector = lib61850.SSelector(
+				size=2,
+				value=(ctypes.c_uint8 * 16)(0x00, 0x01, *([0x00] * 14))  # last 14 elements padded
+			)
+		#    SSelector localSSelector = { 5, { 0, 1, 2, 3, 4 } };
+		localSSelector = lib61850.SSelector(
+				size=5,
+				value=(ctypes.c_uint8 * 16)(0x00, 0x01, 0x02, 0x03, 0x04, *([0x00] * 11))  # last 11 elements padded
+			)
+		#    PSelector localPSelector = {4, { 0x12, 0x34, 0x56, 0x78 } };
+		localPSelector = lib61850.PSelector(
+				size=4,
+				value=(ctypes.c_uint8 * 16)(0x12, 0x34, 0x56, 0x78, *([0x00] * 12))  # 
+			)
+		#    PSelector remotePSelector = {4, { 0x87, 0x65, 0x43, 0x21 } };
+		remotePSelector = lib61850.PSelector(
+				size=4,
+				value=(ctypes.c_uint8 * 16)(0x87, 0x65, 0x43, 0x21, *([0x00] * 12))  # 
+			)
+		#    /* change parameters for presentation, session and transport layers */
+		#lib61850.IsoConnectionParameters_setRemoteAddresses(parameters, remotePSelector, remoteSSelector, localTSelector)
+		#lib61850.IsoConnectionParameters_setLocalAddresses(parameters, localPSelector, localSSelector, remoteTSelector)
+				
+		#
+		#    /* use authentication */
+		#auth = lib61850.AcseAuthenticationParameter_create();
+		#lib61850.AcseAuthenticationParameter_setAuthMechanism(auth, lib61850.ACSE_AUTH_PASSWORD);
+		#password = "user1@testpw";
+		#lib61850.AcseAuthenticationParameter_setPassword(auth, password);
+		#lib61850.IsoConnectionParameters_setAcseAuthenticationParameter(parameters, auth);
+
+		lib61850.IedConnection_setConnectTimeout(con, int(self.option(tupl, "connect_timeout", "10000")))
+		# the outstanding calls proposed to the IED are only changed from the library default when needed
+		if self.option(tupl, "max_outstanding") or self.option(tupl, "poll_mode", POLL_SINGLE) == POLL_PIPELINED:
+			outstanding = int(self.option(tupl, "max_outstanding", "5"))
+			lib61850.IedConnection_setMaxOutstandingCalls(con, outstanding, outstanding)
+		if self.option(tupl, "request_timeout"):
+			lib61850.IedConnection_setRequestTimeout(con, int(self.option(tupl, "request_timeout")))
+
+		# keep a reference to the callback, so it is not cleaned up by the garbage collector
+		conn["state_cb"] = lib61850.IedConnection_StateChangedHandler(
+			lambda parameter, connection, state: self.connectionStateChanged(tupl, state))
+		lib61850.IedConnection_installStateChangedHandler(con, conn["state_cb"], None)
+		conn["handle"] = con
+		return con
+
+
+	# called by libiec61850 when the state of a connection changes
+	def connectionStateChanged(self, tupl, state):
+		conn = self.connections[tupl]
+		conn["state"] = state
+		LOGGER.debug("connection state of %s: %i" % (tupl, state))
+		if state == lib61850.IED_STATE_CLOSED and conn["con"] != None:
+			LOGGER.info("connection lost: %s" % tupl)
+			conn["con"] = None
+
+
+	# drop the connection of an IED, it is reconnected by the connection worker with the same handle
+	def closeConnection(self, tupl):
+		conn = self.connections[tupl]
+		con = conn["con"]
+		conn["con"] = None
+		if con != None and lib61850.IedConnection_getState(con) == lib61850.IED_STATE_CONNECTED:
+			lib61850.IedConnection_close(con)
 
 
 	# retrieve an active connection to IED, and up to date datamodel, stored in 'connections'
@@ -752,6 +1701,8 @@ class iec61850client(abstract_client):
 
 			self.connections[tupl] = {
 				"con": None,
+				"handle": None,
+				"state": lib61850.IED_STATE_CLOSED,
 				"model": {},
 				"datapoints": [],
 				"datapoints_registered": 0
@@ -780,23 +1731,20 @@ class iec61850client(abstract_client):
 			
 	# write a value to an active connection
 	def registerWriteValue(self, ref, value):
-		uri_ref = urlparse(ref)
-		port = uri_ref.port
-		if port == "" or port == None:
-			port = 102
+		uri_ref = parse_ref(ref)
 
 		if uri_ref.scheme != "iec61850":
 			LOGGER.error("incorrect scheme, only iec61860 is supported, not %s" % uri_ref.scheme)
 			return -1
 
-		if uri_ref.hostname == None:
+		if uri_ref.host == None:
 			LOGGER.error("missing hostname: %s" % ref)
 			return -1
 
-		tupl = uri_ref.hostname + ":" + str(port)
+		tupl = uri_ref.key
 
 		#check if connection is active, or reconnect
-		err = self.getIED(uri_ref.hostname, port)
+		err = self.getIED(uri_ref.host, uri_ref.port)
 		if err == 0:
 			con = self.connections[tupl]['con']
 			if not con:
@@ -809,10 +1757,10 @@ class iec61850client(abstract_client):
 				return -1
 			
 			#todo:check if needed
-			model, error = iec61850client.writeValue(con, model, uri_ref.path[1:], value)
+			model, error = iec61850client.writeValue(con, model, uri_ref.path, value)
 			if error == 0:
 				self.connections[tupl]['model'] = model
-				submodel, path = iec61850client.parseRef(model,uri_ref.path[1:]) #get value from model via ref
+				submodel = self.lookup(tupl, uri_ref.path) #get value from model via ref
 				LOGGER.debug("Value '%s' written to %s" % (str(submodel), ref) )
 
 				if self.readvaluecallback != None:
@@ -822,34 +1770,29 @@ class iec61850client(abstract_client):
 			else:
 				LOGGER.error("could not write '%s' to %s with error: %i" % (str(value), ref, error))
 				if error == 3: #we lost the connection
-					lib61850.IedConnection_destroy(con)
-					self.connections[tupl]['con'] = None
+					self.closeConnection(tupl)
 				return error
 		else:
-			LOGGER.error("no connection to IED: %s:%s" % (uri_ref.hostname, port) )
+			LOGGER.error("no connection to IED: %s" % tupl )
 		return -1
 
 
 	# read a value from an active connection
 	def ReadValue(self, ref):
-		uri_ref = urlparse(ref)
-		port = uri_ref.port
-		if port == "" or port == None:
-			port = 102
+		uri_ref = parse_ref(ref)
 
 		if uri_ref.scheme != "iec61850":
 			LOGGER.error("incorrect scheme, only iec61860 is supported, not %s" % uri_ref.scheme)
 			return {}, -1
 
-		if uri_ref.hostname == None:
+		if uri_ref.host == None:
 			LOGGER.error("missing hostname: %s" % ref)
 			return {}, -1
 
-		tupl = uri_ref.hostname + ":" + str(port)
-
+		tupl = uri_ref.key
 
 		#check if connection is active, or reconnect
-		err = self.getIED(uri_ref.hostname, port)
+		err = self.getIED(uri_ref.host, uri_ref.port)
 		if err == 0:
 			con = self.connections[tupl]['con']
 			if not con:
@@ -861,12 +1804,10 @@ class iec61850client(abstract_client):
 				LOGGER.error("no valid model")
 				return {}, -1
 
-			submodel, path = iec61850client.parseRef(model, uri_ref.path[1:])
+			submodel = self.lookup(tupl, uri_ref.path)
 			if submodel: #ref exists in model
-				model, error = iec61850client.updateValueInModel(con, model, uri_ref.path[1:])
+				submodel, error = self.readRef(tupl, uri_ref.path)
 				if error == 0:
-					self.connections[tupl]['model'] = model
-					submodel, path = iec61850client.parseRef(model, uri_ref.path[1:])
 					LOGGER.debug("Value '%s' read from %s" % (str(submodel), ref) )
 
 					if self.readvaluecallback != None:
@@ -876,12 +1817,11 @@ class iec61850client(abstract_client):
 				else:
 					LOGGER.error("could not read '%s' with error: %i" % (ref, error))
 					if error == 3: #we lost the connection
-						lib61850.IedConnection_destroy(con)
-						self.connections[tupl]['con'] = None
+						self.closeConnection(tupl)
 			else:
-				LOGGER.error("could not find %s in model" % uri_ref.path[1:])
+				LOGGER.error("could not find %s in model" % uri_ref.path)
 		else:
-			LOGGER.error("no connection to IED: %s:%s" % (uri_ref.hostname, port) )
+			LOGGER.error("no connection to IED: %s" % tupl )
 		return {}, -1
 
 	def ReportHandler_cb(self, param, report):
@@ -899,28 +1839,40 @@ class iec61850client(abstract_client):
 		DSRef = refdata[4]
 
 		a = lib61850.ClientReport_getRcbReference(report)
+		REPORTS.inc(tupl, str(a))
 		b = lib61850.ClientReport_getRptId(report)
 		reason = lib61850.ClientReport_getReasonForInclusion(report, 0)
 		d = lib61850.ReasonForInclusion_getValueAsString(reason)
 		#print("Callback: RTP received report for %s with rptId %s, DSRef %s and inclusion: %s" % ( a,b,DSRef,d ) )
 		
 		dataSetValues = lib61850.ClientReport_getDataSetValues(report)
-		dataset = self.connections[tupl]['model'][LD][LN][DSRef]
-		for index in dataset:
-			reason = lib61850.ClientReport_getReasonForInclusion(report, int(index))
+		if len(refdata) > 5:
+			# a dataset created by the gateway, with the reference and FC of its members
+			members = refdata[5]
+		else:
+			dataset = self.connections[tupl]['model'][LD][LN][DSRef]
+			members = [(dataset[index]['value'], None) for index in dataset]
+		for index in range(len(members)):
+			reason = lib61850.ClientReport_getReasonForInclusion(report, index)
 			if reason != lib61850.IEC61850_REASON_NOT_INCLUDED:
-				mmsval = lib61850.MmsValue_getElement(dataSetValues, int(index))
-				DaRef = dataset[index]['value']
+				mmsval = lib61850.MmsValue_getElement(dataSetValues, index)
+				DaRef, fcName = members[index]
 				if DaRef != "" and tupl != "":
-					key = "iec61850://" + tupl + "/" + DaRef
+					key = parse_ref("iec61850://" + tupl + "/" + DaRef)
 				else:
 					LOGGER.error(f"could not generate from tupl and daref. will use: {key} (is only the first dset entry)")
 
-				val, _type = iec61850client.printValue(mmsval)
-				LOGGER.debug(DaRef + ":" + val + "(" + _type + ")")
-
-				submodel, _ = iec61850client.parseRef(self.connections[tupl]['model'],DaRef)
-				submodel["value"] = val
+				submodel = self.lookup(tupl, DaRef)
+				if fcName != None:
+					# a DA, or the attributes of a DO with this FC
+					if not iec61850client.storeValue(submodel, fcName, mmsval):
+						LOGGER.error("report value of %s[%s] does not match the model" % (DaRef, fcName))
+						continue
+				elif isinstance(submodel, DataAttribute):
+					submodel.set(*iec61850client.typedValue(mmsval))
+				else:
+					submodel["value"], _type = iec61850client.printValue(mmsval)
+				LOGGER.debug(DaRef + ":" + str(submodel))
 				
 				if self.Rpt_cb != None:
 					self.Rpt_cb(key, submodel)
@@ -928,99 +1880,78 @@ class iec61850client(abstract_client):
 
 	def registerForReporting(self, key, tupl, ref):
 		# check if present in dataset/report, and subscribe 
-		LD = ""
-		LN = ""
-		DS = ""
-		Idx = ""
 		con = self.connections[tupl]['con']
 		model = self.connections[tupl]['model']
 
-		class BreakIt(Exception): pass
-
-		try:
-			for LD_name in model:
-				for LN_name in model[LD_name]:
-					for DSname in model[LD_name][LN_name]:
-						if ( "0" in model[LD_name][LN_name][DSname] and 
-								"reftype" in model[LD_name][LN_name][DSname]["0"] and 
-								model[LD_name][LN_name][DSname]["0"]['reftype'] == "DX" ):
-							for index in model[LD_name][LN_name][DSname]:
-								if ref.startswith(model[LD_name][LN_name][DSname][index]['value']):
-									LOGGER.info("DATASET found! Ref:%s in DSref: %s" % (ref, model[LD_name][LN_name][DSname][index]['value']))
-									LOGGER.info("  DSRef:%s" % LD_name + "/" + LN_name + "." + DSname )
-									LD = LD_name
-									LN = LN_name
-									DS = DSname
-									Idx = index
-									raise BreakIt
-		except BreakIt:
-			pass
-
-		if Idx == "":
+		entry = self.findDataset(tupl, ref)
+		if entry == None:
 			LOGGER.error("RPT: could not find dataset for ref: %s" % ref)
 			return False
 
-		for RP in model[LD][LN]:
-			if "DatSet" in model[LD][LN][RP] and model[LD][LN][RP]["DatSet"]["value"] == LD + "/" + LN + "$" + DS:
-				LOGGER.info("RPT found! Ref:%s" % LD + "/" + LN + "." + RP)
-				RPT = LD + "/" + LN + "." + model[LD][LN][RP]["DatSet"]["FC"] + "." + RP
-
-				error = lib61850.IedClientError()
-				if RPT in self.cb_refs:
-					LOGGER.info("RPT allready registered")
-					rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), RPT, None)
-					if error.value != lib61850.IED_ERROR_OK:
-						LOGGER.error("could not retrieve RCBValues for allready registered RCB, maybe RCB is not enabled")
-						return True
-					
-					if lib61850.ClientReportControlBlock_getRptEna(rcb):
-						LOGGER.info("RPT allready enabled")
-					else:
-						LOGGER.info("RPT disabled")
-					return True
+		position, LD, LN, DS, Idx = entry
+		LOGGER.info("DATASET found! Ref:%s in DSref: %s" % (ref, model[LD][LN][DS][Idx]['value']))
+		LOGGER.info("  DSRef:%s" % LD + "/" + LN + "." + DS )
 
+		for RCB_LD, RCB_LN, RP in self.datasets(tupl)['rcbs'].get(LD + "/" + LN + "$" + DS, []):
+			LOGGER.info("RPT found! Ref:%s" % RCB_LD + "/" + RCB_LN + "." + RP)
+			RPT = RCB_LD + "/" + RCB_LN + "." + model[RCB_LD][RCB_LN][RP]["DatSet"]["FC"] + "." + RP
 
+			error = lib61850.IedClientError()
+			if RPT in self.cb_refs:
+				LOGGER.info("RPT allready registered")
 				rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), RPT, None)
 				if error.value != lib61850.IED_ERROR_OK:
-					LOGGER.error("could not retrieve RCBValues for unregistered RCB")
-					continue
+					LOGGER.error("could not retrieve RCBValues for allready registered RCB, maybe RCB is not enabled")
+					return True
+				
+				if lib61850.ClientReportControlBlock_getRptEna(rcb):
+					LOGGER.info("RPT allready enabled")
+				else:
+					LOGGER.info("RPT disabled")
+				return True
 
-				RptId = lib61850.ClientReportControlBlock_getRptId(rcb)
 
-				cbh = lib61850.ReportCallbackFunction(self.ReportHandler_cb)
+			rcb = lib61850.IedConnection_getRCBValues(con, ctypes.byref(error), RPT, None)
+			if error.value != lib61850.IED_ERROR_OK:
+				LOGGER.error("could not retrieve RCBValues for unregistered RCB")
+				continue
 
-				refdata = [key, tupl, LD, LN, DS]
-				p_ref = id(refdata) #model[LD][LN][DS])# bytes(str(LD + "/" + LN + "." + DS).encode('utf-8')) # ctypes.c_char_p( ref )
-				lib61850.IedConnection_installReportHandler(con, RPT, RptId, cbh, p_ref)
-				
-				#lib61850.ClientReportControlBlock_setResv(rcb, True)
-				if lib61850.ClientReportControlBlock_getRptEna(rcb) == True:
-					LOGGER.info("RPT allready enabled by another client")
-					continue
+			RptId = lib61850.ClientReportControlBlock_getRptId(rcb)
 
-				self.cb_refs.append(RPT)
+			cbh = lib61850.ReportCallbackFunction(self.ReportHandler_cb)
 
-				#register rcb on this connection, so it can be enabled on a reconnect
-				RcbData = {}
-				RcbData["rcb"] = rcb
-				RcbData["cbh"] = cbh # hard reference to ensure this pointer is not cleaned by the garbage collector
-				RcbData["RPT"] = RPT # ref to report
-				RcbData["refdata"] = refdata # hard ref to dataset
-				RcbData["p_ref"] = p_ref
+			refdata = [key, tupl, LD, LN, DS]
+			p_ref = id(refdata) #model[LD][LN][DS])# bytes(str(LD + "/" + LN + "." + DS).encode('utf-8')) # ctypes.c_char_p( ref )
+			lib61850.IedConnection_installReportHandler(con, RPT, RptId, cbh, p_ref)
+			
+			#lib61850.ClientReportControlBlock_setResv(rcb, True)
+			if lib61850.ClientReportControlBlock_getRptEna(rcb) == True:
+				LOGGER.info("RPT allready enabled by another client")
+				continue
 
-				if not tupl in self.reporting:
-					self.reporting [tupl] = []
-				self.reporting[tupl].append(RcbData)
+			self.cb_refs.append(RPT)
 
-				LOGGER.info("RPT registered succesfull")
+			#register rcb on this connection, so it can be enabled on a reconnect
+			RcbData = {}
+			RcbData["rcb"] = rcb
+			RcbData["cbh"] = cbh # hard reference to ensure this pointer is not cleaned by the garbage collector
+			RcbData["RPT"] = RPT # ref to report
+			RcbData["refdata"] = refdata # hard ref to dataset
+			RcbData["p_ref"] = p_ref
 
-				lib61850.ClientReportControlBlock_setRptEna(rcb, True)
-				lib61850.ClientReportControlBlock_setGI(rcb, True)
-				lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_GI, True)
-				if error.value != lib61850.IED_ERROR_OK:
-					LOGGER.error("could not write RCBValues for newly registered RCB") # not sure if this should use continue, return True or return False
+			if not tupl in self.reporting:
+				self.reporting [tupl] = []
+			self.reporting[tupl].append(RcbData)
 
-				return True
+			LOGGER.info("RPT registered succesfull")
+
+			lib61850.ClientReportControlBlock_setRptEna(rcb, True)
+			lib61850.ClientReportControlBlock_setGI(rcb, True)
+			lib61850.IedConnection_setRCBValues(con, ctypes.byref(error), rcb, lib61850.RCB_ELEMENT_RPT_ENA | lib61850.RCB_ELEMENT_GI, True)
+			if error.value != lib61850.IED_ERROR_OK:
+				LOGGER.error("could not write RCBValues for newly registered RCB") # not sure if this should use continue, return True or return False
+
+			return True
 		LOGGER.error("could not find report for dataset")
 		return False
 
@@ -1033,82 +1964,502 @@ class iec61850client(abstract_client):
 			LOGGER.debug("reference: %s allready registered" % ref)
 			return 0
 
-		uri_ref = urlparse(ref)
-		port = uri_ref.port
-		if port == "" or port == None:
-			port = 102
-
+		uri_ref = parse_ref(ref)
 
 		if uri_ref.scheme != "iec61850":
 			LOGGER.error("incorrect scheme, only iec61860 is supported, not %s" % uri_ref.scheme)
 			return -1
 
-		if uri_ref.hostname == None:
+		if uri_ref.host == None:
 			LOGGER.error("missing hostname: %s" % ref)
 			return -1
 
-		tupl = uri_ref.hostname + ":" + str(port)
+		tupl = uri_ref.key
 
 		#add ied if not known yet and ref
-		err = self.getIED(uri_ref.hostname, port)
+		err = self.getIED(uri_ref.host, uri_ref.port)
 		with self.connection_locks[tupl]: # connection_locks[tupl] and connections[tupl] will exist due to getIED creating it, if its not there yet
-			self.connections[tupl]['datapoints'].append(ref)
+			self.connections[tupl]['datapoints'].append(uri_ref)
 		return 0
 
 
-	# retrieve all registered values by polling
-	def poll(self):
-		for key in list(self.polling):
-			uri_ref = urlparse(key)
+	# retrieve registered values by polling, refs limits the poll to these references (all when None)
+	def poll(self, refs = None):
+		if refs == None:
+			refs = list(self.polling)
 
-			port = uri_ref.port
-			if port == "" or port == None:
-				port = 102
+		# keys in self.polling are DataRef's, as stored by the connection worker
+		ieds = {}
+		for key in refs:
+			if not key in self.polling:
+				continue # reported, or not (yet) registered for polling
+			ieds.setdefault(key.key, []).append(key)
+
+		for tupl, keys in ieds.items():
+			#check if connection is active, or reconnect
+			err = self.getIED(keys[0].host, keys[0].port)
+			if err == 0 and self.connections[tupl]['con'] and self.connections[tupl]['model']:
+				keys = self.pollGrouped(tupl, keys)
+			for key in keys:
+				self.pollRef(tupl, key, err)
+
+
+	# poll a datapoint with its own read
+	def pollRef(self, tupl, key, err):
+		if err == 0:
+			con = self.connections[tupl]['con']
+			model = self.connections[tupl]['model']
+			if con and model:
+				start = time.monotonic()
+				submodel, err = self.readRef(tupl, key.path)
+				POLL_SECONDS.observe(tupl, value=time.monotonic() - start)
+				if err == 0:
+					LOGGER.debug("value:%s read from key: %s" % (str(submodel), key))
+					#call function with ref+value
+					if self.readvaluecallback != None:
+						self.readvaluecallback(key, submodel)
 
+				else:
+					POLL_ERRORS.inc(tupl)
+					LOGGER.error("model not updated for %s with error: %i" % (key, err))
+					if err == 3: #we lost the connection
+						self.closeConnection(tupl)
+			else:
+				LOGGER.debug("no connection or model")
 
-			if uri_ref.scheme != "iec61850":
-				LOGGER.error("incorrect scheme, only iec61860 is supported, not %s" % uri_ref.scheme)
+		else:
+			POLL_ERRORS.inc(tupl)
+			LOGGER.debug("IED not available for %s with error: %i" % (key, err))
+
+
+	# group the polled datapoints of an IED by their DO and functional constraint, so a DO with multiple
+	# polled attributes is read once. With lnGroups, the DO's of a LN are read at once when several of them
+	# are polled, and they are at least LN_GROUP_RATIO of the DO's of the LN with that functional constraint.
+	# Returns [(ref, node, FC, keys)] with the reference and node to read, and the keys that are not in
+	# the model or not below a DO
+	def pollPlan(self, tupl, keys, lnGroups=True):
+		groups = {}
+		single = []
+		for key in keys:
+			node = self.lookup(tupl, key.path)
+			LD, _, rest = key.path.partition("/")
+			names = rest.split(".")
+			if not node or len(names) < 2:
+				single.append(key)
 				continue
+			doRef = LD + "/" + names[0] + "." + names[1]
+			for fcName in ([node.FC] if isinstance(node, DataAttribute) else iec61850client.functionalConstraints(node)):
+				groups.setdefault((doRef, fcName), []).append(key)
+
+		lns = {}
+		for (doRef, fcName), group in groups.items():
+			lns.setdefault((doRef.rpartition(".")[0], fcName), []).append((doRef, group))
+
+		plan = []
+		for (lnRef, fcName), dos in lns.items():
+			if lnGroups and len(dos) > 1:
+				ln = self.lookup(tupl, lnRef)
+				count = len([name for name in ln if isinstance(ln[name], (dict, Node)) and fcName in iec61850client.functionalConstraints({name: ln[name]})])
+				if len(dos) >= LN_GROUP_RATIO * count:
+					plan.append((lnRef, ln, fcName, [key for doRef, group in dos for key in group]))
+					continue
+			for doRef, group in dos:
+				if len(group) == 1:
+					# read only the polled node
+					plan.append((group[0].path, self.lookup(tupl, group[0].path), fcName, group))
+				else:
+					plan.append((doRef, self.lookup(tupl, doRef), fcName, group))
+		return plan, single
+
+
+	# poll the datapoints of an IED with the reads of the poll plan. A read of a DO is decoded once, and
+	# its attributes are passed to the callback of each polled key. Returns the keys to be polled one by one
+	def pollGrouped(self, tupl, keys):
+		mode = self.option(tupl, "poll_mode", POLL_SINGLE)
+		# a dataset member is a DO or DA, not a LN
+		plan, single = self.pollPlan(tupl, keys, mode != POLL_DATASET)
+		if mode == POLL_MULTIREAD:
+			failed = self.readPlanMultiple(tupl, plan)
+		elif mode == POLL_PIPELINED:
+			failed = self.readPlanPipelined(tupl, plan)
+		elif mode == POLL_DATASET:
+			failed = self.readPlanDataSets(tupl, plan)
+		else:
+			# with a read per datapoint, only the DO's with multiple polled attributes are read at once
+			single.extend(dict.fromkeys(entry[3][0] for entry in plan if len(entry[3]) == 1))
+			failed = self.readPlanSingle(tupl, [entry for entry in plan if len(entry[3]) > 1])
+		if failed == None:
+			return [] # connection lost
+
+		# keys with multiple reads are passed to the callback when all of them succeeded
+		done = set(single)
+		for ref, node, fcName, group in plan:
+			for key in group:
+				if key in failed or key in done:
+					continue
+				done.add(key)
+				submodel = self.lookup(tupl, key.path)
+				LOGGER.debug("value:%s read from key: %s" % (str(submodel), key))
+				if self.readvaluecallback != None:
+					self.readvaluecallback(key, submodel)
+		single.extend(key for key in failed if key not in single)
+		return single
 
-			if uri_ref.hostname == None:
-				LOGGER.error("missing hostname: %s" % key)
+
+	# put a value, as read with a functional constraint, in a node of the model
+	@staticmethod
+	def storeValue(node, fcName, value):
+		if isinstance(node, DataAttribute):
+			node.set(*iec61850client.typedValue(value))
+			return True
+		return iec61850client.distributeValue(node, fcName, value)
+
+
+	# read the entries of a poll plan one by one. Returns the keys of the reads that failed, or None
+	# when the connection was lost
+	def readPlanSingle(self, tupl, plan):
+		con = self.connections[tupl]['con']
+		failed = set()
+		for ref, node, fcName, group in plan:
+			start = time.monotonic()
+			error = lib61850.IedClientError()
+			value = lib61850.IedConnection_readObject(con, ctypes.byref(error), ref, lib61850.FunctionalConstraint_fromString(fcName))
+			POLL_REQUEST_SECONDS.observe(tupl, POLL_SINGLE, value=time.monotonic() - start)
+			if error.value != lib61850.IED_ERROR_OK:
+				if error.value == lib61850.IED_ERROR_CONNECTION_LOST:
+					LOGGER.error("connection lost during poll of %s" % tupl)
+					POLL_ERRORS.inc(tupl)
+					self.closeConnection(tupl)
+					return None
+				LOGGER.debug("could not read %s[%s] with error: %i" % (ref, fcName, error.value))
+				failed.update(group)
 				continue
+			if not iec61850client.storeValue(node, fcName, value):
+				failed.update(group)
+			lib61850.MmsValue_delete(value)
+		return failed
 
-			tupl = uri_ref.hostname + ":" + str(port)
 
-			#check if connection is active, or reconnect
-			err = self.getIED(uri_ref.hostname, port)
-			if err == 0:
-				con = self.connections[tupl]['con']
-				model = self.connections[tupl]['model']
-				if con and model:
-					model, err = iec61850client.updateValueInModel(con, model, uri_ref.path[1:])
-					if err == 0:
-						self.connections[tupl]['model'] = model
-						submodel, path = iec61850client.parseRef(model, uri_ref.path[1:])
-						LOGGER.debug("value:%s read from key: %s" % (str(submodel), key))
-						#call function with ref+value
-						if self.readvaluecallback != None:
-							self.readvaluecallback(key, submodel)
+	# handler of the asynchronous reads of an IED. It is created once per IED, so it stays valid
+	# for reads that complete after a poll stopped waiting for them
+	def readHandler(self, tupl):
+		conn = self.connections[tupl]
+		if conn.get("read_cb") == None:
+			conn["reads"] = {}
+			conn["read_cb"] = lib61850.IedConnection_ReadObjectHandler(
+				lambda invokeId, parameter, err, value: self.readCompleted(tupl, parameter, err, value))
+		return conn["read_cb"]
 
-					else:
-						LOGGER.error("model not updated for %s with error: %i" % (key, err))
-						if err == 3: #we lost the connection
-							lib61850.IedConnection_destroy(con)
-							self.connections[tupl]['con'] = None
-				else:
-					LOGGER.debug("no connection or model")
 
-			else:
-				LOGGER.debug("IED not available for %s with error: %i" % (key, err))
+	# called by libiec61850 when an asynchronous read completed, the value is deleted here
+	def readCompleted(self, tupl, parameter, err, value):
+		try:
+			read = self.connections[tupl]["reads"].pop(parameter, None)
+			if read != None:
+				node, fcName, completed = read
+				ok = err == lib61850.IED_ERROR_OK and bool(value) and iec61850client.storeValue(node, fcName, value)
+				completed(ok, err)
+		except Exception:
+			LOGGER.exception("exception in read handler of %s" % tupl)
+		finally:
+			if value:
+				lib61850.MmsValue_delete(value)
+
+
+	# read the entries of a poll plan with asynchronous reads, keeping up to max_outstanding reads
+	# in flight. Returns the keys of the reads that failed, or None when the connection was lost
+	def readPlanPipelined(self, tupl, plan):
+		conn = self.connections[tupl]
+		con = conn['con']
+		handler = self.readHandler(tupl)
+
+		# the window is limited to what was negotiated with the IED
+		window = int(self.option(tupl, "max_outstanding", "5"))
+		negotiated = lib61850.MmsConnection_getMmsConnectionParameters(lib61850.IedConnection_getMmsConnection(con)).maxServOutstandingCalling
+		if negotiated > 0:
+			window = min(window, negotiated)
+		slots = threading.Semaphore(max(window, 1))
+
+		done = threading.Condition()
+		pending = {}
+		failed = set()
+		lost = []
+
+		def completed(requestId, group, start, ok, err):
+			POLL_REQUEST_SECONDS.observe(tupl, POLL_PIPELINED, value=time.monotonic() - start)
+			with done:
+				if pending.pop(requestId, None) == None:
+					return # the poll stopped waiting for it
+				if not ok:
+					failed.update(group)
+				if err == lib61850.IED_ERROR_CONNECTION_LOST or err == lib61850.IED_ERROR_NOT_CONNECTED:
+					lost.append(err)
+				done.notify_all()
+			slots.release()
+
+		for ref, node, fcName, group in plan:
+			if lost or not slots.acquire(timeout=PIPELINE_TIMEOUT):
+				failed.update(group)
+				continue
+			requestId = next(self.read_ids)
+			start = time.monotonic()
+			with done:
+				pending[requestId] = group
+			conn["reads"][requestId] = (node, fcName, lambda ok, err, requestId=requestId, group=group, start=start: completed(requestId, group, start, ok, err))
+
+			error = lib61850.IedClientError()
+			lib61850.IedConnection_readObjectAsync(con, ctypes.byref(error), ref, lib61850.FunctionalConstraint_fromString(fcName), handler, ctypes.c_void_p(requestId))
+			if error.value != lib61850.IED_ERROR_OK:
+				conn["reads"].pop(requestId, None)
+				completed(requestId, group, start, False, error.value)
+
+		with done:
+			if not done.wait_for(lambda: len(pending) == 0, timeout=PIPELINE_TIMEOUT):
+				LOGGER.error("%i reads of %s did not complete" % (len(pending), tupl))
+				for requestId, group in pending.items():
+					conn["reads"].pop(requestId, None)
+					failed.update(group)
+				pending.clear()
+
+		if lost:
+			LOGGER.error("connection lost during poll of %s" % tupl)
+			POLL_ERRORS.inc(tupl)
+			self.closeConnection(tupl)
+			return None
+		return failed
+
+
+	# create a dataset with members as "LD/LN.DO.DA[FC]". Returns the error
+	@staticmethod
+	def createDataSet(con, name, members):
+		error = lib61850.IedClientError()
+		refs = [ctypes.c_char_p(member.encode("utf-8")) for member in members] # kept until the request is done
+		memberList = lib61850.LinkedList_create()
+		for ref in refs:
+			lib61850.LinkedList_add(memberList, ctypes.cast(ref, ctypes.c_void_p))
+		lib61850.IedConnection_createDataSet(con, ctypes.byref(error), name, memberList)
+		lib61850.LinkedList_destroyStatic(memberList)
+		return error.value
+
+
+	# create the datasets for a poll plan, each fits in a PDU and has at most poll_dataset_size members.
+	# The datasets refer to the entries by their index in the plan. Entries that could not be put in
+	# a dataset are polled one by one
+	def createPollDataSets(self, tupl, plan, signature):
+		conn = self.connections[tupl]
+		con = conn['con']
+		mms = lib61850.IedConnection_getMmsConnection(con)
+		maxPduSize = lib61850.MmsConnection_getMmsConnectionParameters(mms).maxPduSize
+		if maxPduSize <= 0:
+			maxPduSize = 65000 # default of libiec61850, when not negotiated
+		size = int(self.option(tupl, "poll_dataset_size", "50"))
+
+		# the names are unique for all plans of the connection
+		names = conn.setdefault("poll_dataset_names", itertools.count(1))
+		state = {"signature": signature, "keys": set(key for entry in plan for key in entry[3]), "datasets": [], "unavailable": set(), "recreate": False}
+		items = [(plan[i][0] + "[" + plan[i][2] + "]", i, plan[i][1], plan[i][2]) for i in range(len(plan))]
+		for batch in iec61850client.pduBatches(items, maxPduSize):
+			for i in range(0, len(batch), size):
+				members = batch[i:i + size]
+				name = POLL_DATASET_PREFIX + str(next(names))
+				err = iec61850client.createDataSet(con, name, [member for member, entry, node, fcName in members])
+				if err != lib61850.IED_ERROR_OK:
+					LOGGER.error("could not create dataset %s on %s with error: %i, its %i datapoints are polled one by one" % (name, tupl, err, len(members)))
+					state["unavailable"].update(index for member, index, node, fcName in members)
+					continue
+				state["datasets"].append({"name": name, "entries": [index for member, index, node, fcName in members], "values": None})
+		LOGGER.info("%i datasets created for polling %s" % (len(state["datasets"]), tupl))
+		return state
+
+
+	# remove the datasets of a poll plan, from the IED as well when delete is True
+	def removePollPlan(self, tupl, state, delete=True):
+		self.connections[tupl].get("poll_datasets", {}).pop(state["signature"], None)
+		con = self.connections[tupl]['con']
+		for dataset in state["datasets"]:
+			if delete and con:
+				error = lib61850.IedClientError()
+				lib61850.IedConnection_deleteDataSet(con, ctypes.byref(error), dataset["name"])
+			if dataset["values"]:
+				lib61850.ClientDataSet_destroy(dataset["values"])
+
+
+	# remove the datasets for polling of an IED, from the IED as well when delete is True
+	def removePollDataSets(self, tupl, delete=True):
+		for state in list(self.connections[tupl].get("poll_datasets", {}).values()):
+			self.removePollPlan(tupl, state, delete)
+		self.connections[tupl].pop("poll_datasets", None)
+		if not delete:
+			# the IED removed the datasets, their names can be used again
+			self.connections[tupl].pop("poll_dataset_names", None)
+
+
+	# read the entries of a poll plan with one read per dataset. The datasets are cached per plan, as each
+	# interval group is polled with its own plan. They are created when a plan changed, after a reconnect,
+	# or when a read of them failed. Returns the keys of the reads that failed, or None when the connection was lost
+	def readPlanDataSets(self, tupl, plan):
+		conn = self.connections[tupl]
+		con = conn['con']
+		signature = tuple((ref, fcName) for ref, node, fcName, group in plan)
+		plans = conn.setdefault("poll_datasets", {})
+		state = plans.get(signature)
+		if state != None and state["recreate"]:
+			self.removePollPlan(tupl, state)
+			state = None
+		if state == None:
+			# the previous plan of the same interval group has (some of) the same keys
+			keys = set(key for entry in plan for key in entry[3])
+			for previous in [previous for previous in plans.values() if previous["keys"] & keys]:
+				self.removePollPlan(tupl, previous)
+			state = self.createPollDataSets(tupl, plan, signature)
+			plans[signature] = state
+
+		failed = set()
+		for index in state["unavailable"]:
+			failed.update(plan[index][3])
+		for dataset in state["datasets"]:
+			start = time.monotonic()
+			error = lib61850.IedClientError()
+			# the values of the previous read are replaced
+			dataset["values"] = lib61850.IedConnection_readDataSetValues(con, ctypes.byref(error), dataset["name"], dataset["values"])
+			POLL_REQUEST_SECONDS.observe(tupl, POLL_DATASET, value=time.monotonic() - start)
+			if error.value != lib61850.IED_ERROR_OK or not dataset["values"]:
+				if error.value == lib61850.IED_ERROR_CONNECTION_LOST:
+					LOGGER.error("connection lost during poll of %s" % tupl)
+					POLL_ERRORS.inc(tupl)
+					self.closeConnection(tupl)
+					return None
+				LOGGER.debug("could not read dataset %s of %s with error: %i, it is created again on next poll" % (dataset["name"], tupl, error.value))
+				state["recreate"] = True
+				for index in dataset["entries"]:
+					failed.update(plan[index][3])
+				continue
+
+			values = lib61850.ClientDataSet_getValues(dataset["values"])
+			for i in range(len(dataset["entries"])):
+				ref, node, fcName, group = plan[dataset["entries"][i]]
+				element = lib61850.MmsValue_getElement(values, i)
+				if not element or lib61850.MmsValue_getType(element) == lib61850.MMS_DATA_ACCESS_ERROR:
+					failed.update(group)
+				elif not iec61850client.storeValue(node, fcName, element):
+					failed.update(group)
+		return failed
 
 
-	# retrieve datamodel from server
-	def getDatamodel(self, ref=None, hostname="localhost", port=102):
+	# the MMS variable of a reference with a functional constraint, e.g. LD/LN.DO.DA is read as
+	# LN$FC$DO$DA in domain LD. Returns (domain, itemId)
+	@staticmethod
+	def mmsItem(ref, fcName):
+		LD, _, rest = ref.partition("/")
+		names = rest.split(".")
+		return LD, "$".join([names[0], fcName] + names[1:])
+
+
+	# estimated size in the response PDU of the value of a node, for the DA's with a functional constraint
+	@staticmethod
+	def mmsSize(node, fcName):
+		if isinstance(node, DataAttribute):
+			if node.type in ("visible-string", "mms-string", "octet-string"):
+				return 72
+			return 16
+		size = 4
+		for name in node:
+			child = node[name]
+			if isinstance(child, (dict, Node)) and (not isinstance(child, DataAttribute) or child.FC == fcName):
+				size += iec61850client.mmsSize(child, fcName)
+		return size
+
+
+	# split the items of a read of multiple variables, so the request and the response fit in a PDU
+	@staticmethod
+	def pduBatches(items, maxPduSize):
+		budget = maxPduSize - 64 # headers of the request and response
+		batches = []
+		batch = []
+		request = 0
+		response = 0
+		for item in items:
+			itemId, group, node, fcName = item
+			itemRequest = len(itemId) + 8
+			itemResponse = iec61850client.mmsSize(node, fcName)
+			if batch and (request + itemRequest > budget or response + itemResponse > budget):
+				batches.append(batch)
+				batch = []
+				request = 0
+				response = 0
+			batch.append(item)
+			request += itemRequest
+			response += itemResponse
+		if batch:
+			batches.append(batch)
+		return batches
+
+
+	# read a list of variables of a domain with one request. Returns the MmsValue array with a value (or
+	# data access error) per item and the MmsError. The array has to be deleted by the caller
+	@staticmethod
+	def readMultiple(mms, domain, itemIds):
+		error = lib61850.MmsError()
+		names = [ctypes.c_char_p(itemId.encode("utf-8")) for itemId in itemIds] # kept until the request is done
+		items = lib61850.LinkedList_create()
+		for name in names:
+			lib61850.LinkedList_add(items, ctypes.cast(name, ctypes.c_void_p))
+		values = lib61850.MmsConnection_readMultipleVariables(mms, ctypes.byref(error), domain, items)
+		lib61850.LinkedList_destroyStatic(items)
+		return values, error.value
+
+
+	# read the entries of a poll plan with a read of multiple variables per LD, split to fit the PDU size.
+	# Returns the keys of the reads that failed, or None when the connection was lost
+	def readPlanMultiple(self, tupl, plan):
+		con = self.connections[tupl]['con']
+		mms = lib61850.IedConnection_getMmsConnection(con)
+		maxPduSize = lib61850.MmsConnection_getMmsConnectionParameters(mms).maxPduSize
+		if maxPduSize <= 0:
+			maxPduSize = 65000 # default of libiec61850, when not negotiated
+
+		domains = {}
+		for ref, node, fcName, group in plan:
+			domain, itemId = iec61850client.mmsItem(ref, fcName)
+			domains.setdefault(domain, []).append((itemId, group, node, fcName))
+
+		failed = set()
+		for domain, items in domains.items():
+			for batch in iec61850client.pduBatches(items, maxPduSize):
+				start = time.monotonic()
+				values, err = iec61850client.readMultiple(mms, domain, [itemId for itemId, group, node, fcName in batch])
+				POLL_REQUEST_SECONDS.observe(tupl, POLL_MULTIREAD, value=time.monotonic() - start)
+				if err != lib61850.MMS_ERROR_NONE or not values:
+					if values:
+						lib61850.MmsValue_delete(values)
+					if err == lib61850.MMS_ERROR_CONNECTION_LOST:
+						LOGGER.error("connection lost during poll of %s" % tupl)
+						POLL_ERRORS.inc(tupl)
+						self.closeConnection(tupl)
+						return None
+					LOGGER.debug("could not read %i variables of %s/%s with error: %i" % (len(batch), tupl, domain, err))
+					for itemId, group, node, fcName in batch:
+						failed.update(group)
+					continue
+
+				for i in range(len(batch)):
+					itemId, group, node, fcName = batch[i]
+					element = lib61850.MmsValue_getElement(values, i)
+					if not element or lib61850.MmsValue_getType(element) == lib61850.MMS_DATA_ACCESS_ERROR:
+						failed.update(group)
+					elif not iec61850client.storeValue(node, fcName, element):
+						failed.update(group)
+				lib61850.MmsValue_delete(values)
+		return failed
+
+
+	# retrieve datamodel from server, as nested dicts like the model of printrefs. With compact=True
+	# the model is returned as stored, with DataAttribute and DataSetMember nodes as leaves
+	def getDatamodel(self, ref=None, hostname="localhost", port=102, compact=False):
 		# if uri provided, it will have presedence over hostname and port
 		if ref != None:
-			uri_ref = urlparse(ref)
-			hostname = uri_ref.hostname
+			uri_ref = parse_ref(ref)
+			hostname = uri_ref.host
 			port = uri_ref.port
 
 		# if port is explicitly defined as "" or None, assume 102
@@ -1118,7 +2469,9 @@ class iec61850client(abstract_client):
 		err = self.getIED(hostname, port)
 		if err == 0:
 			tupl =  hostname + ":" + str(port)
-			return self.connections[tupl]['model']
+			if compact:
+				return self.connections[tupl]['model']
+			return plain(self.connections[tupl]['model'])
 		else:
 			LOGGER.debug("no connection to IED: %s:%s" % (hostname, port) )
 			return {}
@@ -1151,18 +2504,18 @@ class iec61850client(abstract_client):
 		if not 'control' in self.connections[tupl]:
 			self.connections[tupl]['control'] = {}
 
-		if not uri_ref.path[1:] in self.connections[tupl]['control'] or self.connections[tupl]['control'][ uri_ref.path[1:] ] == None:
+		if not uri_ref.path in self.connections[tupl]['control'] or self.connections[tupl]['control'][ uri_ref.path ] == None:
 
-			control = lib61850.ControlObjectClient_create(uri_ref.path[1:], con)
+			control = lib61850.ControlObjectClient_create(uri_ref.path, con)
 
-			self.connections[tupl]['control'][ uri_ref.path[1:] ] = control
+			self.connections[tupl]['control'][ uri_ref.path ] = control
 
 			ctlModel = lib61850.ControlObjectClient_getControlModel(control)
 			if ctlModel == lib61850.CONTROL_MODEL_DIRECT_ENHANCED or ctlModel == lib61850.CONTROL_MODEL_SBO_ENHANCED:
 				LOGGER.info("control object: enhanced security")
 				cbh = lib61850.CommandTerminationHandler(self.commandTerminationHandler_cb)
 
-				ref = bytes(uri_ref.path[1:].encode('utf-8'))
+				ref = bytes(uri_ref.path.encode('utf-8'))
 
 				lib61850.ControlObjectClient_setCommandTerminationHandler(control, cbh, ctypes.c_char_p( ref ))
 				self.cb_refs.append(cbh) # hard reference to ensure this pointer is not cleaned by the garbage collector
@@ -1170,7 +2523,7 @@ class iec61850client(abstract_client):
 			else:
 				LOGGER.info("control object: normal security")
 		else:
-			control = self.connections[tupl]['control'][ uri_ref.path[1:] ]
+			control = self.connections[tupl]['control'][ uri_ref.path ]
 		return control
 
 
@@ -1179,18 +2532,13 @@ class iec61850client(abstract_client):
 		error = -1
 		addCause = ""
 
-		if ref != None:
-			uri_ref = urlparse(ref)
-			hostname = uri_ref.hostname
-			port = uri_ref.port
-
-		# if port is explicitly defined as "" or None, assume 102
-		if port == "" or port == None:
-			port = 102
+		uri_ref = parse_ref(ref)
+		hostname = uri_ref.host
+		port = uri_ref.port
 		
 		err = self.getIED(hostname, port)
 		if err == 0:
-			tupl =  hostname + ":" + str(port)
+			tupl = uri_ref.key
 
 			control = self.get_controlObject(tupl, uri_ref)
 			
@@ -1216,18 +2564,13 @@ class iec61850client(abstract_client):
 		addCause = ""
 		error = -1
 
-		if ref != None:
-			uri_ref = urlparse(ref)
-			hostname = uri_ref.hostname
-			port = uri_ref.port
-
-		# if port is explicitly defined as "" or None, assume 102
-		if port == "" or port == None:
-			port = 102
+		uri_ref = parse_ref(ref)
+		hostname = uri_ref.host
+		port = uri_ref.port
 
 		err = self.getIED(hostname, port)
 		if err == 0:
-			tupl =  hostname + ":" + str(port)
+			tupl = uri_ref.key
 			
 			control = self.get_controlObject(tupl, uri_ref)
 
@@ -1271,18 +2614,13 @@ class iec61850client(abstract_client):
 	def cancel(self, ref):
 		error = -1
 
-		if ref != None:
-			uri_ref = urlparse(ref)
-			hostname = uri_ref.hostname
-			port = uri_ref.port
-
-		# if port is explicitly defined as "" or None, assume 102
-		if port == "" or port == None:
-			port = 102
+		uri_ref = parse_ref(ref)
+		hostname = uri_ref.host
+		port = uri_ref.port
 
 		err = self.getIED(hostname, port)
 		if err == 0:
-			tupl =  hostname + ":" + str(port)
+			tupl = uri_ref.key
 			control = self.get_controlObject(tupl, uri_ref)
 			error = lib61850.ControlObjectClient_cancel(control)
 
@@ -1290,6 +2628,71 @@ class iec61850client(abstract_client):
 
 
 
+	# executor for the blocking calls to an IED
+	def ied_executor(self, tupl):
+		executor = self.executors.get(tupl)
+		if executor == None:
+			executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ied_" + tupl)
+			self.executors[tupl] = executor
+		return executor
+
+
+	def run_on_ied(self, ref, func, *args):
+		loop = asyncio.get_running_loop()
+		return loop.run_in_executor(self.ied_executor(parse_ref(ref).key), func, *args)
+
+
+	async def ReadValueAsync(self, ref):
+		return await self.run_on_ied(ref, self.ReadValue, ref)
+
+
+	async def registerWriteValueAsync(self, ref, value):
+		return await self.run_on_ied(ref, self.registerWriteValue, ref, value)
+
+
+	async def operateAsync(self, ref, value):
+		return await self.run_on_ied(ref, self.operate, ref, value)
+
+
+	async def selectAsync(self, ref, value):
+		return await self.run_on_ied(ref, self.select, ref, value)
+
+
+	async def cancelAsync(self, ref):
+		return await self.run_on_ied(ref, self.cancel, ref)
+
+
+	# poll the IED's in parallel, each in its own executor. An IED that is still busy with
+	# the previous poll is skipped, so a slow IED does not build up a queue of polls
+	async def pollAsync(self, refs = None):
+		if refs == None:
+			refs = list(self.polling)
+
+		ieds = {}
+		for key in refs:
+			if key in self.polling:
+				ieds.setdefault(key.key, []).append(key)
+
+		polls = []
+		for tupl in ieds:
+			if tupl in self.polls_in_progress:
+				LOGGER.debug("poll of %s skipped, previous poll still in progress" % tupl)
+				continue
+			polls.append(self.poll_ied(tupl, ieds[tupl]))
+		await asyncio.gather(*polls)
+
+
+	async def poll_ied(self, tupl, refs):
+		self.polls_in_progress.add(tupl)
+		try:
+			loop = asyncio.get_running_loop()
+			await loop.run_in_executor(self.ied_executor(tupl), self.poll, refs)
+		except Exception:
+			LOGGER.exception("exception during poll of %s" % tupl)
+		finally:
+			self.polls_in_progress.discard(tupl)
+
+
 if __name__=="__main__":
 	logging.basicConfig(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
 		level=logging.INFO)
@@ -1399,4 +2802,3 @@ if __name__=="__main__":
 	#	print("operated successfully")
 	#else:
 	#	print("failed to operate")
-
@@ -1,13 +1,19 @@
 import pymodbus
 import logging
+import asyncio
+import time
 
 import pymodbus.client
 from abstract_client import abstract_client
-from urllib.parse import urlparse
+from dataref import parse_ref
+import metrics
 from pymodbus.exceptions import ConnectionException
 
 logger = logging.getLogger(__name__)
 
+POLL_SECONDS = metrics.histogram("gateway_modbus_poll_seconds", "Duration of reading a polled register from a modbus node", ["node"])
+POLL_ERRORS = metrics.counter("gateway_modbus_poll_errors_total", "Polls of a register that failed", ["node"])
+
 def scheme():
     return "modbus"
 
@@ -30,13 +36,17 @@ def parse_path(path):
       /1/40001  -> device_id=1, address=40001 / 00
       /40001    -> device_id=1, address=40001  (legacy, no device_id segment)
     """
-    parts = path.lstrip("/").split("/")
+    return parse_parts(path.lstrip("/").split("/"))
+
+
+def parse_parts(parts):
+    """Same as parse_path, for a path that is already split on '/' (DataRef.parts)."""
     if len(parts) >= 2:
         return int(parts[0]), int(parts[1])
     elif len(parts) == 1:
         return 1, int(parts[0])
     else:
-        raise ValueError("Invalid modbus URI path: %s" % path)
+        raise ValueError("Invalid modbus URI path: %s" % "/".join(parts))
 
 
 def address_to_protocol(address):
@@ -54,17 +64,22 @@ def address_to_protocol(address):
 
 class libmodbusmaster(abstract_client):
 
-    def __init__(self, readvaluecallback, loggerRef, arg1=None, arg2=None):
+    def __init__(self, readvaluecallback, loggerRef, arg1=None, arg2=None, settings=None):
         global logger
         if loggerRef is not None:
             logger = loggerRef
 
         self.connections = {}
+        self.async_connections = {}  # connections of the async client, used by the asyncio runtime
+        self.polls_in_progress = set()
         self.keys = []
         self.values = {}
+        self.addresses = {}  # ref -> (device_id, address), parsed once per ref
         self.readvaluecallback = readvaluecallback
         self.modbusconnection_failed_message = {}
         logging.getLogger("pymodbus").setLevel(logging.CRITICAL)
+        metrics.gauge("gateway_modbus_connected", "Connection state of a modbus node, 1 when connected", ["node"],
+            lambda: {(tupl,): int(not failed) for tupl, failed in list(self.modbusconnection_failed_message.items())})
         logger.info("libmodbusmaster initialised")
 
     @staticmethod
@@ -72,9 +87,20 @@ class libmodbusmaster(abstract_client):
         return "general error: %i" % value
 
 
+    def address(self, ref):
+        """Return (device_id, address) of a reference, parsing its path only once."""
+        addr = self.addresses.get(ref)
+        if addr is None:
+            addr = parse_parts(ref.parts)
+            self.addresses[ref] = addr
+        return addr
+
+
     def registerReadValue(self, id):
+        id = parse_ref(id)
         con = self.getRegisteredConnections(id)
         if con is not None:
+            self.address(id)
             self.keys.append(id)
             self.values[id] = None
             return 0
@@ -84,9 +110,10 @@ class libmodbusmaster(abstract_client):
 
 
     def registerWriteValue(self, id, value):
+        id = parse_ref(id)
         con = self.getRegisteredConnections(id)
         if con is not None:
-            device_id, address = parse_path(urlparse(id).path)
+            device_id, address = self.address(id)
             error = self.writeholdingregister(con, address, int(value), device_id)
             if error == 0:
                 logger.debug("Value '%s' written to %s" % (value, id))
@@ -102,20 +129,18 @@ class libmodbusmaster(abstract_client):
 
 
     def getRegisteredConnections(self, id):
-        uri_ref = urlparse(id)
+        uri_ref = parse_ref(id)
         port = uri_ref.port
-        if not port:
-            port = 502
 
         if uri_ref.scheme != "modbus":
             logger.error("incorrect scheme, only modbus is supported by this client, not %s" % uri_ref.scheme)
             return None
 
-        if uri_ref.hostname is None:
+        if uri_ref.host is None:
             logger.error("missing hostname: %s" % id)
             return None
 
-        tupl = uri_ref.hostname + ":" + str(port)
+        tupl = uri_ref.key
 
         con = None
         if tupl in self.connections:
@@ -123,7 +148,7 @@ class libmodbusmaster(abstract_client):
             if con.connected:
                 return con
         else:
-            con = pymodbus.client.ModbusTcpClient(uri_ref.hostname, port=port, timeout=1)
+            con = pymodbus.client.ModbusTcpClient(uri_ref.host, port=port, timeout=1)
 
         try:
             con.connect()
@@ -148,12 +173,13 @@ class libmodbusmaster(abstract_client):
 
     def ReadValue(self, id):
         """Read a register value, routing to FC03 or FC04 based on address range."""
+        id = parse_ref(id)
         con = self.getRegisteredConnections(id)
         if con is None:
             logger.debug("could not read from %s: no connection to modbus node" % id)
             return None
 
-        device_id, address = parse_path(urlparse(id).path)
+        device_id, address = self.address(id)
 
         if HOLDING_REGISTER_MIN <= address <= HOLDING_REGISTER_MAX:
             value = self.readholdingregister(con, address, device_id)
@@ -169,9 +195,124 @@ class libmodbusmaster(abstract_client):
         return value
 
 
-    def poll(self):
-        for key in self.keys:
-            self.ReadValue(key)
+    def poll(self, refs=None):
+        """Read the registered values, or only the registered values in refs."""
+        if refs is None:
+            refs = self.keys
+        for key in refs:
+            if key in self.values:
+                start = time.monotonic()
+                if self.ReadValue(key) is None:
+                    POLL_ERRORS.inc(key.key)
+                POLL_SECONDS.observe(key.key, value=time.monotonic() - start)
+
+
+    async def getAsyncConnection(self, id):
+        """Same as getRegisteredConnections, for the pymodbus async client."""
+        uri_ref = parse_ref(id)
+        if uri_ref.scheme != "modbus":
+            logger.error("incorrect scheme, only modbus is supported by this client, not %s" % uri_ref.scheme)
+            return None
+
+        if uri_ref.host is None:
+            logger.error("missing hostname: %s" % id)
+            return None
+
+        tupl = uri_ref.key
+        con = self.async_connections.get(tupl)
+        if con is not None and con.connected:
+            return con
+        if con is None:
+            con = pymodbus.client.AsyncModbusTcpClient(uri_ref.host, port=uri_ref.port, timeout=1)
+            self.async_connections[tupl] = con
+
+        try:
+            await con.connect()
+        except ConnectionException as e:
+            logger.error("Failed to connect to %s: %s" % (tupl, e))
+
+        if con.connected:
+            if self.modbusconnection_failed_message.get(tupl) == True:
+                logger.info("Modbus reconnected to %s" % tupl)
+            self.modbusconnection_failed_message[tupl] = False
+            return con
+        else:
+            if self.modbusconnection_failed_message.get(tupl) == False:
+                logger.error("no valid modbus connection with %s" % tupl)
+            self.modbusconnection_failed_message[tupl] = True
+            con.close()
+            del self.async_connections[tupl]
+            return None
+
+
+    async def ReadValueAsync(self, id):
+        """Same as ReadValue, with the async client."""
+        id = parse_ref(id)
+        device_id, address = self.address(id)
+        if not (HOLDING_REGISTER_MIN <= address <= HOLDING_REGISTER_MAX or INPUT_REGISTER_MIN <= address <= INPUT_REGISTER_MAX):
+            logger.error("address %i in %s is outside supported ranges (3xxxx / 4xxxx)" % (address, id))
+            return None
+
+        con = await self.getAsyncConnection(id)
+        if con is None:
+            logger.debug("could not read from %s: no connection to modbus node" % id)
+            return None
+
+        value = await self.readregisterAsync(con, address, device_id)
+        if value is not None and value != self.values.get(id):
+            self.readvaluecallback(id, {'value': value})
+        self.values[id] = value
+        return value
+
+
+    async def pollAsync(self, refs=None):
+        """Same as poll, the nodes are read in parallel, the values of a node one after the other.
+
+        A node that is still busy with the previous poll is skipped.
+        """
+        if refs is None:
+            refs = self.keys
+        nodes = {}
+        for key in refs:
+            if key in self.values:
+                nodes.setdefault(key.key, []).append(key)
+
+        async def poll_node(tupl, keys):
+            self.polls_in_progress.add(tupl)
+            try:
+                for key in keys:
+                    start = time.monotonic()
+                    if await self.ReadValueAsync(key) is None:
+                        POLL_ERRORS.inc(tupl)
+                    POLL_SECONDS.observe(tupl, value=time.monotonic() - start)
+            finally:
+                self.polls_in_progress.discard(tupl)
+
+        await asyncio.gather(*[poll_node(tupl, keys) for tupl, keys in nodes.items() if tupl not in self.polls_in_progress])
+
+
+    async def readregisterAsync(self, con, address, device_id=1):
+        """Read a single holding register (FC03) or input register (FC04) with the async client."""
+        proto_address = address_to_protocol(address)
+        function = "FC03" if HOLDING_REGISTER_MIN <= address <= HOLDING_REGISTER_MAX else "FC04"
+        try:
+            if function == "FC03":
+                result = await con.read_holding_registers(proto_address, count=1, slave=device_id)
+            else:
+                result = await con.read_input_registers(proto_address, count=1, slave=device_id)
+        except Exception as e:
+            logger.error("Exception during %s read: %s. Closing connection.." % (function, e))
+            con.close()
+            for tupl, data in list(self.async_connections.items()):
+                if data is con:
+                    del self.async_connections[tupl]
+                    break
+            return None
+        if result.isError():
+            logger.error("%s read failed at address %i (protocol %i), device_id %i"
+                         % (function, address, proto_address, device_id))
+            return None
+        return result.registers[0]
 
 
     def readholdingregister(self, con, address, device_id=1):
@@ -267,12 +408,13 @@ class libmodbusmaster(abstract_client):
             logger.error("operate: invalid value %s for %s — expected 0 (no action), 1 (open), 2 (close)" % (value, id))
             return -1
 
+        id = parse_ref(id)
         con = self.getRegisteredConnections(id)
         if con is None:
             logger.error("operate failed for %s: no connection to modbus node" % id)
             return -1
 
-        device_id, address = parse_path(urlparse(id).path)
+        device_id, address = self.address(id)
 
         if not (HOLDING_REGISTER_MIN <= address <= HOLDING_REGISTER_MAX):
             logger.error("operate: address %i in %s is not a holding register (4xxxx)" % (address, id))
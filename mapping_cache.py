@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import logging
+import configparser
+
+from dataref import DataRef, DEFAULT_PORTS, REF_FIELDS, register_ref, restore_ref
+
+logger = logging.getLogger(__name__)
+
+# increase when the layout of the compiled mapping changes, so old artifacts are not used
+MAPPING_VERSION = 3
+MAPPING_SUFFIX = ".map"
+
+
+def compile_config(data, sections, digest):
+    """Compile the contents of a config file into a mapping.
+
+    sections maps the name of each IOA section to the 104 type code of its IOA's.
+    The mapping is a dict with:
+      hash:     content hash of the config, the key of the artifact
+      settings: {section: {option: value}} of all other sections
+      ioas:     {section: [(ioa, DataRef), ...]} in order of the config
+      types:    {ioa: type code}
+      ieds:     {scheme://host:port: [(ioa, DataRef), ...]} references grouped by IED
+    Invalid or duplicate IOA's are logged and left out.
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str # to retain case sentistivy
+    config.read_string(data.decode("utf-8"))
+
+    mapping = {
+        'version': MAPPING_VERSION,
+        'hash': digest,
+        'settings': {},
+        'ioas': {},
+        'types': {},
+        'ieds': {},
+    }
+    for section in config.sections():
+        if section not in sections:
+            mapping['settings'][section] = dict(config[section])
+            continue
+
+        items = []
+        for option in config[section]:
+            try:
+                ioa = int(option)
+            except ValueError:
+                logger.error("invalid IOA '%s' in section %s, IOA not added" % (option, section))
+                continue
+            if ioa in mapping['types']:
+                logger.error("duplicate IOA:%i, IOA not added to list" % ioa)
+                continue
+
+            ref = DataRef(config[section][option])
+            if ref.key is None:
+                logger.error("missing hostname or port for IOA %i: %s" % (ioa, ref))
+            else:
+                ied = "%s://%s" % (ref.scheme, ref.key)
+                mapping['ieds'].setdefault(ied, []).append((ioa, ref))
+
+            mapping['types'][ioa] = sections[section]
+            items.append((ioa, ref))
+        mapping['ioas'][section] = items
+    return mapping
+
+
+def encode_mapping(mapping):
+    """Return the artifact of a mapping, as json of plain lists and dicts.
+
+    Each reference is stored once, with its parsed fields, and refered to by its IOA.
+    """
+    refs = []
+    for section, items in mapping['ioas'].items():
+        for ioa, ref in items:
+            fields = dict(ref.__dict__)
+            fields['parts'] = list(fields['parts'])
+            refs.append([ioa, str(ref), fields])
+    return json.dumps({
+        'version': mapping['version'],
+        'hash': mapping['hash'],
+        'settings': mapping['settings'],
+        'refs': refs,
+        'ioas': dict((section, [ioa for ioa, ref in items]) for section, items in mapping['ioas'].items()),
+        'types': [[ioa, code] for ioa, code in mapping['types'].items()],
+        'ieds': dict((ied, [ioa for ioa, ref in items]) for ied, items in mapping['ieds'].items()),
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def decode_mapping(data, digest):
+    """Return the mapping of an artifact, or None if it is not a valid artifact of this version and hash."""
+    try:
+        artifact = json.loads(data.decode("utf-8"))
+        if artifact.get('version') != MAPPING_VERSION or artifact.get('hash') != digest:
+            return None
+
+        refs = {}
+        for ioa, uri, fields in artifact['refs']:
+            fields['parts'] = tuple(fields['parts'])
+            if not isinstance(ioa, int) or not isinstance(uri, str) or set(fields) != set(REF_FIELDS):
+                raise ValueError("invalid reference of IOA %s" % ioa)
+            for name, types in REF_FIELDS.items():
+                if not isinstance(fields[name], types):
+                    raise ValueError("invalid field %s of IOA %i" % (name, ioa))
+            refs[ioa] = restore_ref(uri, fields)
+
+        settings = artifact['settings']
+        if not all(isinstance(options, dict) and all(isinstance(value, str) for value in options.values())
+                   for options in settings.values()):
+            raise ValueError("invalid settings")
+        return {
+            'version': MAPPING_VERSION,
+            'hash': digest,
+            'settings': settings,
+            'ioas': dict((section, [(ioa, refs[ioa]) for ioa in ioas]) for section, ioas in artifact['ioas'].items()),
+            'types': dict((ioa, int(code)) for ioa, code in artifact['types']),
+            'ieds': dict((ied, [(ioa, refs[ioa]) for ioa in ioas]) for ied, ioas in artifact['ieds'].items()),
+        }
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.error("invalid mapping cache: %s" % e)
+        return None
+
+
+def cache_file(filename, cache_dir, digest):
+    return os.path.join(cache_dir, "%s-%s%s" % (os.path.basename(filename), digest, MAPPING_SUFFIX))
+
+
+def load_mapping(filename, sections, cache_dir):
+    """Return the compiled mapping of a config file.
+
+    The artifact in cache_dir matching the content hash of the config is loaded with a
+    single read; if there is none or it is invalid, the config is compiled and the
+    artifact is written. The artifact is json, so loading it cannot execute code.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    # the parsed references depend on the default ports, a change of them compiles the config again
+    key = repr((MAPPING_VERSION, sorted(sections.items()), sorted(DEFAULT_PORTS.items()))).encode("utf-8")
+    digest = hashlib.sha256(key + data).hexdigest()
+    path = cache_file(filename, cache_dir, digest)
+
+    mapping = None
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                mapping = decode_mapping(f.read(), digest)
+        except OSError as e:
+            logger.error("could not load mapping cache %s: %s" % (path, e))
+
+    if mapping is not None:
+        logger.info("loaded compiled mapping %s" % path)
+    else:
+        mapping = compile_config(data, sections, digest)
+        save_mapping(filename, cache_dir, mapping)
+
+    # make the loaded references known, so they are not parsed again
+    for section in mapping['ioas']:
+        for ioa, ref in mapping['ioas'][section]:
+            register_ref(ref)
+    return mapping
+
+
+def save_mapping(filename, cache_dir, mapping):
+    path = cache_file(filename, cache_dir, mapping['hash'])
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # remove artifacts of older versions of this config
+        prefix = os.path.basename(filename) + "-"
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and name.endswith(MAPPING_SUFFIX):
+                os.remove(os.path.join(cache_dir, name))
+
+        with open(path + ".tmp", "wb") as f:
+            f.write(encode_mapping(mapping))
+        os.replace(path + ".tmp", path)
+        logger.info("compiled mapping written to %s" % path)
+    except OSError as e:
+        logger.error("could not write mapping cache %s: %s" % (path, e))
@@ -0,0 +1,186 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# default histogram buckets in seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# all metrics by name, in order of registration
+_metrics = {}
+
+
+class Metric:
+    """Base of the metric types, the values are kept per tuple of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+
+    def label_text(self, values, extra=""):
+        pairs = ['%s="%s"' % (label, escape(value)) for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        if len(pairs) == 0:
+            return ""
+        return "{" + ",".join(pairs) + "}"
+
+    def samples(self):
+        return []
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.type)]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        Metric.__init__(self, name, help, labels)
+        self.values = {}
+
+    def inc(self, *values, amount=1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return ["%s%s %s" % (self.name, self.label_text(values), format_value(value)) for values, value in items]
+
+
+class Gauge(Metric):
+    """A gauge that is set, or read from func() when the metrics are collected.
+
+    func returns a number, or a dict of {tuple of label values: number} for a gauge with labels.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), func=None):
+        Metric.__init__(self, name, help, labels)
+        self.values = {}
+        self.func = func
+
+    def set(self, *values, value=0):
+        with self.lock:
+            self.values[values] = value
+
+    def samples(self):
+        if self.func is not None:
+            try:
+                result = self.func()
+            except Exception as e:
+                logger.debug("could not collect %s: %s" % (self.name, e))
+                return []
+            items = list(result.items()) if isinstance(result, dict) else [((), result)]
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        return ["%s%s %s" % (self.name, self.label_text(values), format_value(value)) for values, value in items]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [count per bucket (+Inf last), sum]
+
+    def observe(self, *values, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(values)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0]
+                self.values[values] = entry
+            entry[0][i] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(values, list(entry[0]), entry[1]) for values, entry in self.values.items()]
+        lines = []
+        for values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % (bound if isinstance(bound, str) else format_value(bound))
+                lines.append("%s_bucket%s %i" % (self.name, self.label_text(values, le), cumulative))
+            lines.append("%s_sum%s %s" % (self.name, self.label_text(values), format_value(total)))
+            lines.append("%s_count%s %i" % (self.name, self.label_text(values), cumulative))
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def register(metric):
+    """Add a metric to the exported metrics, a metric with the same name is replaced."""
+    _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, help, labels=()):
+    return register(Counter(name, help, labels))
+
+
+def gauge(name, help, labels=(), func=None):
+    return register(Gauge(name, help, labels, func))
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return register(Histogram(name, help, labels, buckets))
+
+
+def render():
+    """Return all metrics in the Prometheus text format."""
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+def start_server(address="127.0.0.1", port=9108):
+    """Serve the metrics on http://address:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("metrics available on http://%s:%i/metrics" % (address, port))
+    return server
@@ -0,0 +1,56 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# increase when the layout of a cached model changes, so old files are not used
+MODEL_CACHE_VERSION = 1
+MODEL_SUFFIX = ".model.json"
+
+
+def model_file(cache_dir, tupl):
+    return os.path.join(cache_dir, tupl.replace(":", "_") + MODEL_SUFFIX)
+
+
+def load_model(cache_dir, tupl):
+    """Return the cached entry of an IED (host:port), or None if there is no valid one.
+
+    An entry is a dict with:
+      lds:       the names of the logical devices of the IED
+      revisions: {LD: configRev} as read from LLN0.NamPlt.configRev when the model was discovered
+      discovery: the discovery mode the model was made with
+      model:     the discovered model
+    """
+    path = model_file(cache_dir, tupl)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("could not load model cache %s: %s" % (path, e))
+        return None
+    if entry.get('version') != MODEL_CACHE_VERSION or entry.get('ied') != tupl:
+        return None
+    return entry
+
+
+def save_model(cache_dir, tupl, lds, revisions, discovery, model):
+    path = model_file(cache_dir, tupl)
+    entry = {
+        'version': MODEL_CACHE_VERSION,
+        'ied': tupl,
+        'lds': lds,
+        'revisions': revisions,
+        'discovery': discovery,
+        'model': model,
+    }
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path)
+        logger.info("model of %s written to %s" % (tupl, path))
+    except (OSError, TypeError, ValueError) as e:
+        logger.error("could not write model cache %s: %s" % (path, e))
@@ -0,0 +1,75 @@
+import heapq
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# minimal time between two overrun warnings, to not flood the log when a cycle is too slow
+OVERRUN_LOG_INTERVAL = 10.0
+
+
+class PollScheduler:
+    """Schedules poll groups on deadlines of the monotonic clock.
+
+    Datapoints are grouped by their poll interval, each group has its own deadline
+    in a heap. A group is due when its deadline has passed, the next deadline is
+    derived from the previous one (not from the time the poll finished), so the
+    interval does not drift with the duration of the poll. When a poll took so
+    long that deadlines were missed, these are skipped and counted as overruns.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.groups = {}  # interval -> refs, as dict keys in order of adding
+        self.heap = []  # (deadline, interval)
+        self.overruns = 0
+        self.cycles = 0
+        self._overruns_logged = 0
+        self._last_overrun_log = 0.0
+
+    def add(self, ref, interval):
+        """Add a reference to the poll group of the interval (in seconds)."""
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError("poll interval should be larger than 0, not %f" % interval)
+        if interval not in self.groups:
+            self.groups[interval] = {}
+            heapq.heappush(self.heap, (self.clock(), interval))
+        self.groups[interval][ref] = None
+
+    def next_deadline(self):
+        """Return the earliest deadline, or None if nothing is scheduled."""
+        if len(self.heap) == 0:
+            return None
+        return self.heap[0][0]
+
+    def due(self):
+        """Return the list of (interval, refs) of all groups that are due, and schedule their next deadline."""
+        now = self.clock()
+        result = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            deadline, interval = heapq.heappop(self.heap)
+            self.cycles += 1
+
+            next_deadline = deadline + interval
+            if next_deadline <= now:
+                missed = int((now - deadline) // interval)
+                self.overruns += missed
+                next_deadline = deadline + (missed + 1) * interval
+            heapq.heappush(self.heap, (next_deadline, interval))
+
+            if len(self.groups[interval]) > 0:
+                result.append((interval, list(self.groups[interval])))
+
+        self.log_overruns(now)
+        return result
+
+    def log_overruns(self, now):
+        if self.overruns == self._overruns_logged:
+            return
+        if now - self._last_overrun_log < OVERRUN_LOG_INTERVAL:
+            return
+        logger.warning("poll cycle overrun: %i deadlines missed since last report (%i in total)"
+                       % (self.overruns - self._overruns_logged, self.overruns))
+        self._overruns_logged = self.overruns
+        self._last_overrun_log = now
@@ -0,0 +1,239 @@
+import copy
+import logging
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# MMS type names as returned by MmsValue_getTypeString, for the basic types of SCL
+MMS_TYPES = {
+    "BOOLEAN": "boolean",
+    "INT8": "integer",
+    "INT16": "integer",
+    "INT24": "integer",
+    "INT32": "integer",
+    "INT64": "integer",
+    "INT128": "integer",
+    "INT8U": "unsigned",
+    "INT16U": "unsigned",
+    "INT24U": "unsigned",
+    "INT32U": "unsigned",
+    "FLOAT32": "float",
+    "FLOAT64": "float",
+    "Enum": "integer",
+    "Dbpos": "bit-string",
+    "Tcmd": "bit-string",
+    "Quality": "bit-string",
+    "Check": "bit-string",
+    "Timestamp": "utc-time",
+    "EntryTime": "binary-time",
+    "VisString32": "visible-string",
+    "VisString64": "visible-string",
+    "VisString65": "visible-string",
+    "VisString129": "visible-string",
+    "VisString255": "visible-string",
+    "Unicode255": "mms-string",
+    "Octet64": "octet-string",
+    "ObjRef": "visible-string",
+    "EntryID": "octet-string",
+}
+
+# attributes of a report control block instance, as discovered online
+URCB_ATTRIBUTES = ("RptID", "RptEna", "Resv", "DatSet", "ConfRev", "OptFlds", "BufTm", "SqNum", "TrgOps", "IntgPd", "GI", "Owner")
+BRCB_ATTRIBUTES = ("RptID", "RptEna", "DatSet", "ConfRev", "OptFlds", "BufTm", "SqNum", "TrgOps", "IntgPd", "GI", "PurgeBuf", "EntryID", "TimeOfEntry", "ResvTms", "Owner")
+
+class SclError(ValueError):
+    """The SCL file is well-formed XML, but not a model that can be loaded (e.g. a missing attribute)."""
+
+
+# parsed models by (file, ied name), so a file used for multiple IED's or reconnects is parsed once
+_models = {}
+
+
+def local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def children(element, name):
+    return [child for child in element if local(child.tag) == name]
+
+
+def child(element, name):
+    for c in element:
+        if local(c.tag) == name:
+            return c
+    return None
+
+
+class TypeTemplates:
+    """The LNodeType, DOType and DAType definitions of the DataTypeTemplates section."""
+
+    def __init__(self, root):
+        self.lnodetypes = {}
+        self.dotypes = {}
+        self.datypes = {}
+        templates = child(root, "DataTypeTemplates")
+        if templates is None:
+            return
+        for element in templates:
+            name = local(element.tag)
+            if name == "LNodeType":
+                self.lnodetypes[element.get("id")] = element
+            elif name == "DOType":
+                self.dotypes[element.get("id")] = element
+            elif name == "DAType":
+                self.datypes[element.get("id")] = element
+
+    def build_ln(self, type_id):
+        tmodel = {}
+        lnodetype = self.lnodetypes.get(type_id)
+        if lnodetype is None:
+            logger.error("LNodeType %s not found" % type_id)
+            return tmodel
+        for do in children(lnodetype, "DO"):
+            tmodel[do.get("name")] = self.build_do(do.get("type"))
+        return tmodel
+
+    def build_do(self, type_id):
+        tmodel = {}
+        dotype = self.dotypes.get(type_id)
+        if dotype is None:
+            logger.error("DOType %s not found" % type_id)
+            return tmodel
+        for element in dotype:
+            name = local(element.tag)
+            if name == "SDO":
+                tmodel[element.get("name")] = self.build_do(element.get("type"))
+            elif name == "DA":
+                tmodel[element.get("name")] = self.build_da(element, element.get("fc"))
+        return tmodel
+
+    def build_da(self, element, fc):
+        if element.get("bType") == "Struct":
+            tmodel = {}
+            datype = self.datypes.get(element.get("type"))
+            if datype is None:
+                logger.error("DAType %s not found" % element.get("type"))
+                return tmodel
+            for bda in children(datype, "BDA"):
+                tmodel[bda.get("name")] = self.build_da(bda, fc)
+            return tmodel
+
+        leaf = {'reftype': "DA", 'FC': fc, 'value': "UNKNOWN", 'type': MMS_TYPES.get(element.get("bType"), "")}
+        value = child(element, "Val")
+        if value is not None and value.text is not None and element.get("bType") != "Enum":
+            leaf['value'] = value.text.strip()
+        return leaf
+
+
+def ln_name(element):
+    return (element.get("prefix") or "") + element.get("lnClass") + (element.get("inst") or "")
+
+
+# set the values of the DAI's of a LN (or DOI/SDI) in the model
+def apply_instances(element, tmodel):
+    for instance in element:
+        name = local(instance.tag)
+        if name in ("DOI", "SDI"):
+            if instance.get("name") in tmodel:
+                apply_instances(instance, tmodel[instance.get("name")])
+        elif name == "DAI":
+            leaf = tmodel.get(instance.get("name"))
+            value = child(instance, "Val")
+            if leaf is not None and 'reftype' in leaf and value is not None and value.text is not None:
+                if leaf['type'] != "integer" or value.text.strip().lstrip("-").isdigit():
+                    leaf['value'] = value.text.strip()
+
+
+def build_datasets(element, tmodel, ied_name):
+    for dataset in children(element, "DataSet"):
+        members = {}
+        for i, fcda in enumerate(children(dataset, "FCDA")):
+            ref = "%s%s/%s%s%s.%s" % (ied_name, fcda.get("ldInst"), fcda.get("prefix") or "", fcda.get("lnClass"),
+                                      fcda.get("lnInst") or "", fcda.get("doName"))
+            if fcda.get("daName"):
+                ref += "." + fcda.get("daName")
+            members[str(i)] = {'reftype': "DX", 'type': "reference", 'value': ref, 'FC': fcda.get("fc")}
+        tmodel[dataset.get("name")] = members
+
+
+def build_rcbs(element, tmodel, LD, LN):
+    for rcb in children(element, "ReportControl"):
+        buffered = rcb.get("buffered", "false") == "true"
+        fc = "BR" if buffered else "RP"
+        enabled = child(rcb, "RptEnabled")
+        count = int(enabled.get("max", "1")) if enabled is not None else 1
+        if rcb.get("indexed", "true") == "true" and count > 1:
+            names = ["%s%02i" % (rcb.get("name"), i) for i in range(1, count + 1)]
+        else:
+            names = [rcb.get("name")]
+
+        for name in names:
+            attributes = {}
+            for attribute in (BRCB_ATTRIBUTES if buffered else URCB_ATTRIBUTES):
+                attributes[attribute] = {'reftype': "DA", 'FC': fc, 'value': "UNKNOWN"}
+            attributes["RptID"]['value'] = rcb.get("rptID") or "%s/%s$%s$%s" % (LD, LN, fc, name)
+            attributes["RptID"]['type'] = "visible-string"
+            attributes["DatSet"]['value'] = "%s/%s$%s" % (LD, LN, rcb.get("datSet")) if rcb.get("datSet") else ""
+            attributes["DatSet"]['type'] = "visible-string"
+            attributes["ConfRev"]['value'] = rcb.get("confRev", "0")
+            attributes["ConfRev"]['type'] = "unsigned"
+            attributes["IntgPd"]['value'] = rcb.get("intgPd", "0")
+            attributes["IntgPd"]['type'] = "unsigned"
+            attributes["BufTm"]['value'] = rcb.get("bufTime", "0")
+            attributes["BufTm"]['type'] = "unsigned"
+            tmodel[name] = attributes
+
+
+def load_scl(filename, ied_name=None):
+    """Build the model of an IED from an SCL file (SCD, CID or ICD), as the model of an online discovery.
+
+    If ied_name is None, the first IED in the file is used. Values are taken from the
+    Val elements in the types and instances, other values are "UNKNOWN". Raises
+    ET.ParseError when the file is not XML, and SclError when it is not a valid model.
+    """
+    key = (filename, ied_name)
+    if key in _models:
+        return copy.deepcopy(_models[key])
+
+    root = ET.parse(filename).getroot()
+    ieds = children(root, "IED")
+    ied = None
+    for element in ieds:
+        if ied_name is None or element.get("name") == ied_name:
+            ied = element
+            break
+    if ied is None:
+        logger.error("IED %s not found in %s" % (ied_name, filename))
+        return {}
+
+    try:
+        tmodel = build_ied(root, ied)
+    except (TypeError, AttributeError, KeyError, ValueError) as e:
+        raise SclError("invalid model of IED %s in %s: %s" % (ied.get("name"), filename, e))
+
+    logger.info("model of IED %s loaded from %s with %i logical devices" % (ied.get("name"), filename, len(tmodel)))
+    _models[key] = tmodel
+    return copy.deepcopy(tmodel)
+
+
+# the model of the LD's of an IED element, with the types of the DataTypeTemplates of the root
+def build_ied(root, ied):
+    templates = TypeTemplates(root)
+    name = ied.get("name")
+    tmodel = {}
+    for access_point in children(ied, "AccessPoint"):
+        server = child(access_point, "Server")
+        if server is None:
+            continue
+        for ldevice in children(server, "LDevice"):
+            LD = name + ldevice.get("inst")
+            tmodel[LD] = {}
+            for ln in ldevice:
+                if local(ln.tag) not in ("LN0", "LN"):
+                    continue
+                LN = ln_name(ln)
+                tmodel[LD][LN] = templates.build_ln(ln.get("lnType"))
+                apply_instances(ln, tmodel[LD][LN])
+                build_datasets(ln, tmodel[LD][LN], name)
+                build_rcbs(ln, tmodel[LD][LN], LD, LN)
+    return tmodel
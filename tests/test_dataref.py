@@ -0,0 +1,80 @@
+import logging
+import pickle
+
+from dataref import DataRef, parse_ref, register_ref, restore_ref, DEFAULT_PORTS
+
+
+def test_parse():
+    ref = DataRef(" iec61850://127.0.0.1:1102/IED1_XCBRGenericIO/XCBR1.Pos.stVal ")
+    assert ref == "iec61850://127.0.0.1:1102/IED1_XCBRGenericIO/XCBR1.Pos.stVal"
+    assert ref.scheme == "iec61850"
+    assert ref.host == "127.0.0.1"
+    assert ref.port == 1102
+    assert ref.key == "127.0.0.1:1102"
+    assert ref.path == "IED1_XCBRGenericIO/XCBR1.Pos.stVal"
+    assert ref.parts == ("IED1_XCBRGenericIO", "XCBR1.Pos.stVal")
+    assert ref.normalized == "iec61850://127.0.0.1:1102/IED1_XCBRGenericIO/XCBR1.Pos.stVal"
+
+
+def test_default_ports():
+    ref = DataRef("iec61850://10.0.0.1/LD/LLN0.Mod.stVal")
+    assert ref.port == DEFAULT_PORTS["iec61850"] == 102
+    assert ref.key == "10.0.0.1:102"
+    # the configured uri is kept, the normalized one has the port
+    assert ref == "iec61850://10.0.0.1/LD/LLN0.Mod.stVal"
+    assert ref.normalized == "iec61850://10.0.0.1:102/LD/LLN0.Mod.stVal"
+    assert DataRef("modbus://10.0.0.2/1/hr/3").key == "10.0.0.2:502"
+
+
+def test_unknown_scheme_and_invalid_port(caplog):
+    ref = DataRef("other://10.0.0.1/x")
+    assert ref.port is None
+    assert ref.key is None
+    assert ref.normalized == "other://10.0.0.1/x"
+    with caplog.at_level(logging.ERROR, logger='dataref'):
+        ref = DataRef("iec61850://10.0.0.1:port/LD/LLN0.Mod.stVal")
+    assert ref.port == 102
+    assert "invalid port" in caplog.text
+
+
+def test_no_path():
+    ref = DataRef("iec61850://10.0.0.1")
+    assert ref.path == ""
+    assert ref.parts == ()
+
+
+def test_str_key():
+    uri = "iec61850://10.0.0.1/LD/LLN0.Mod.stVal"
+    ref = DataRef(uri)
+    assert ref == uri and uri == ref
+    assert hash(ref) == hash(uri)
+    values = {ref: 1}
+    assert values[uri] == 1
+    assert uri in values
+    values = {uri: 2}
+    assert values[ref] == 2
+    # equal by uri, not by the normalized reference
+    assert ref != ref.normalized
+
+
+def test_parse_ref_cache():
+    uri = "iec61850://10.0.0.3/LD/GGIO1.Ind1.stVal"
+    ref = parse_ref(uri)
+    assert isinstance(ref, DataRef)
+    assert parse_ref(uri) is ref
+    assert parse_ref(ref) is ref
+    assert parse_ref(str(DataRef(uri))) is ref
+
+
+def test_restore_and_pickle():
+    ref = DataRef("iec61850://10.0.0.4/LD/GGIO1.Ind2.stVal")
+    restored = restore_ref(str(ref), dict(ref.__dict__))
+    assert restored == ref
+    assert restored.__dict__ == ref.__dict__
+    unpickled = pickle.loads(pickle.dumps(ref))
+    assert isinstance(unpickled, DataRef)
+    assert unpickled.__dict__ == ref.__dict__
+    assert register_ref(restored) is restored
+    assert parse_ref(str(ref)) is restored
+    # an uri that is already known keeps the first DataRef
+    assert register_ref(unpickled) is restored
@@ -0,0 +1,78 @@
+import pytest
+
+from deadband import (DeadbandTable, parse_deadband, DEADBAND_NONE, DEADBAND_ABSOLUTE,
+                      DEADBAND_PERCENT, DEADBAND_INTEGRATED)
+
+
+def send(table, ioa, value, now):
+    return bool(table.filter([ioa], [value], now)[0])
+
+
+def test_parse_deadband():
+    assert parse_deadband("abs:0.5") == (DEADBAND_ABSOLUTE, 0.5)
+    assert parse_deadband(" pct:2 ") == (DEADBAND_PERCENT, 2.0)
+    assert parse_deadband("int:10") == (DEADBAND_INTEGRATED, 10.0)
+    assert parse_deadband("none") == (DEADBAND_NONE, 0.0)
+    with pytest.raises(ValueError):
+        parse_deadband("rel:3")
+
+
+def test_none_sends_every_change():
+    table = DeadbandTable()
+    table.add(1)
+    assert send(table, 1, 10, 0.0)
+    assert not send(table, 1, 10, 1.0)
+    assert send(table, 1, 10.01, 2.0)
+
+
+def test_absolute():
+    table = DeadbandTable()
+    table.add(1, DEADBAND_ABSOLUTE, 5)
+    assert send(table, 1, 100, 0.0)  # first value
+    assert not send(table, 1, 104, 1.0)
+    assert not send(table, 1, 96, 2.0)
+    assert send(table, 1, 106, 3.0)
+    # compared to the last transmitted value, not the last received
+    assert not send(table, 1, 110, 4.0)
+    assert send(table, 1, 111.5, 5.0)
+
+
+def test_percent():
+    table = DeadbandTable()
+    table.add(1, DEADBAND_PERCENT, 2)
+    assert send(table, 1, 200, 0.0)
+    assert not send(table, 1, 203, 1.0)
+    assert send(table, 1, 205, 2.0)
+    assert not send(table, 1, 201, 3.0)  # 2% of 205 is 4.1
+    assert send(table, 1, 200.8, 4.0)
+
+
+def test_integrated_quiet_period():
+    table = DeadbandTable()
+    table.add(1, DEADBAND_INTEGRATED, 50)
+    assert send(table, 1, 100, 0.0)
+    # the value was at the transmitted value during the quiet period
+    assert not send(table, 1, 100.1, 3600.0)
+
+
+def test_integrated_deviation_over_time():
+    table = DeadbandTable()
+    table.add(1, DEADBAND_INTEGRATED, 50)
+    assert send(table, 1, 100, 0.0)
+    assert not send(table, 1, 110, 1.0)
+    assert not send(table, 1, 110, 5.0)   # 10 for 4 s
+    assert send(table, 1, 110, 6.1)       # 10 for 5.1 s
+    # the integral restarts from the transmitted value
+    assert not send(table, 1, 110, 100.0)
+    assert not send(table, 1, 90, 101.0)
+    assert send(table, 1, 90, 103.6)      # 20 for 2.6 s
+
+
+def test_batch_of_modes():
+    table = DeadbandTable(size=2)
+    table.add(1, DEADBAND_ABSOLUTE, 1)
+    table.add(2, DEADBAND_PERCENT, 10)
+    table.add(3, DEADBAND_INTEGRATED, 1)
+    assert table.filter([1, 2, 3], [0, 100, 0], 0.0).tolist() == [True, True, True]
+    assert table.filter([1, 2, 3], [2, 105, 5], 1.0).tolist() == [True, False, False]
+    assert table.filter([3, 2], [5, 111], 2.0).tolist() == [True, True]
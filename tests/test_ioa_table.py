@@ -0,0 +1,115 @@
+import threading
+
+from ioa_table import IOATable
+
+
+def test_add_and_lookup():
+    table = IOATable()
+    assert table.add(300, 1, 5) == 0
+    assert table.add(100, 2, 7, event=True) == 0
+    assert len(table) == 2
+    assert 100 in table
+    assert 200 not in table
+    assert table.slot(200) is None
+    slot = table.slot(100)
+    assert table.ioa[slot] == 100
+    assert table.value[slot] == 7
+    assert table.has_event(slot)
+    assert not table.has_event(table.slot(300))
+
+
+def test_add_existing_ioa():
+    table = IOATable()
+    assert table.add(1, 1, 5) == 0
+    assert table.add(1, 2, 6) == -1
+    assert len(table) == 1
+    assert table.value[table.slot(1)] == 5
+
+
+def test_slots_of_type_in_order_of_ioa():
+    table = IOATable()
+    for ioa in (50, 10, 40, 20, 30):
+        table.add(ioa, 2 if ioa % 20 == 0 else 1)
+    assert table.ioa[table.slots_of_type(1)].tolist() == [10, 30, 50]
+    assert table.ioa[table.slots_of_type(2)].tolist() == [20, 40]
+    assert table.slots_of_type(3).tolist() == []
+    # adding after a lookup keeps the order
+    table.add(5, 1)
+    assert table.ioa[table.slots_of_type(1)].tolist() == [5, 10, 30, 50]
+
+
+def test_slots_do_not_move():
+    table = IOATable(size=2)
+    table.add(30, 1, 3, callback='c30')
+    slot = table.slot(30)
+    for ioa in range(29, 0, -1):
+        table.add(ioa, 1, ioa)
+    table.slots_of_type(1)
+    assert table.slot(30) == slot
+    assert table.ioa[slot] == 30
+    assert table.callbacks[slot] == 'c30'
+    assert len(table) == 30
+
+
+def test_grow_keeps_values():
+    table = IOATable(size=2)
+    for ioa in range(10):
+        table.add(ioa, 1, ioa * 10)
+    assert len(table.ioa) >= 10
+    for ioa in range(10):
+        assert table.value[table.slot(ioa)] == ioa * 10
+
+
+def test_set_value():
+    table = IOATable()
+    table.add(1, 1)
+    slot = table.slot(1)
+    table.set_value(slot, 42, quality=3)
+    assert table.value[slot] == 42
+    assert table.quality[slot] == 3
+    assert table.timestamp[slot] > 0
+
+
+def test_record():
+    table = IOATable()
+    table.add(1, 45, 1, callback=len, event=False)
+    assert table.record(table.slot(1)) == {'type': 45, 'data': 1, 'callback': len, 'event': False}
+
+
+def test_lookup_while_adding():
+    table = IOATable(size=4)
+    errors = []
+
+    def lookup():
+        for _ in range(200):
+            for ioa in list(table.index):
+                slot = table.slot(ioa)
+                if table.ioa[slot] != ioa or table.callbacks[slot] != ioa:
+                    errors.append(ioa)
+            table.slots_of_type(1)
+
+    def add_with_callback():
+        for ioa in range(2000, 0, -1):
+            table.add(ioa, 1, ioa, callback=ioa)
+
+    threads = [threading.Thread(target=add_with_callback), threading.Thread(target=lookup)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert table.ioa[table.slots_of_type(1)].tolist() == list(range(1, 2001))
+
+
+def test_add_many():
+    table = IOATable(size=2)
+    table.add(7, 1, 70)
+    existing = table.add_many([3, 7, 1, 3, 9], [1, 1, 2, 1, 45], ['c3', 'c7', 'c1', 'x', None], [True, True, True, True, False])
+    assert existing == [7, 3]
+    assert len(table) == 4
+    assert table.value[table.slot(7)] == 70
+    assert table.callbacks[table.slot(3)] == 'c3'
+    assert table.has_event(table.slot(1))
+    assert not table.has_event(table.slot(9))
+    assert table.type[table.slot(9)] == 45
+    assert table.ioa[table.slots_of_type(1)].tolist() == [3, 7]
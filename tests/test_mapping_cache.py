@@ -0,0 +1,108 @@
+import os
+import pickle
+
+import mapping_cache
+from mapping_cache import load_mapping, cache_file
+
+SECTIONS = {'measuredvaluescaled': 11, 'singlepointcommand': 45}
+
+CONFIG = """[gateway]
+multiprocess = no
+
+[measuredvaluescaled]
+100 = iec61850://10.0.0.5/LD/MMXU1.TotW.mag.f
+101 = iec61850://10.0.0.5:102/LD/MMXU1.Hz.mag.f
+bad = iec61850://10.0.0.5/LD/MMXU1.A.phsA.cVal.mag.f
+
+[singlepointcommand]
+100 = iec61850://10.0.0.6/LD/CSWI1.Pos
+200 = iec61850://10.0.0.6/LD/CSWI1.Pos
+"""
+
+
+def write_config(tmp_path, text=CONFIG):
+    path = tmp_path / "config.ini"
+    path.write_text(text)
+    return str(path)
+
+
+def check_mapping(mapping):
+    assert mapping['settings'] == {'gateway': {'multiprocess': 'no'}}
+    assert [ioa for ioa, ref in mapping['ioas']['measuredvaluescaled']] == [100, 101]
+    assert [ioa for ioa, ref in mapping['ioas']['singlepointcommand']] == [200]
+    assert mapping['types'] == {100: 11, 101: 11, 200: 45}
+    assert dict((ied, [ioa for ioa, ref in items]) for ied, items in mapping['ieds'].items()) == {
+        'iec61850://10.0.0.5:102': [100, 101],
+        'iec61850://10.0.0.6:102': [200],
+    }
+    ioa, ref = mapping['ioas']['measuredvaluescaled'][0]
+    assert ref == "iec61850://10.0.0.5/LD/MMXU1.TotW.mag.f"
+    assert ref.key == "10.0.0.5:102"
+    assert ref.port == 102
+    assert ref.parts == ("LD", "MMXU1.TotW.mag.f")
+    assert ref.normalized == "iec61850://10.0.0.5:102/LD/MMXU1.TotW.mag.f"
+
+
+def test_compile_and_load(tmp_path):
+    filename = write_config(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    check_mapping(load_mapping(filename, SECTIONS, cache_dir))
+    assert len(os.listdir(cache_dir)) == 1
+
+    # the second load uses the artifact
+    compiled = []
+    original = mapping_cache.compile_config
+    mapping_cache.compile_config = lambda *args: compiled.append(args) or original(*args)
+    try:
+        check_mapping(load_mapping(filename, SECTIONS, cache_dir))
+    finally:
+        mapping_cache.compile_config = original
+    assert compiled == []
+
+
+def test_changed_config_is_compiled_again(tmp_path):
+    filename = write_config(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    load_mapping(filename, SECTIONS, cache_dir)
+    write_config(tmp_path, CONFIG.replace("101 =", "102 ="))
+    mapping = load_mapping(filename, SECTIONS, cache_dir)
+    assert [ioa for ioa, ref in mapping['ioas']['measuredvaluescaled']] == [100, 102]
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_default_ports_are_part_of_the_key(tmp_path, monkeypatch):
+    filename = write_config(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    load_mapping(filename, SECTIONS, cache_dir)
+    monkeypatch.setitem(mapping_cache.DEFAULT_PORTS, "iec61850", 103)
+    mapping = load_mapping(filename, SECTIONS, cache_dir)
+    assert sorted(mapping['ieds']) == ['iec61850://10.0.0.5:102', 'iec61850://10.0.0.5:103', 'iec61850://10.0.0.6:103']
+
+
+class Exploit:
+    def __reduce__(self):
+        return (os.system, ("touch exploited",))
+
+
+def test_artifact_is_not_unpickled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    filename = write_config(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    mapping = load_mapping(filename, SECTIONS, cache_dir)
+    path = cache_file(filename, cache_dir, mapping['hash'])
+    with open(path, "wb") as f:
+        f.write(pickle.dumps(Exploit()))
+    check_mapping(load_mapping(filename, SECTIONS, cache_dir))
+    assert not os.path.exists(tmp_path / "exploited")
+
+
+def test_invalid_artifact_is_compiled_again(tmp_path):
+    filename = write_config(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    mapping = load_mapping(filename, SECTIONS, cache_dir)
+    path = cache_file(filename, cache_dir, mapping['hash'])
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data.replace(b'"port":102', b'"port":"102"', 1))
+    check_mapping(load_mapping(filename, SECTIONS, cache_dir))
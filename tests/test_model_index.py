@@ -0,0 +1,41 @@
+import pytest
+
+libiec61850client = pytest.importorskip("libiec61850client", exc_type=ImportError)  # needs the libiec61850 library
+from compact_model import DataAttribute
+
+iec61850client = libiec61850client.iec61850client
+
+
+def model():
+    return {'LD': {
+        'LLN0': {'Mod': {'stVal': DataAttribute('ST')}},
+        'MMXU1': {
+            'TotW': {'mag': {'f': DataAttribute('MX')}},
+            'TotWh': {'q': DataAttribute('MX')},
+        },
+    }}
+
+
+def test_ref_index():
+    _model = model()
+    index = iec61850client.refIndex(_model)
+    assert sorted(index) == ['LD', 'LD/LLN0', 'LD/LLN0.Mod', 'LD/LLN0.Mod.stVal', 'LD/MMXU1',
+                             'LD/MMXU1.TotW', 'LD/MMXU1.TotW.mag', 'LD/MMXU1.TotW.mag.f',
+                             'LD/MMXU1.TotWh', 'LD/MMXU1.TotWh.q']
+    assert index['LD/MMXU1.TotW.mag.f'] is _model['LD']['MMXU1']['TotW']['mag']['f']
+    assert sorted(iec61850client.refIndex(_model['LD']['MMXU1']['TotW'], 'LD/MMXU1.TotW')) == [
+        'LD/MMXU1.TotW.mag', 'LD/MMXU1.TotW.mag.f']
+
+
+def test_replaced_subtree_is_indexed(monkeypatch):
+    _model = model()
+    index = iec61850client.refIndex(_model)
+    subtree = {'mag': {'i': DataAttribute('MX')}}
+    monkeypatch.setattr(iec61850client, "printDataDirectory", staticmethod(lambda con, ref: subtree))
+    _model, err = iec61850client.updateValueInModel(None, _model, 'LD/MMXU1.TotW', index)
+    assert err == 0
+    assert index['LD/MMXU1.TotW'] is subtree
+    assert index['LD/MMXU1.TotW.mag.i'] is subtree['mag']['i']
+    assert 'LD/MMXU1.TotW.mag.f' not in index
+    # a sibling with the same prefix is kept
+    assert 'LD/MMXU1.TotWh.q' in index
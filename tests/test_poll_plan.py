@@ -0,0 +1,80 @@
+import pytest
+
+libiec61850client = pytest.importorskip("libiec61850client", exc_type=ImportError)  # needs the libiec61850 library
+from compact_model import DataAttribute
+from dataref import parse_ref
+
+iec61850client = libiec61850client.iec61850client
+
+TUPL = ('10.0.0.1', 102)
+
+
+def client():
+    _client = iec61850client.__new__(iec61850client)
+    _client.connections = {TUPL: {'model': {'LD': {
+        'LLN0': {'Mod': {'stVal': DataAttribute('ST'), 'ctlModel': DataAttribute('CF')}},
+        'MMXU1': {
+            'AvAPhs': {'mag': {'f': DataAttribute('MX')}, 'q': DataAttribute('MX')},
+            'AvPhVPhs': {'mag': {'f': DataAttribute('MX')}, 'q': DataAttribute('MX')},
+            'TotW': {'mag': {'f': DataAttribute('MX')}, 'q': DataAttribute('MX')},
+            'Mod': {'stVal': DataAttribute('ST')},
+        },
+    }}}}
+    return _client
+
+
+def keys(*paths):
+    return [parse_ref("iec61850://10.0.0.1:102/" + path) for path in paths]
+
+
+def summary(plan):
+    return sorted((ref, fc, sorted(key.path for key in group)) for ref, node, fc, group in plan)
+
+
+def test_do_grouping():
+    _keys = keys("LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvAPhs.q", "LD/LLN0.Mod.stVal")
+    plan, single = client().pollPlan(TUPL, _keys)
+    assert single == []
+    assert summary(plan) == [
+        ("LD/LLN0.Mod.stVal", "ST", ["LD/LLN0.Mod.stVal"]),
+        ("LD/MMXU1.AvAPhs", "MX", ["LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvAPhs.q"]),
+    ]
+
+
+def test_ln_grouping():
+    _client = client()
+    _keys = keys("LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvPhVPhs.mag.f", "LD/MMXU1.AvPhVPhs.q", "LD/MMXU1.Mod.stVal")
+    plan, single = _client.pollPlan(TUPL, _keys)
+    assert summary(plan) == [
+        ("LD/MMXU1", "MX", ["LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvPhVPhs.mag.f", "LD/MMXU1.AvPhVPhs.q"]),
+        ("LD/MMXU1.Mod.stVal", "ST", ["LD/MMXU1.Mod.stVal"]),
+    ]
+    ln = [node for ref, node, fc, group in plan if ref == "LD/MMXU1"][0]
+    assert ln is _client.connections[TUPL]['model']['LD']['MMXU1']
+    # a dataset member is not a LN
+    plan, single = _client.pollPlan(TUPL, _keys, False)
+    assert summary(plan) == [
+        ("LD/MMXU1.AvAPhs.mag.f", "MX", ["LD/MMXU1.AvAPhs.mag.f"]),
+        ("LD/MMXU1.AvPhVPhs", "MX", ["LD/MMXU1.AvPhVPhs.mag.f", "LD/MMXU1.AvPhVPhs.q"]),
+        ("LD/MMXU1.Mod.stVal", "ST", ["LD/MMXU1.Mod.stVal"]),
+    ]
+
+
+def test_ln_grouping_ratio(monkeypatch):
+    monkeypatch.setattr(libiec61850client, "LN_GROUP_RATIO", 1.0)
+    _keys = keys("LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvPhVPhs.mag.f")
+    plan, single = client().pollPlan(TUPL, _keys)
+    # 2 of the 3 DO's with MX
+    assert [ref for ref, node, fc, group in plan] == ["LD/MMXU1.AvAPhs.mag.f", "LD/MMXU1.AvPhVPhs.mag.f"]
+
+
+def test_not_in_model():
+    _keys = keys("LD/MMXU1.Hz.mag.f", "LD/MMXU1", "LD/MMXU1.TotW.q")
+    plan, single = client().pollPlan(TUPL, _keys)
+    assert [key.path for key in single] == ["LD/MMXU1.Hz.mag.f", "LD/MMXU1"]
+    assert summary(plan) == [("LD/MMXU1.TotW.q", "MX", ["LD/MMXU1.TotW.q"])]
+
+
+def test_mms_item():
+    assert iec61850client.mmsItem("LD/MMXU1.AvAPhs.mag.f", "MX") == ("LD", "MMXU1$MX$AvAPhs$mag$f")
+    assert iec61850client.mmsItem("LD/MMXU1", "MX") == ("LD", "MMXU1$MX")
@@ -0,0 +1,95 @@
+import configparser
+import logging
+
+import pytest
+
+from poll_scheduler import PollScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_groups_by_interval():
+    clock = Clock()
+    scheduler = PollScheduler(clock)
+    scheduler.add('a', 1)
+    scheduler.add('b', 2.0)
+    scheduler.add('c', 1.0)
+    scheduler.add('a', 1)
+    assert scheduler.next_deadline() == 100.0
+    assert sorted(scheduler.due()) == [(1.0, ['a', 'c']), (2.0, ['b'])]
+    assert scheduler.due() == []
+
+
+def test_next_deadline():
+    clock = Clock()
+    scheduler = PollScheduler(clock)
+    assert scheduler.next_deadline() is None
+    scheduler.add('a', 1)
+    scheduler.add('b', 5)
+    scheduler.due()
+    assert scheduler.next_deadline() == 101.0
+    # the poll took some time, the deadline does not drift
+    clock.now = 101.3
+    assert scheduler.due() == [(1.0, ['a'])]
+    assert scheduler.next_deadline() == 102.0
+    clock.now = 102.0
+    assert scheduler.due() == [(1.0, ['a'])]
+    clock.now = 103.0
+    assert scheduler.due() == [(1.0, ['a'])]
+    clock.now = 104.0
+    scheduler.due()
+    clock.now = 105.0
+    assert sorted(scheduler.due()) == [(1.0, ['a']), (5.0, ['b'])]
+    assert scheduler.next_deadline() == 106.0
+    assert scheduler.overruns == 0
+
+
+def test_overrun(caplog):
+    clock = Clock()
+    scheduler = PollScheduler(clock)
+    scheduler.add('a', 1)
+    scheduler.due()
+    # deadlines 101, 102 and 103 missed, 101 is polled late
+    clock.now = 103.5
+    with caplog.at_level(logging.WARNING, logger='poll_scheduler'):
+        assert scheduler.due() == [(1.0, ['a'])]
+    assert scheduler.overruns == 2
+    assert scheduler.cycles == 2
+    assert scheduler.next_deadline() == 104.0
+    assert "2 deadlines missed" in caplog.text
+    # the next report waits for the log interval
+    caplog.clear()
+    clock.now = 106.5
+    scheduler.due()
+    assert scheduler.overruns == 4
+    assert caplog.text == ""
+
+
+def test_invalid_interval():
+    scheduler = PollScheduler(Clock())
+    for interval in (0, -1, "x"):
+        with pytest.raises(ValueError):
+            scheduler.add('a', interval)
+    assert scheduler.groups == {}
+    assert scheduler.next_deadline() is None
+
+
+def test_invalid_interval_fallback(caplog, monkeypatch):
+    app = pytest.importorskip("app", exc_type=ImportError)  # needs the libiec61850 library
+    monkeypatch.setattr(app, "logger", logging.getLogger('gateway'), raising=False)  # set in main
+    config = configparser.ConfigParser()
+    config.read_string("[pollinterval]\n100 = 0\n101 = x\n102 = 2.5\n")
+    scheduler = PollScheduler(Clock())
+    with caplog.at_level(logging.ERROR):
+        app.schedule_datapoint(scheduler, config, 'a', 'measuredvaluefloat', '100')
+        app.schedule_datapoint(scheduler, config, 'b', 'measuredvaluefloat', '101')
+        app.schedule_datapoint(scheduler, config, 'c', 'measuredvaluefloat', '102')
+    assert scheduler.groups == {float(app.INTERVAL): {'a': None, 'b': None}, 2.5: {'c': None}}
+    assert "invalid poll interval for IOA 100" in caplog.text
+    assert "invalid poll interval for IOA 101" in caplog.text
@@ -0,0 +1,88 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import scl_loader
+from scl_loader import load_scl, SclError
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "simple.icd")
+
+
+def test_tree():
+    model = load_scl(FIXTURE)
+    assert list(model) == ["TESTLD0"]
+    assert sorted(model["TESTLD0"]) == ["GGIO1", "LLN0", "MMXU1"]
+    assert sorted(model["TESTLD0"]["LLN0"]) == ["Events", "Mod", "urcb01", "urcb02"]
+    assert sorted(model["TESTLD0"]["MMXU1"]["TotW"]) == ["db", "mag", "q"]
+    # a struct DA is a subtree of its BDA's
+    assert list(model["TESTLD0"]["MMXU1"]["TotW"]["mag"]) == ["f"]
+
+
+def test_fc_and_types():
+    model = load_scl(FIXTURE)
+    mod = model["TESTLD0"]["LLN0"]["Mod"]
+    assert mod["stVal"] == {'reftype': "DA", 'FC': "ST", 'value': "UNKNOWN", 'type': "integer"}
+    assert (mod["q"]["FC"], mod["q"]["type"]) == ("ST", "bit-string")
+    assert (mod["t"]["FC"], mod["t"]["type"]) == ("ST", "utc-time")
+    # the Val of an Enum is its name, not its value
+    assert (mod["ctlModel"]["FC"], mod["ctlModel"]["value"]) == ("CF", "UNKNOWN")
+
+    totw = model["TESTLD0"]["MMXU1"]["TotW"]
+    assert (totw["mag"]["f"]["FC"], totw["mag"]["f"]["type"]) == ("MX", "float")
+    assert (totw["db"]["FC"], totw["db"]["type"], totw["db"]["value"]) == ("CF", "unsigned", "500")
+
+    ind = model["TESTLD0"]["GGIO1"]["Ind1"]
+    assert (ind["stVal"]["FC"], ind["stVal"]["type"]) == ("ST", "boolean")
+    # the value of a DAI instance
+    assert (ind["d"]["FC"], ind["d"]["type"], ind["d"]["value"]) == ("DC", "visible-string", "Breaker open")
+
+
+def test_datasets_and_rcbs():
+    lln0 = load_scl(FIXTURE)["TESTLD0"]["LLN0"]
+    assert [(member["value"], member["FC"]) for member in lln0["Events"].values()] == [
+        ("TESTLD0/GGIO1.Ind1.stVal", "ST"), ("TESTLD0/MMXU1.TotW", "MX")]
+    assert lln0["urcb01"]["DatSet"]["value"] == "TESTLD0/LLN0$Events"
+    assert lln0["urcb02"]["ConfRev"]["value"] == "3"
+    assert lln0["urcb02"]["IntgPd"]["value"] == "1000"
+    assert lln0["urcb01"]["RptID"]["FC"] == "RP"
+
+
+def test_copies_are_returned():
+    model = load_scl(FIXTURE)
+    model["TESTLD0"].clear()
+    assert "LLN0" in load_scl(FIXTURE)["TESTLD0"]
+
+
+def test_unknown_ied():
+    assert load_scl(FIXTURE, "OTHER") == {}
+
+
+def test_not_xml(tmp_path):
+    path = tmp_path / "broken.icd"
+    path.write_text("<SCL><IED name='TEST'>")
+    with pytest.raises(ET.ParseError):
+        load_scl(str(path))
+
+
+def test_invalid_model(tmp_path):
+    path = tmp_path / "invalid.icd"
+    with open(FIXTURE) as f:
+        path.write_text(f.read().replace('<LN lnClass="MMXU" inst="1"', '<LN inst="1"'))
+    with pytest.raises(SclError):
+        load_scl(str(path))
+    assert (str(path), None) not in scl_loader._models
+
+
+def test_invalid_file_falls_back_to_discovery(tmp_path):
+    libiec61850client = pytest.importorskip("libiec61850client", exc_type=ImportError)  # needs the libiec61850 library
+    client = libiec61850client.iec61850client.__new__(libiec61850client.iec61850client)
+    client.option = lambda tupl, name, fallback=None: fallback
+    client.optionBool = lambda tupl, name, fallback=False: fallback
+    for text in ("<SCL><IED name='TEST'>", open(FIXTURE).read().replace('lnClass="MMXU" ', '')):
+        path = tmp_path / "model.icd"
+        path.write_text(text)
+        scl_loader._models.clear()
+        assert client.sclModel("127.0.0.1:102", str(path)) is None
+    assert client.sclModel("127.0.0.1:102", str(tmp_path / "missing.icd")) is None
+    assert sorted(client.sclModel("127.0.0.1:102", FIXTURE)["TESTLD0"]) == ["GGIO1", "LLN0", "MMXU1"]
@@ -0,0 +1,55 @@
+import logging
+
+from update_queue import UpdateQueue
+
+
+def test_coalescing_keeps_latest_value_and_position():
+    queue = UpdateQueue(maxsize=10)
+    assert queue.put('a', 1)
+    assert queue.put('b', 2)
+    assert queue.put('a', 3)
+    assert queue.get_batch(timeout=0) == [('a', 3), ('b', 2)]
+    assert queue.stats()['coalesced'] == 1
+    assert queue.stats()['enqueued'] == 2
+    assert queue.depth() == 0
+
+
+def test_get_batch_timeout():
+    queue = UpdateQueue()
+    assert queue.get_batch(timeout=0.01) == []
+
+
+def test_overflow_drops_new_keys():
+    queue = UpdateQueue(maxsize=2)
+    assert queue.put('a', 1)
+    assert queue.put('b', 1)
+    assert not queue.put('c', 1)
+    # queued keys are still updated
+    assert queue.put('a', 2)
+    assert queue.dropped == 1
+    assert queue.get_batch(timeout=0) == [('a', 2), ('b', 1)]
+    assert queue.put('c', 1)
+
+
+def test_overflow_keeps_status_points():
+    queue = UpdateQueue(maxsize=1)
+    assert queue.put('a', 1)
+    assert queue.put('b', 1, keep=True)
+    assert not queue.put('c', 1)
+    assert queue.dropped == 1
+    assert [key for key, value in queue.get_batch(timeout=0)] == ['a', 'b']
+
+
+def test_overflow_is_logged_as_warning(caplog):
+    now = [0.0]
+    queue = UpdateQueue(maxsize=1, clock=lambda: now[0])
+    queue.put('a', 1)
+    with caplog.at_level(logging.WARNING, logger='update_queue'):
+        queue.put('b', 1)
+        queue.put('c', 1)  # within the log interval
+        now[0] = 60.0
+        queue.put('d', 1)
+    warnings = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 2
+    assert 'dropped 1 updates' in warnings[0].getMessage()
+    assert 'dropped 2 updates' in warnings[1].getMessage()
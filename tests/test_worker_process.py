@@ -0,0 +1,75 @@
+import os
+import signal
+import time
+
+import worker_process
+from worker_process import WorkerClient
+
+
+class Client:
+    """Client in the worker process, that updates a value with the number of registered datapoints."""
+
+    def __init__(self, readvaluecallback):
+        self.readvaluecallback = readvaluecallback
+        self.registered = []
+
+    def registerReadValue(self, id):
+        self.registered.append(id)
+        return 0
+
+    def ReadValue(self, id):
+        self.readvaluecallback(id, len(self.registered))
+        return 0
+
+    def pid(self):
+        return os.getpid()
+
+
+def init_client(readvaluecallback, logger, cmdTerm_cb, Rpt_cb, settings=None):
+    return Client(readvaluecallback)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_restart_stopped_worker(monkeypatch, caplog):
+    monkeypatch.setattr(worker_process, "RESTART_INTERVAL", 0.0)
+    key = "iec61850://127.0.0.1:102/LD/GGIO1.AnIn1.mag.f"
+    updates = []
+    client = WorkerClient(init_client, [(key, float)], updates.extend, name="test")
+    try:
+        assert client.registerReadValue(key) == 0
+        assert client.ReadValue(key) == 0
+        assert updates == [(key, 1.0)]
+        pid = client.call("pid")
+
+        os.kill(pid, signal.SIGKILL)
+        assert wait_for(lambda: not client.process.is_alive())
+        client.poll([key])
+        assert "worker process worker_test stopped" in caplog.text
+        assert client.restarts == 1
+        assert client.process.is_alive()
+        assert client.call("pid") != pid
+        # the datapoint was registered again in the new worker
+        assert client.ReadValue(key) == 0
+        assert updates[-1] == (key, 1.0)
+    finally:
+        client.stop_worker()
+    assert not client.process.is_alive()
+
+
+def test_restart_interval(monkeypatch):
+    monkeypatch.setattr(worker_process, "RESTART_INTERVAL", 3600.0)
+    client = WorkerClient(init_client, [], lambda batch: None, name="test")
+    try:
+        client.process.kill()
+        assert wait_for(lambda: not client.process.is_alive())
+        client.poll([])
+        assert client.restarts == 0
+        assert client.call("pid") == -1
+    finally:
+        client.stop_worker()
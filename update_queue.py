@@ -0,0 +1,112 @@
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# minimal time between two warnings about dropped updates
+DROP_LOG_INTERVAL = 10.0
+
+
+class UpdateQueue:
+    """Bounded hand-off of downstream value updates to a dispatcher thread.
+
+    Only the latest value per key is kept: an update for a key that is still
+    queued replaces the queued value (coalesced) and keeps its position. When
+    the queue holds maxsize keys, updates for new keys are dropped, unless they
+    are queued with keep=True (e.g. status points, that have no later value to
+    replace a lost change). Dropped updates are logged as warning.
+    """
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.pending = {}  # key -> latest value, in order of first arrival
+        self.cond = threading.Condition()
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._dropped_logged = 0
+        self._last_drop_log = None
+
+    def put(self, key, value, keep=False):
+        """Queue the value for key, returns False if it was dropped because the queue is full.
+
+        With keep=True the value is queued even if the queue is full.
+        """
+        with self.cond:
+            if key in self.pending:
+                self.pending[key] = value
+                self.coalesced += 1
+                return True
+
+            if len(self.pending) >= self.maxsize and not keep:
+                self.dropped += 1
+                self.log_dropped(key)
+                return False
+
+            self.pending[key] = value
+            self.enqueued += 1
+            if len(self.pending) > self.max_depth:
+                self.max_depth = len(self.pending)
+            self.cond.notify()
+            return True
+
+    def get_batch(self, timeout=None):
+        """Wait for updates, and return all queued (key, value) pairs. Returns an empty list on timeout."""
+        with self.cond:
+            if len(self.pending) == 0:
+                self.cond.wait(timeout)
+            batch = self.pending
+            self.pending = {}
+        return list(batch.items())
+
+    def log_dropped(self, key):
+        # called with the lock held
+        now = self.clock()
+        if self._last_drop_log is not None and now - self._last_drop_log < DROP_LOG_INTERVAL:
+            return
+        logger.warning("update queue full (%i keys), dropped %i updates since last report, last for key:%s"
+                       % (self.maxsize, self.dropped - self._dropped_logged, key))
+        self._dropped_logged = self.dropped
+        self._last_drop_log = now
+
+    def depth(self):
+        return len(self.pending)
+
+    def stats(self):
+        return {
+            'depth': len(self.pending),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
+
+
+class UpdateDispatcher(threading.Thread):
+    """Drains an UpdateQueue in batches, and passes each batch to handler(batch)."""
+
+    def __init__(self, queue, handler):
+        threading.Thread.__init__(self, name="update_dispatcher", daemon=True)
+        self.queue = queue
+        self.handler = handler
+        self.stop_event = threading.Event()
+        self.batches = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self.queue.get_batch(timeout=0.5)
+            if len(batch) == 0:
+                continue
+            self.batches += 1
+            try:
+                self.handler(batch)
+            except Exception:
+                logger.exception("exception while dispatching %i updates" % len(batch))
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(timeout=3)
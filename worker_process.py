@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from abstract_client import abstract_client
+from dataref import parse_ref
+
+logger = logging.getLogger(__name__)
+
+# maximum number of notifications handled as one batch by the reader thread
+NOTIFY_BATCH = 1000
+# poll requests that are waiting in the worker before new ones are skipped
+MAX_PENDING_POLLS = 10
+# minimal time in seconds between two restarts of a worker process that stopped
+RESTART_INTERVAL = 5.0
+
+
+class SharedValueTable:
+    """Table of float values in shared memory, one slot per datapoint of a worker process."""
+
+    def __init__(self, size, name=None):
+        nbytes = max(size, 1) * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.values = np.ndarray((max(size, 1),), dtype=np.float64, buffer=self.shm.buf)
+
+    def close(self):
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(init_func, entries, shm_name, notify, conn, log_level, settings):
+    """Main function of a worker process, runs a downstream client.
+
+    Values are converted, written in the shared table and their slot number is put in
+    the notify queue. Calls from the parent are received on conn, and answered in order
+    with the result and the slots of the values that were updated by the call.
+    """
+    logging.basicConfig(format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s', level=log_level)
+    worker_logger = logging.getLogger('gateway')
+
+    table = SharedValueTable(len(entries), shm_name)
+    slots = {}
+    for slot, (key, convert) in enumerate(entries):
+        slots[key] = (slot, convert)
+
+    # the slots updated by the call in progress, in the thread that handles the calls
+    call = threading.local()
+
+    def valuecallback(key, data):
+        entry = slots.get(key)
+        if entry is None:
+            entry = slots.get(parse_ref(key).normalized)
+            if entry is None:
+                worker_logger.debug("could not find slot for key:" + str(key))
+                return
+        slot, convert = entry
+        try:
+            table.values[slot] = float(convert(data))
+        except (TypeError, ValueError):
+            worker_logger.debug("could not convert value %s for key:%s" % (str(data), key))
+            return
+        updated = getattr(call, "updated", None)
+        if updated is not None:
+            updated.append(slot)
+        else:
+            notify.put(slot)
+
+    def cmdterm(msg):
+        notify.put(("cmdterm", msg))
+
+    client = init_func(valuecallback, worker_logger, cmdterm, valuecallback, settings=settings)
+
+    # polls are executed in their own thread, so calls from the parent are not delayed by a slow poll
+    polls = queue.Queue()
+
+    def poll_thread():
+        while True:
+            refs = polls.get()
+            if refs is False:
+                return
+            try:
+                client.poll(None if refs is None else [parse_ref(ref) for ref in refs])
+            except Exception:
+                worker_logger.exception("exception during poll")
+
+    poller = threading.Thread(target=poll_thread, daemon=True)
+    poller.start()
+
+    while True:
+        try:
+            method, args = conn.recv()
+        except EOFError:
+            break
+
+        if method == "stop":
+            break
+        if method == "poll":
+            if polls.qsize() < MAX_PENDING_POLLS:
+                polls.put(args[0])
+            else:
+                worker_logger.warning("worker is behind on polling, poll request skipped")
+            continue
+
+        call.updated = []
+        try:
+            result = getattr(client, method)(*args)
+        except Exception as e:
+            worker_logger.exception("exception in worker call %s" % method)
+            result = -1
+        conn.send((result, call.updated))
+        call.updated = None
+
+    polls.put(False)
+    if hasattr(client, "stop_worker"):
+        client.stop_worker()
+    table.close()
+
+
+class WorkerClient(abstract_client):
+    """Runs a downstream client in a child process, and acts as that client in the gateway process.
+
+    entries is a list of (normalized reference, value conversion) for all datapoints the
+    client can update. The converted values are published in a shared value table, and
+    on_update(batch) is called with a list of (normalized reference, value) from a reader
+    thread. Calls like registerReadValue, ReadValue and operate are forwarded over a pipe,
+    values updated by a call (e.g. by ReadValue) are passed to on_update before it returns.
+    settings are passed to the client in the worker process. A worker process that stopped
+    is started again, and the registered datapoints are registered again in the new worker.
+    """
+
+    def __init__(self, init_func, entries, on_update, cmdTerm_cb = None, name = "client", settings = None):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.init_func = init_func
+        self.entries = entries
+        self.name = name
+        self.settings = settings
+        self.keys = [key for key, convert in entries]
+        self.on_update = on_update
+        self.cmdTerm_cb = cmdTerm_cb
+        self.lock = threading.Lock()
+        self.registered = {}  # (method, id) -> args of the registrations, to repeat them after a restart
+        self.restarts = 0
+        self.last_start = 0.0
+        self.stopped = False
+
+        self.table = SharedValueTable(len(entries))
+        self.start_process()
+
+        self.reader = threading.Thread(target=self.read_notifications, name="reader_" + name, daemon=True)
+        self.reader.start()
+        logger.info("worker process for %s started with %i datapoints" % (name, len(entries)))
+
+    def start_process(self):
+        # a new queue, as a worker that was killed may have left the old one locked
+        self.notify = self.ctx.Queue()
+        self.conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, name="worker_" + self.name, daemon=True,
+            args=(self.init_func, self.entries, self.table.name, self.notify, child_conn, logging.getLogger().level, self.settings))
+        self.process.start()
+        child_conn.close()
+        self.last_start = time.monotonic()
+
+    def check_process(self):
+        """Start the worker process again if it stopped, with the lock held. Returns True if it was restarted."""
+        if self.stopped or self.process.is_alive():
+            return False
+        if time.monotonic() - self.last_start < RESTART_INTERVAL:
+            return False
+        logger.error("worker process %s stopped (exit code %s), starting it again" % (self.process.name, self.process.exitcode))
+        self.conn.close()
+        self.start_process()
+        self.restarts += 1
+        return True
+
+    def ensure_process(self):
+        with self.lock:
+            restarted = self.check_process()
+        if restarted:
+            for (method, id), args in list(self.registered.items()):
+                if self.call(method, *args) != 0:
+                    logger.error("could not register datapoint %s again in worker process %s" % (id, self.process.name))
+
+    def read_notifications(self):
+        while True:
+            # the queue is replaced when the worker process is started again
+            notify = self.notify
+            items = []
+            try:
+                items.append(notify.get(timeout=1.0))
+                while len(items) < NOTIFY_BATCH:
+                    items.append(notify.get_nowait())
+            except queue.Empty:
+                pass
+            except (EOFError, OSError, ValueError):
+                if self.stopped or notify is self.notify:
+                    return
+                continue
+
+            slots = {}
+            for item in items:
+                if isinstance(item, tuple):
+                    if self.cmdTerm_cb is not None:
+                        self.cmdTerm_cb(item[1])
+                else:
+                    slots[item] = True
+
+            # the table holds the latest value, so a slot that was notified multiple times is sent once
+            batch = [(self.keys[slot], float(self.table.values[slot])) for slot in slots]
+            if len(batch) > 0:
+                try:
+                    self.on_update(batch)
+                except Exception:
+                    logger.exception("exception while handling updates from worker")
+
+    def call(self, method, *args):
+        self.ensure_process()
+        with self.lock:
+            if not self.process.is_alive():
+                logger.error("worker process %s is not running" % self.process.name)
+                return -1
+            try:
+                self.conn.send((method, args))
+                result, updated = self.conn.recv()
+            except (EOFError, OSError):
+                logger.error("worker process %s did not answer call %s" % (self.process.name, method))
+                return -1
+
+        # the values are passed on in the calling thread, so a read returns after its value was handled
+        batch = [(self.keys[slot], float(self.table.values[slot])) for slot in dict.fromkeys(updated)]
+        if len(batch) > 0:
+            try:
+                self.on_update(batch)
+            except Exception:
+                logger.exception("exception while handling updates from worker call %s" % method)
+        return result
+
+    def ErrorCodes(self, value):
+        return self.call("ErrorCodes", value)
+
+    def register(self, method, *args):
+        result = self.call(method, *args)
+        if result == 0:
+            self.registered[(method, args[0])] = args
+        return result
+
+    def registerWriteValue(self, id, value):
+        return self.register("registerWriteValue", str(id), value)
+
+    def registerReadValue(self, id):
+        return self.register("registerReadValue", str(id))
+
+    def ReadValue(self, id):
+        return self.call("ReadValue", str(id))
+
+    def operate(self, id, value):
+        return self.call("operate", str(id), value)
+
+    def select(self, id, value):
+        return self.call("select", str(id), value)
+
+    def cancel(self, id):
+        return self.call("cancel", str(id))
+
+    def poll(self, refs = None):
+        # polls are executed by the worker, don't wait for them
+        self.ensure_process()
+        with self.lock:
+            if self.process.is_alive():
+                try:
+                    self.conn.send(("poll", ([str(ref) for ref in refs] if refs is not None else None,)))
+                except OSError:
+                    logger.error("could not send poll request to worker process %s" % self.process.name)
+
+    def stop_worker(self):
+        with self.lock:
+            self.stopped = True
+            if self.process.is_alive():
+                try:
+                    self.conn.send(("stop", ()))
+                except OSError:
+                    pass
+        self.process.join(timeout=5)
+        self.table.close()